@@ -0,0 +1,402 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+流水线读写基准测试
+在本机启动 impacket smbserver（或使用 --target 指定的服务器），经过注入往返时延的TCP代理连接，
+比较逐块 readFile/writeFile 与不同深度的 pipelined_read/pipelined_write 的吞吐量，
+并记录每个请求的 CreditCharge 与 MessageID，检查序列窗口是否按信用数推进
+
+用法:
+    python benchmark_pipeline.py --latency 20 --size 32 --depths 1,2,4,8
+    python benchmark_pipeline.py --force-multi-credit          # 本地服务器不支持多信用时强制走 CreditCharge 分支
+    python benchmark_pipeline.py --target 192.168.1.10 --share data --username user --password pass
+"""
+
+import argparse
+import hashlib
+import io
+import logging
+import os
+import queue
+import shutil
+import socket
+import tempfile
+import threading
+import time
+from impacket import smbserver
+from impacket.ntlm import compute_lmhash, compute_nthash
+from impacket.smb3structs import SMB2_DIALECT_002, SMB2_DIALECT_21
+from impacket.smbconnection import SMBConnection
+
+from smb_pipeline import (
+    _credit_charge,
+    negotiate_chunk_size,
+    pipelined_read,
+    pipelined_write,
+    supports_pipeline,
+)
+
+logger = logging.getLogger(__name__)
+
+BENCHMARK_FILE = "smb_pipeline_benchmark.bin"
+LOCAL_SHARE = "BENCH"
+LOCAL_USER = "bench"
+LOCAL_PASSWORD = "bench"
+
+
+class DelayProxy:
+    """
+    转发TCP连接，每个方向的数据在 latency/2 秒后送达
+
+    只增加时延不限制带宽，多个在途请求可以同时处于"飞行"状态，与真实高延迟链路一致
+
+    Args:
+        target_host (str): 后端服务器地址
+        target_port (int): 后端服务器端口
+        latency (float): 注入的往返时延（秒）
+    """
+
+    def __init__(self, target_host, target_port, latency):
+        self.target = (target_host, target_port)
+        self.delay = max(latency, 0) / 2
+        self._closed = threading.Event()
+        self._sockets = []
+        self._listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._listener.bind(("127.0.0.1", 0))
+        self._listener.listen(8)
+        self.port = self._listener.getsockname()[1]
+
+    def start(self):
+        threading.Thread(target=self._accept, name="delay-proxy", daemon=True).start()
+        return self
+
+    def _accept(self):
+        while not self._closed.is_set():
+            try:
+                client, _ = self._listener.accept()
+            except OSError:
+                return
+            try:
+                upstream = socket.create_connection(self.target)
+            except OSError as e:
+                logger.error(f"代理连接后端失败: {e}")
+                client.close()
+                continue
+            for sock in (client, upstream):
+                sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self._sockets.extend((client, upstream))
+            self._pipe(client, upstream)
+            self._pipe(upstream, client)
+
+    def _pipe(self, source, destination):
+        pending = queue.Queue()
+
+        def _receive():
+            while True:
+                try:
+                    data = source.recv(65536)
+                except OSError:
+                    data = b""
+                pending.put((time.monotonic() + self.delay, data))
+                if not data:
+                    return
+
+        def _send():
+            while True:
+                due, data = pending.get()
+                wait = due - time.monotonic()
+                if wait > 0:
+                    time.sleep(wait)
+                if not data:
+                    try:
+                        destination.shutdown(socket.SHUT_WR)
+                    except OSError:
+                        pass
+                    return
+                try:
+                    destination.sendall(data)
+                except OSError:
+                    return
+
+        threading.Thread(target=_receive, daemon=True).start()
+        threading.Thread(target=_send, daemon=True).start()
+
+    def close(self):
+        self._closed.set()
+        for sock in [self._listener] + self._sockets:
+            # 先 shutdown 唤醒阻塞在 recv 上的转发线程，后端随之收到EOF
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            try:
+                sock.close()
+            except OSError:
+                pass
+
+
+class SequenceRecorder:
+    """
+    记录连接上发出的每个请求的 MessageID 与 CreditCharge
+
+    一个请求消耗 [MessageID, MessageID + CreditCharge) 范围的序列号，
+    下一个请求的 MessageID 落在该范围内时服务器会拒绝请求或断开连接
+    """
+
+    def __init__(self, smb):
+        self.server = smb.getSMBServer()
+        self.requests = []
+
+    def __enter__(self):
+        send = self.server.sendSMB
+
+        def _record(packet):
+            message_id = send(packet)
+            self.requests.append((message_id, max(packet["CreditCharge"], 1)))
+            return message_id
+
+        self.server.sendSMB = _record
+        return self
+
+    def __exit__(self, *exc_info):
+        del self.server.sendSMB
+
+    def summary(self):
+        overlaps = sum(
+            1
+            for (message_id, charge), (next_id, _) in zip(self.requests, self.requests[1:])
+            if next_id < message_id + charge
+        )
+        return {
+            "requests": len(self.requests),
+            "credits": sum(charge for _, charge in self.requests),
+            "max_charge": max((charge for _, charge in self.requests), default=0),
+            "overlaps": overlaps,
+        }
+
+
+def _free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_local_server(share_dir):
+    """在后台线程启动只监听本机的 impacket smbserver，返回 (server, port)，用完调用 server.stop()"""
+    port = _free_port()
+    server = smbserver.SimpleSMBServer(listenAddress="127.0.0.1", listenPort=port)
+    server.addShare(LOCAL_SHARE, share_dir, "pipeline benchmark")
+    server.setSMB2Support(True)
+    server.setSMBChallenge("")
+    server.setLogFile("")
+    server.addCredential(LOCAL_USER, 0, compute_lmhash(LOCAL_PASSWORD), compute_nthash(LOCAL_PASSWORD))
+    threading.Thread(target=server.start, name="smbserver", daemon=True).start()
+
+    deadline = time.monotonic() + 10
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return server, port
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError("本地 smbserver 启动超时")
+
+
+def _timed(label, size, operation, expected=None, smb=None):
+    """执行一次传输并打印耗时、吞吐量、校验结果和请求/信用统计"""
+    recorder = SequenceRecorder(smb)
+    start = time.perf_counter()
+    with recorder:
+        digest = operation()
+    elapsed = time.perf_counter() - start
+    stats = recorder.summary()
+    rate = size / max(elapsed, 1e-9) / 1024 / 1024
+    verdict = "" if expected is None else ("OK" if digest == expected else "校验失败")
+    warning = f"  MessageID重叠 {stats['overlaps']} 处" if stats["overlaps"] else ""
+    print(
+        f"{label:<22} {elapsed:8.2f}s {rate:9.2f} MB/s  "
+        f"请求 {stats['requests']:>6}  信用 {stats['credits']:>6}  最大Charge {stats['max_charge']:>3}  "
+        f"{verdict}{warning}"
+    )
+    return digest
+
+
+def run_benchmark(smb, share, directory, payload, depths, chunk_size, verify_local=None):
+    """在已登录的连接上依次执行写、读基准，结束后删除测试文件"""
+    size = len(payload)
+    expected = hashlib.sha256(payload).hexdigest()
+    remote_path = "\\".join(part for part in (directory.strip("\\"), BENCHMARK_FILE) if part)
+    tree_id = smb.connectTree(share)
+    connection = smb.getSMBServer()._Connection
+    read_chunk = negotiate_chunk_size(smb, chunk_size)
+    write_chunk = negotiate_chunk_size(smb, chunk_size, write=True)
+    print(
+        f"Dialect 0x{connection['Dialect']:04x}  多信用 {connection['SupportsMultiCredit']}  "
+        f"MaxRead {connection['MaxReadSize']}  MaxWrite {connection['MaxWriteSize']}"
+    )
+    print(
+        f"读块 {read_chunk} 字节 (CreditCharge {_credit_charge(connection, read_chunk)})  "
+        f"写块 {write_chunk} 字节 (CreditCharge {_credit_charge(connection, write_chunk)})"
+    )
+    print("-" * 100)
+
+    def _local_digest():
+        # 本地服务器直接核对落盘内容
+        if not verify_local:
+            return expected
+        with open(verify_local, "rb") as f:
+            return hashlib.sha256(f.read()).hexdigest()
+
+    def _write_sequential():
+        file_id = smb.createFile(tree_id, remote_path)
+        try:
+            for offset in range(0, size, write_chunk):
+                smb.writeFile(tree_id, file_id, payload[offset : offset + write_chunk], offset)
+        finally:
+            smb.closeFile(tree_id, file_id)
+        return _local_digest()
+
+    def _write_pipelined(depth):
+        def _operation():
+            file_id = smb.createFile(tree_id, remote_path)
+            try:
+                pipelined_write(
+                    smb, tree_id, file_id, io.BytesIO(payload).read, depth=depth, chunk_size=chunk_size
+                )
+            finally:
+                smb.closeFile(tree_id, file_id)
+            return _local_digest()
+
+        return _operation
+
+    def _read_sequential():
+        digest = hashlib.sha256()
+        file_id = smb.openFile(tree_id, remote_path)
+        try:
+            offset = 0
+            while offset < size:
+                data = smb.readFile(tree_id, file_id, offset, min(read_chunk, size - offset))
+                if not data:
+                    break
+                digest.update(data)
+                offset += len(data)
+        finally:
+            smb.closeFile(tree_id, file_id)
+        return digest.hexdigest()
+
+    def _read_pipelined(depth):
+        def _operation():
+            digest = hashlib.sha256()
+            file_id = smb.openFile(tree_id, remote_path)
+            try:
+                pipelined_read(
+                    smb,
+                    tree_id,
+                    file_id,
+                    0,
+                    size,
+                    lambda offset, data: digest.update(data),
+                    depth=depth,
+                    chunk_size=chunk_size,
+                )
+            finally:
+                smb.closeFile(tree_id, file_id)
+            return digest.hexdigest()
+
+        return _operation
+
+    try:
+        _timed("写 逐块", size, _write_sequential, expected, smb)
+        for depth in depths:
+            _timed(f"写 流水线 depth={depth}", size, _write_pipelined(depth), expected, smb)
+        _timed("读 逐块", size, _read_sequential, expected, smb)
+        for depth in depths:
+            _timed(f"读 流水线 depth={depth}", size, _read_pipelined(depth), expected, smb)
+    finally:
+        try:
+            smb.deleteFile(share, remote_path)
+        except Exception as e:
+            logger.warning(f"删除测试文件失败: {e}")
+        smb.disconnectTree(tree_id)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SMB2/3 流水线读写基准测试")
+    parser.add_argument("--latency", type=float, default=20, help="注入的往返时延（毫秒），默认 20")
+    parser.add_argument("--size", type=float, default=16, help="测试文件大小（MB），默认 16")
+    parser.add_argument("--depths", default="1,2,4,8", help="要比较的流水线深度，逗号分隔")
+    parser.add_argument("--chunk-size", type=int, default=1024, help="期望的请求块大小（KB），默认 1024")
+    parser.add_argument(
+        "--force-multi-credit",
+        action="store_true",
+        help="把连接视为 SMB 2.1 多信用并放宽最大读写长度（impacket smbserver 只协商 2.0.2，用于覆盖 CreditCharge 分支）",
+    )
+    parser.add_argument("--target", help="使用已有服务器 host[:port]，不启动本地 smbserver")
+    parser.add_argument("--share", help="--target 模式下写入测试文件的共享")
+    parser.add_argument("--path", default="", help="--target 模式下测试文件所在目录")
+    parser.add_argument("--username", default="")
+    parser.add_argument("--password", default="")
+    parser.add_argument("--domain", default="")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING, format="%(levelname)s %(message)s")
+    depths = [int(depth) for depth in args.depths.split(",") if depth.strip()]
+    chunk_size = max(int(args.chunk_size * 1024), 1)
+    payload = os.urandom(int(args.size * 1024 * 1024))
+
+    share_dir = None
+    server = None
+    if args.target:
+        if not args.share:
+            parser.error("--target 需要同时指定 --share")
+        host, _, port = args.target.partition(":")
+        port = int(port or 445)
+        share, directory = args.share, args.path
+        username, password, domain = args.username, args.password, args.domain
+    else:
+        share_dir = tempfile.mkdtemp(prefix="smb-bench-")
+        server, port = start_local_server(share_dir)
+        host = "127.0.0.1"
+        share, directory = LOCAL_SHARE, ""
+        username, password, domain = LOCAL_USER, LOCAL_PASSWORD, ""
+
+    proxy = DelayProxy(host, port, args.latency / 1000).start()
+    print(
+        f"服务器 {host}:{port}  代理 127.0.0.1:{proxy.port}  往返时延 {args.latency:g}ms  "
+        f"文件 {len(payload) / 1024 / 1024:g}MB"
+    )
+    smb = None
+    try:
+        smb = SMBConnection(host, "127.0.0.1", None, proxy.port)
+        smb.login(username, password, domain)
+        if not supports_pipeline(smb):
+            print("服务器只协商了SMBv1，流水线读写不可用")
+            return
+        if args.force_multi_credit:
+            connection = smb.getSMBServer()._Connection
+            # impacket smbserver 只协商 2.0.2（不允许多信用），按头部与签名方式相同的 2.1 处理
+            if connection["Dialect"] == SMB2_DIALECT_002:
+                connection["Dialect"] = SMB2_DIALECT_21
+            connection["SupportsMultiCredit"] = True
+            connection["MaxReadSize"] = max(connection["MaxReadSize"], chunk_size)
+            connection["MaxWriteSize"] = max(connection["MaxWriteSize"], chunk_size)
+        verify_local = os.path.join(share_dir, BENCHMARK_FILE) if share_dir else None
+        run_benchmark(smb, share, directory, payload, depths, chunk_size, verify_local)
+        smb.logoff()
+    finally:
+        # 依次关闭客户端、代理和服务器，smbserver 的请求线程收到EOF后退出，进程才能正常结束
+        if smb is not None:
+            try:
+                smb.close()
+            except Exception as e:
+                logger.debug(f"关闭连接失败: {e}")
+        proxy.close()
+        if server is not None:
+            server.stop()
+        if share_dir:
+            shutil.rmtree(share_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,315 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+目录变更监听
+在独立的SMB2会话上为已缓存的目录注册 CHANGE_NOTIFY，服务器报告变化时回调失效对应的缓存；
+SMBv1 或服务器不支持时自动停用，由TTL兜底
+"""
+
+import logging
+import queue
+import threading
+import time
+from collections import OrderedDict
+from impacket import nt_errors
+from impacket.nmb import NetBIOSTimeout
+from impacket.smb3 import SMB3
+from impacket.smb3structs import (
+    SMB2_CHANGE_NOTIFY,
+    SMB2ChangeNotify,
+    SMB2ChangeNotify_Response,
+    FILE_NOTIFY_INFORMATION,
+    FILE_LIST_DIRECTORY,
+    FILE_SHARE_READ,
+    FILE_SHARE_WRITE,
+    FILE_SHARE_DELETE,
+    FILE_DIRECTORY_FILE,
+    FILE_OPEN,
+    FILE_NOTIFY_CHANGE_FILE_NAME,
+    FILE_NOTIFY_CHANGE_DIR_NAME,
+    FILE_NOTIFY_CHANGE_ATTRIBUTES,
+    FILE_NOTIFY_CHANGE_SIZE,
+    FILE_NOTIFY_CHANGE_LAST_WRITE,
+)
+from impacket.smbconnection import SessionError, SMB_DIALECT
+
+logger = logging.getLogger(__name__)
+
+COMPLETION_FILTER = (
+    FILE_NOTIFY_CHANGE_FILE_NAME
+    | FILE_NOTIFY_CHANGE_DIR_NAME
+    | FILE_NOTIFY_CHANGE_ATTRIBUTES
+    | FILE_NOTIFY_CHANGE_SIZE
+    | FILE_NOTIFY_CHANGE_LAST_WRITE
+)
+
+# 返回这些状态说明服务器不支持目录变更通知，整体回退到TTL
+UNSUPPORTED_ERRORS = (
+    nt_errors.STATUS_NOT_SUPPORTED,
+    nt_errors.STATUS_NOT_IMPLEMENTED,
+    nt_errors.STATUS_INVALID_DEVICE_REQUEST,
+)
+
+
+class DirectoryWatch:
+    """一个已注册的目录监听"""
+
+    def __init__(self, cache_key, path, share_name, relative_path):
+        self.cache_key = cache_key
+        self.path = path
+        self.share_name = share_name
+        self.relative_path = relative_path
+        self.tree_id = None
+        self.file_id = None
+        self.message_id = None
+        self.armed_at = None
+
+
+class DirectoryWatcher:
+    """
+    目录变更监听器（单线程独占一个SMB会话）
+
+    Args:
+        factory (callable): 创建并登录新SMBConnection的函数
+        on_change (callable): on_change(path, names)，names为变化的子项名列表，None表示整个目录
+        max_watches (int): 同时监听的目录数，超出时关闭最久未使用的监听
+        poll_interval (float): 等待通知时的超时秒数，决定响应新增监听/停止的速度
+        buffer_size (int): 每个通知请求的返回缓冲区大小
+        request_timeout (float): 打开/关闭目录句柄等普通请求的超时秒数（与SMBConnection默认一致）
+    """
+
+    def __init__(
+        self, factory, on_change, max_watches=16, poll_interval=1.0, buffer_size=4096, request_timeout=60
+    ):
+        self.factory = factory
+        self.on_change = on_change
+        self.max_watches = max(int(max_watches), 1)
+        self.poll_interval = poll_interval
+        self.request_timeout = request_timeout
+        self.buffer_size = buffer_size
+        self.supported = None  # None 表示尚未确定
+        self._watches = OrderedDict()  # cache_key -> DirectoryWatch
+        self._by_message = {}  # message_id -> DirectoryWatch
+        self._armed = {}  # cache_key -> 首次注册成功的时间，供其他线程查询
+        self._armed_lock = threading.Lock()
+        self._requests = queue.Queue()
+        self._stop_event = threading.Event()
+        self._thread = None
+        self._smb = None
+        self._trees = {}
+
+    def start(self):
+        self._thread = threading.Thread(
+            target=self._run, name="smb-change-notify", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def watch(self, cache_key, path, share_name, relative_path):
+        """请求监听目录（异步执行，重复请求只刷新其最近使用顺序）"""
+        if self.supported is False or self._stop_event.is_set():
+            return
+        self._requests.put(DirectoryWatch(cache_key, path, share_name, relative_path))
+
+    def armed_at(self, cache_key):
+        """目录开始被监听的时间，未监听时返回None"""
+        with self._armed_lock:
+            return self._armed.get(cache_key)
+
+    def _run(self):
+        try:
+            self._smb = self.factory()
+            if self._smb.getDialect() == SMB_DIALECT:
+                self._disable("SMBv1 不支持 CHANGE_NOTIFY")
+                return
+            server = self._smb.getSMBServer()
+            if not isinstance(server, SMB3):
+                self._disable("当前会话不支持 CHANGE_NOTIFY")
+                return
+            server.setTimeout(self.request_timeout)
+            logger.info("目录变更监听已启动")
+
+            while not self._stop_event.is_set():
+                self._process_requests()
+                for packet in self._drain_outstanding(server):
+                    self._handle_response(packet)
+                if not self._by_message:
+                    self._stop_event.wait(self.poll_interval)
+                    continue
+                packet = self._poll(server)
+                if packet is not None:
+                    self._handle_response(packet)
+        except Exception as e:
+            if not self._stop_event.is_set():
+                logger.warning(f"目录变更监听中断，回退到TTL缓存: {e}")
+        finally:
+            self._close()
+
+    def _poll(self, server):
+        """以 poll_interval 为超时等待一个通知响应，超时返回None；其他请求仍使用 request_timeout"""
+        server.setTimeout(self.poll_interval)
+        try:
+            return server.recvSMB()
+        except NetBIOSTimeout:
+            return None
+        finally:
+            server.setTimeout(self.request_timeout)
+
+    def _disable(self, reason):
+        self.supported = False
+        logger.info(f"{reason}，目录缓存回退到TTL")
+
+    def _process_requests(self):
+        while True:
+            try:
+                request = self._requests.get_nowait()
+            except queue.Empty:
+                return
+
+            existing = self._watches.get(request.cache_key)
+            if existing is not None:
+                self._watches.move_to_end(request.cache_key)
+                continue
+
+            while len(self._watches) >= self.max_watches:
+                _, oldest = self._watches.popitem(last=False)
+                self._unwatch(oldest)
+
+            try:
+                self._arm(request)
+            except SessionError as e:
+                if e.getErrorCode() in UNSUPPORTED_ERRORS:
+                    self._disable("服务器不支持 CHANGE_NOTIFY")
+                    self._stop_event.set()
+                    return
+                logger.debug(f"监听目录失败 {request.path}: {e}")
+                continue
+            except (NetBIOSTimeout, OSError) as e:
+                # 单个目录超时不影响其他监听，线程继续运行
+                logger.warning(f"监听目录超时或网络错误 {request.path}: {e}")
+                if request.file_id is not None:
+                    self._unwatch(request)
+                continue
+
+            self._watches[request.cache_key] = request
+            with self._armed_lock:
+                self._armed[request.cache_key] = request.armed_at
+            logger.info(f"[变更监听] {request.path}")
+
+    def _get_tree_id(self, share_name):
+        key = share_name.lower()
+        tree_id = self._trees.get(key)
+        if tree_id is None:
+            tree_id = self._smb.connectTree(share_name)
+            self._trees[key] = tree_id
+        return tree_id
+
+    def _arm(self, watch):
+        """打开目录句柄并发出第一个通知请求"""
+        watch.tree_id = self._get_tree_id(watch.share_name)
+        watch.file_id = self._smb.openFile(
+            watch.tree_id,
+            watch.relative_path.strip("\\/"),
+            desiredAccess=FILE_LIST_DIRECTORY,
+            shareMode=FILE_SHARE_READ | FILE_SHARE_WRITE | FILE_SHARE_DELETE,
+            creationOption=FILE_DIRECTORY_FILE,
+            creationDisposition=FILE_OPEN,
+        )
+        self._send_notify(watch)
+        # 句柄打开后服务器会持续累积变化，之后获取的列表都能被通知覆盖
+        watch.armed_at = time.time()
+
+    def _send_notify(self, watch):
+        server = self._smb.getSMBServer()
+        packet = server.SMB_PACKET()
+        packet["Command"] = SMB2_CHANGE_NOTIFY
+        packet["TreeID"] = watch.tree_id
+
+        request = SMB2ChangeNotify()
+        request["OutputBufferLength"] = self.buffer_size
+        request["FileID"] = watch.file_id
+        request["CompletionFilter"] = COMPLETION_FILTER
+        packet["Data"] = request
+
+        watch.message_id = server.sendSMB(packet)
+        self._by_message[watch.message_id] = watch
+
+    def _unwatch(self, watch):
+        """关闭目录句柄，挂起的通知请求会以 STATUS_NOTIFY_CLEANUP 结束"""
+        with self._armed_lock:
+            self._armed.pop(watch.cache_key, None)
+        try:
+            self._smb.closeFile(watch.tree_id, watch.file_id)
+        except Exception as e:
+            logger.debug(f"关闭监听句柄失败 {watch.path}: {e}")
+
+    def _drain_outstanding(self, server):
+        """取出其他请求（如closeFile）等待期间被暂存的通知响应"""
+        outstanding = server._Connection["OutstandingResponses"]
+        message_ids = [mid for mid in list(outstanding) if mid in self._by_message]
+        return [outstanding.pop(mid) for mid in message_ids]
+
+    def _handle_response(self, packet):
+        watch = self._by_message.pop(packet["MessageID"], None)
+        if watch is None:
+            return
+
+        status = packet["Status"]
+        if status == nt_errors.STATUS_SUCCESS:
+            names = self._parse_names(SMB2ChangeNotify_Response(packet["Data"])["Buffer"])
+            self._notify(watch, names or None)
+        elif status == nt_errors.STATUS_NOTIFY_ENUM_DIR:
+            # 变化太多缓冲区放不下，整个目录失效
+            self._notify(watch, None)
+        elif status in UNSUPPORTED_ERRORS:
+            # 服务器在异步通知响应中才报告不支持，整体停用，避免每次列目录都重新注册
+            self._disable("服务器不支持 CHANGE_NOTIFY")
+            self._stop_event.set()
+            return
+        else:
+            if status != nt_errors.STATUS_NOTIFY_CLEANUP:
+                logger.debug(f"目录监听结束 {watch.path}: 0x{status:08x}")
+            if self._watches.get(watch.cache_key) is watch:
+                del self._watches[watch.cache_key]
+                self._unwatch(watch)
+            return
+
+        if self._watches.get(watch.cache_key) is watch:
+            try:
+                self._send_notify(watch)
+            except Exception as e:
+                logger.debug(f"重新注册监听失败 {watch.path}: {e}")
+                del self._watches[watch.cache_key]
+                self._unwatch(watch)
+
+    def _parse_names(self, buffer):
+        names = []
+        offset = 0
+        while offset < len(buffer):
+            entry = FILE_NOTIFY_INFORMATION(buffer[offset:])
+            names.append(entry["FileName"].decode("utf-16le"))
+            if not entry["NextEntryOffset"]:
+                break
+            offset += entry["NextEntryOffset"]
+        return names
+
+    def _notify(self, watch, names):
+        logger.info(f"[目录变化] {watch.path} -> {names if names else '全部'}")
+        try:
+            self.on_change(watch.path, names)
+        except Exception as e:
+            logger.warning(f"处理目录变化失败: {e}")
+
+    def _close(self):
+        with self._armed_lock:
+            self._armed.clear()
+        self._watches.clear()
+        self._by_message.clear()
+        if self._smb is not None:
+            try:
+                self._smb.close()
+            except Exception as e:
+                logger.debug(f"关闭监听会话失败: {e}")
+            self._smb = None
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+目录变更监听回退检查
+在本机启动 impacket smbserver（它在异步通知响应中返回 STATUS_NOT_SUPPORTED），
+注册第一个目录监听后确认 DirectoryWatcher 整体停用（supported 为 False）并结束监听线程，
+之后的监听请求不再在监听会话上打开目录
+
+用法:
+    python check_change_notify.py
+"""
+
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+from impacket.smbconnection import SMBConnection
+
+from benchmark_pipeline import LOCAL_PASSWORD, LOCAL_SHARE, LOCAL_USER, start_local_server
+from change_notify import DirectoryWatcher
+
+logger = logging.getLogger(__name__)
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format="%(levelname)s %(name)s %(message)s")
+    share_dir = tempfile.mkdtemp(prefix="smb-notify-")
+    os.makedirs(os.path.join(share_dir, "sub"))
+    server, port = start_local_server(share_dir)
+    sessions = []
+
+    def _factory():
+        smb = SMBConnection("127.0.0.1", "127.0.0.1", None, port)
+        smb.login(LOCAL_USER, LOCAL_PASSWORD)
+        sessions.append(smb)
+        return smb
+
+    watcher = DirectoryWatcher(_factory, lambda path, names: None, poll_interval=0.2)
+    try:
+        watcher.start()
+        watcher.watch(f"\\{LOCAL_SHARE}\\sub\\".lower(), f"\\{LOCAL_SHARE}\\sub\\", LOCAL_SHARE, "sub")
+
+        deadline = time.monotonic() + 10
+        while watcher.supported is None and time.monotonic() < deadline:
+            time.sleep(0.1)
+        watcher._thread.join(timeout=max(deadline - time.monotonic(), 0))
+
+        # 停用后的监听请求直接忽略
+        watcher.watch(f"\\{LOCAL_SHARE}\\".lower(), f"\\{LOCAL_SHARE}\\", LOCAL_SHARE, "")
+        failures = []
+        if watcher.supported is not False:
+            failures.append(f"supported 应为 False，实际为 {watcher.supported}")
+        if watcher._thread.is_alive():
+            failures.append("监听线程未结束")
+        if not watcher._requests.empty():
+            failures.append("停用后仍接受监听请求")
+    finally:
+        watcher.stop()
+        for smb in sessions:
+            try:
+                smb.close()
+            except Exception as e:
+                logger.debug(f"关闭连接失败: {e}")
+        server.stop()
+        shutil.rmtree(share_dir, ignore_errors=True)
+
+    if failures:
+        for failure in failures:
+            print(f"失败: {failure}")
+        return 1
+    print("通过: 服务器不支持 CHANGE_NOTIFY 时第一个监听后即停用")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
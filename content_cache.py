@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+文件内容缓存
+按文件标识（服务器、共享、路径、大小、修改时间）以固定大小的块缓存文件内容，
+内存按总字节数做LRU淘汰，被淘汰的块可落到本地磁盘继续保留；文件大小或修改时间变化后标识不同，旧内容自然不再命中
+"""
+
+import hashlib
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+BLOCK_SUFFIX = ".blk"
+
+
+def content_key(scope, share_name, file_path, size, mtime):
+    """由文件标识生成缓存键（同时用作磁盘文件名前缀）"""
+    identity = "|".join(
+        [scope or "", share_name.lower(), file_path.lower(), str(size), str(mtime)]
+    )
+    return hashlib.sha1(identity.encode("utf-8")).hexdigest()
+
+
+class ContentCache:
+    """
+    按块缓存的文件内容
+
+    Args:
+        max_bytes (int): 内存中缓存的总字节数上限
+        block_size (int): 块大小，读取时按块对齐
+        disk_dir (str): 磁盘缓存目录，为None时不落盘
+        disk_max_bytes (int): 磁盘缓存的总字节数上限
+    """
+
+    def __init__(
+        self,
+        max_bytes=64 * 1024 * 1024,
+        block_size=256 * 1024,
+        disk_dir=None,
+        disk_max_bytes=512 * 1024 * 1024,
+    ):
+        self.max_bytes = max(int(max_bytes), 0)
+        self.block_size = max(int(block_size), 4096)
+        self.disk_dir = str(disk_dir) if disk_dir else None
+        self.disk_max_bytes = max(int(disk_max_bytes), 0)
+        self.current_bytes = 0
+        self.disk_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._blocks = OrderedDict()  # (key, index) -> bytes
+        self._disk = OrderedDict()  # 文件名 -> 字节数
+        self._lock = threading.Lock()
+        if self.disk_dir:
+            self._load_disk_index()
+
+    def _load_disk_index(self):
+        """扫描磁盘缓存目录，按最近访问时间恢复LRU顺序"""
+        try:
+            os.makedirs(self.disk_dir, exist_ok=True)
+            entries = []
+            with os.scandir(self.disk_dir) as it:
+                for entry in it:
+                    if entry.is_file() and entry.name.endswith(BLOCK_SUFFIX):
+                        stat = entry.stat()
+                        entries.append((stat.st_atime, entry.name, stat.st_size))
+        except OSError as e:
+            logger.warning(f"磁盘内容缓存不可用，仅使用内存缓存: {e}")
+            self.disk_dir = None
+            return
+        entries.sort()
+        for _, name, size in entries:
+            self._disk[name] = size
+            self.disk_bytes += size
+        evicted = self._trim_disk_locked()
+        self._remove_disk_files(evicted)
+
+    def _disk_name(self, key, index):
+        return f"{key}-{index}{BLOCK_SUFFIX}"
+
+    def get_block(self, key, index):
+        """取出一个块，依次查找内存和磁盘，未命中时返回None"""
+        with self._lock:
+            data = self._blocks.get((key, index))
+            if data is not None:
+                self._blocks.move_to_end((key, index))
+                return data
+            name = self._disk_name(key, index)
+            on_disk = name in self._disk
+            if on_disk:
+                self._disk.move_to_end(name)
+
+        if not on_disk:
+            return None
+        try:
+            with open(os.path.join(self.disk_dir, name), "rb") as f:
+                data = f.read()
+        except OSError:
+            with self._lock:
+                size = self._disk.pop(name, None)
+                if size is not None:
+                    self.disk_bytes -= size
+            return None
+        # 提升回内存（磁盘上的副本保留，再次淘汰时无需重写）
+        self.put_block(key, index, data)
+        return data
+
+    def contains(self, key, index):
+        with self._lock:
+            return (key, index) in self._blocks or self._disk_name(key, index) in self._disk
+
+    def put_block(self, key, index, data):
+        """放入一个块，超出内存预算时淘汰最久未使用的块，启用磁盘缓存时落盘"""
+        if len(data) > self.max_bytes:
+            return
+        data = bytes(data)
+        with self._lock:
+            previous = self._blocks.pop((key, index), None)
+            if previous is not None:
+                self.current_bytes -= len(previous)
+            self._blocks[(key, index)] = data
+            self.current_bytes += len(data)
+            evicted = []
+            while self.current_bytes > self.max_bytes:
+                (old_key, old_index), old_data = self._blocks.popitem(last=False)
+                self.current_bytes -= len(old_data)
+                evicted.append((old_key, old_index, old_data))
+
+        if self.disk_dir:
+            for old_key, old_index, old_data in evicted:
+                self._spill(old_key, old_index, old_data)
+
+    def _spill(self, key, index, data):
+        name = self._disk_name(key, index)
+        with self._lock:
+            if name in self._disk:
+                self._disk.move_to_end(name)
+                return
+        if len(data) > self.disk_max_bytes:
+            return
+        path = os.path.join(self.disk_dir, name)
+        try:
+            temp_path = f"{path}.tmp"
+            with open(temp_path, "wb") as f:
+                f.write(data)
+            os.replace(temp_path, path)
+        except OSError as e:
+            logger.debug(f"写入磁盘内容缓存失败: {e}")
+            return
+        with self._lock:
+            self._disk[name] = len(data)
+            self.disk_bytes += len(data)
+            evicted = self._trim_disk_locked()
+        self._remove_disk_files(evicted)
+
+    def _trim_disk_locked(self):
+        evicted = []
+        while self.disk_bytes > self.disk_max_bytes and self._disk:
+            name, size = self._disk.popitem(last=False)
+            self.disk_bytes -= size
+            evicted.append(name)
+        return evicted
+
+    def _remove_disk_files(self, names):
+        for name in names:
+            try:
+                os.remove(os.path.join(self.disk_dir, name))
+            except OSError:
+                pass
+
+    def contains_range(self, key, offset, length):
+        """判断 [offset, offset+length) 是否已全部缓存"""
+        if length <= 0:
+            return True
+        first = offset // self.block_size
+        last = (offset + length - 1) // self.block_size
+        return all(self.contains(key, index) for index in range(first, last + 1))
+
+    def read(self, key, offset, length, file_size, fetch):
+        """
+        读取 [offset, offset+length)，缺失的连续块通过一次 fetch(offset, length) 获取并写入缓存
+
+        Args:
+            key (str): content_key 生成的缓存键
+            offset (int): 起始偏移
+            length (int): 读取长度
+            file_size (int): 文件大小，用于确定最后一个块的长度
+            fetch (callable): 从服务器读取指定范围的函数，返回bytes
+
+        Returns:
+            bytes: 读取到的数据（文件在读取期间被截短时可能不足 length）
+        """
+        end = min(offset + length, file_size)
+        if end <= offset:
+            return b""
+
+        block_size = self.block_size
+        first = offset // block_size
+        last = (end - 1) // block_size
+        pieces = []
+        index = first
+        while index <= last:
+            data = self.get_block(key, index)
+            if data is not None:
+                self.hits += 1
+                pieces.append(data)
+                index += 1
+                continue
+
+            # 合并连续缺失的块，一次读取
+            run_end = index
+            while run_end < last and not self.contains(key, run_end + 1):
+                run_end += 1
+            self.misses += run_end - index + 1
+            fetch_start = index * block_size
+            fetch_end = min((run_end + 1) * block_size, file_size)
+            fetched = fetch(fetch_start, fetch_end - fetch_start)
+            for block_index in range(index, run_end + 1):
+                block_start = (block_index - index) * block_size
+                block = fetched[block_start:block_start + block_size]
+                expected = min(block_size, file_size - block_index * block_size)
+                if len(block) != expected:
+                    # 文件在读取期间变化，不缓存不完整的块
+                    pieces.append(block)
+                    return self._slice(pieces, offset - first * block_size, end - offset)
+                self.put_block(key, block_index, block)
+                pieces.append(block)
+            index = run_end + 1
+
+        return self._slice(pieces, offset - first * block_size, end - offset)
+
+    def _slice(self, pieces, start, length):
+        data = b"".join(pieces) if len(pieces) != 1 else pieces[0]
+        if start == 0 and len(data) <= length:
+            return data
+        return data[start:start + length]
+
+    def clear(self):
+        with self._lock:
+            self._blocks.clear()
+            self.current_bytes = 0
+            names = list(self._disk)
+            self._disk.clear()
+            self.disk_bytes = 0
+        if self.disk_dir:
+            self._remove_disk_files(names)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "memory_bytes": self.current_bytes,
+                "memory_blocks": len(self._blocks),
+                "disk_bytes": self.disk_bytes,
+                "disk_blocks": len(self._disk),
+                "hits": self.hits,
+                "misses": self.misses,
+            }
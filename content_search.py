@@ -0,0 +1,368 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+文件内容搜索
+在远程目录树中逐个文件流式读取并按行匹配（字面量或正则），不把整个文件读入内存；
+匹配结果（路径、偏移、行号、所在行片段）在搜索进行中即可通过轮询增量取回
+"""
+
+import logging
+import re
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+SEARCH_RUNNING = "running"
+SEARCH_COMPLETED = "completed"
+SEARCH_FAILED = "failed"
+SEARCH_CANCELLED = "cancelled"
+
+# 未指定扩展名时默认只搜索常见文本文件
+DEFAULT_EXTENSIONS = (
+    ".txt", ".log", ".ini", ".conf", ".cfg", ".config", ".xml", ".json", ".yml", ".yaml",
+    ".properties", ".md", ".csv", ".bat", ".cmd", ".ps1", ".sh", ".py", ".js", ".html",
+    ".jsp", ".jspx", ".php", ".sql",
+)
+
+# 字面量搜索时同时匹配的编码（Windows 共享上的文本常为 GBK）
+PATTERN_ENCODINGS = ("utf-8", "gbk")
+
+
+class SearchStopped(Exception):
+    """单个文件的搜索提前结束（已取消或匹配数达到上限）"""
+
+
+def compile_pattern(pattern, regex=False, case_sensitive=False):
+    """
+    将搜索词编译为按字节匹配的正则表达式
+
+    Args:
+        pattern (str): 搜索词
+        regex (bool): 是否按正则表达式解释（按 UTF-8 匹配）
+        case_sensitive (bool): 是否区分大小写（仅对 ASCII 字符生效）
+
+    Returns:
+        re.Pattern: 字节正则；搜索词无效时抛出 ValueError
+    """
+    if not pattern:
+        raise ValueError("搜索内容不能为空")
+    flags = 0 if case_sensitive else re.IGNORECASE
+    if regex:
+        try:
+            return re.compile(pattern.encode("utf-8"), flags)
+        except re.error as e:
+            raise ValueError(f"无效的正则表达式: {e}")
+
+    alternatives = []
+    for encoding in PATTERN_ENCODINGS:
+        try:
+            encoded = re.escape(pattern.encode(encoding))
+        except UnicodeEncodeError:
+            continue
+        if encoded not in alternatives:
+            alternatives.append(encoded)
+    return re.compile(b"|".join(alternatives), flags)
+
+
+def normalize_extensions(extensions):
+    """将 "log, .txt" 或列表形式的扩展名规范为小写、带点的元组，为空时返回默认文本扩展名"""
+    if isinstance(extensions, str):
+        extensions = extensions.replace(";", ",").split(",")
+    result = []
+    for extension in extensions or ():
+        extension = extension.strip().lower()
+        if not extension:
+            continue
+        if extension == "*":
+            return ()
+        result.append(extension if extension.startswith(".") else "." + extension)
+    return tuple(result) if result else DEFAULT_EXTENSIONS
+
+
+def decode_line(line):
+    """按 UTF-8 解码一行，失败时尝试 GBK"""
+    try:
+        return line.decode("utf-8")
+    except UnicodeDecodeError:
+        pass
+    try:
+        return line.decode("gbk")
+    except UnicodeDecodeError:
+        return line.decode("utf-8", errors="replace")
+
+
+class LineMatcher:
+    """
+    流式按行匹配
+
+    依次 feed 文件数据，只保留最后一个不完整的行；超过 max_line_length 的行按该长度切开匹配
+
+    Args:
+        pattern (re.Pattern): compile_pattern 生成的字节正则
+        on_match (callable): on_match(offset, line_number, snippet) 每个匹配行调用一次
+        max_matches (int): 单个文件最多报告的匹配行数，达到后抛出 SearchStopped
+        max_line_length (int): 单行最大长度
+        snippet_length (int): 片段最多保留的字符数
+    """
+
+    def __init__(
+        self,
+        pattern,
+        on_match,
+        max_matches=100,
+        max_line_length=64 * 1024,
+        snippet_length=200,
+    ):
+        self.pattern = pattern
+        self.on_match = on_match
+        self.max_matches = max_matches
+        self.max_line_length = max_line_length
+        self.snippet_length = snippet_length
+        self.matches = 0
+        self.binary = False
+        self.bytes_read = 0
+        self._line_start = 0  # 缓冲区第一个字节在文件中的偏移
+        self._line_number = 1
+        self._buffer = b""
+
+    def feed(self, data):
+        if self.bytes_read == 0 and b"\x00" in data[:8192]:
+            # 与 grep 相同，开头含 NUL 字节的视为二进制文件，不再读取
+            self.binary = True
+            raise SearchStopped()
+        self.bytes_read += len(data)
+        buffer = self._buffer + data if self._buffer else data
+        start = 0
+        while True:
+            newline = buffer.find(b"\n", start)
+            if newline < 0:
+                if len(buffer) - start > self.max_line_length:
+                    newline = start + self.max_line_length - 1
+                else:
+                    break
+            self._match_line(buffer[start:newline + 1])
+            start = newline + 1
+        self._buffer = buffer[start:]
+
+    def finish(self):
+        if self._buffer:
+            self._match_line(self._buffer)
+            self._buffer = b""
+
+    def _match_line(self, line):
+        match = self.pattern.search(line)
+        if match is not None:
+            self.matches += 1
+            self.on_match(
+                self._line_start + match.start(), self._line_number, self._snippet(line, match)
+            )
+        self._line_start += len(line)
+        if line.endswith(b"\n"):
+            self._line_number += 1
+        if match is not None and self.matches >= self.max_matches:
+            raise SearchStopped()
+
+    def _snippet(self, line, match):
+        text = decode_line(line.rstrip(b"\r\n"))
+        if len(text) <= self.snippet_length:
+            return text.strip()
+        # 长行只保留匹配位置附近的内容
+        position = len(decode_line(line[:match.start()]))
+        begin = max(position - self.snippet_length // 2, 0)
+        return "…" + text[begin:begin + self.snippet_length].strip() + "…"
+
+
+class ContentSearch:
+    """一次内容搜索任务，匹配结果按发现顺序累积，可按序号增量读取"""
+
+    def __init__(self, share_name, root, pattern, regex, case_sensitive, extensions, max_file_size):
+        self.id = uuid.uuid4().hex
+        self.share_name = share_name
+        self.root = root
+        self.pattern = pattern
+        self.regex = regex
+        self.case_sensitive = case_sensitive
+        self.extensions = extensions
+        self.max_file_size = max_file_size
+        self.state = SEARCH_RUNNING
+        self.error = None
+        self.files_total = 0
+        self.files_scanned = 0
+        self.files_matched = 0
+        self.files_failed = 0
+        self.bytes_scanned = 0
+        self.truncated = False
+        self.matches = []
+        self.created = time.time()
+        self.finished = None
+        self._cancel_event = threading.Event()
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self):
+        return self._cancel_event.is_set()
+
+    def cancel(self):
+        self._cancel_event.set()
+
+    def add_match(self, match, max_matches):
+        """记录一个匹配，总数达到上限后返回False"""
+        with self._lock:
+            if len(self.matches) >= max_matches:
+                self.truncated = True
+                return False
+            self.matches.append(match)
+            return True
+
+    def discover(self, files, nbytes):
+        with self._lock:
+            self.files_total += files
+
+    def file_finished(self, path, success, nbytes=0, matched=False):
+        with self._lock:
+            if success:
+                self.files_scanned += 1
+                self.bytes_scanned += nbytes
+                if matched:
+                    self.files_matched += 1
+            else:
+                self.files_failed += 1
+
+    def to_dict(self, since=0):
+        with self._lock:
+            since = max(int(since or 0), 0)
+            return {
+                "id": self.id,
+                "share_name": self.share_name,
+                "root": self.root,
+                "pattern": self.pattern,
+                "state": self.state,
+                "error": self.error,
+                "files_total": self.files_total,
+                "files_scanned": self.files_scanned,
+                "files_matched": self.files_matched,
+                "files_failed": self.files_failed,
+                "bytes_scanned": self.bytes_scanned,
+                "truncated": self.truncated,
+                "total_matches": len(self.matches),
+                "next": len(self.matches),
+                "matches": self.matches[since:],
+                "created": self.created,
+                "finished": self.finished,
+            }
+
+
+class ContentSearchManager:
+    """
+    内容搜索调度器
+
+    Args:
+        smb_handler (SMBHandler): 执行实际搜索的SMB处理器
+        max_searches (int): 同时进行的搜索数量上限
+        max_matches (int): 每次搜索最多保留的匹配数
+        keep_finished (int): 最多保留的已结束搜索记录数
+    """
+
+    def __init__(self, smb_handler, max_searches=2, max_matches=5000, keep_finished=10):
+        self.smb_handler = smb_handler
+        self.max_matches = max_matches
+        self.keep_finished = keep_finished
+        self.searches = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(
+            max_workers=max(int(max_searches), 1), thread_name_prefix="smb-grep"
+        )
+
+    def start(
+        self,
+        share_name,
+        dir_path,
+        pattern,
+        regex=False,
+        case_sensitive=False,
+        extensions=None,
+        max_file_size=None,
+    ):
+        """校验参数并排队一次搜索，返回搜索ID；搜索词无效时抛出 ValueError"""
+        compiled = compile_pattern(pattern, regex, case_sensitive)
+        search = ContentSearch(
+            share_name,
+            (dir_path or "").replace("/", "\\").strip("\\"),
+            pattern,
+            regex,
+            case_sensitive,
+            normalize_extensions(extensions),
+            max_file_size,
+        )
+        with self._lock:
+            self._forget_finished()
+            self.searches[search.id] = search
+        logger.info(f"内容搜索入队: {search.id} {share_name}\\{search.root} {pattern!r}")
+        self._executor.submit(self._run, search, compiled)
+        return search.id
+
+    def _run(self, search, compiled):
+        def _on_match(path, offset, line_number, snippet):
+            return search.add_match(
+                {"path": path, "offset": offset, "line": line_number, "text": snippet},
+                self.max_matches,
+            )
+
+        try:
+            result = self.smb_handler.grep_directory(
+                search.share_name,
+                search.root,
+                compiled,
+                extensions=search.extensions,
+                max_file_size=search.max_file_size,
+                match_callback=_on_match,
+                discover_callback=search.discover,
+                file_callback=search.file_finished,
+                is_cancelled=lambda: search.cancelled or search.truncated,
+            )
+        except Exception as e:
+            result = {"success": False, "error": str(e)}
+
+        with search._lock:
+            search.finished = time.time()
+            if search.cancelled:
+                search.state = SEARCH_CANCELLED
+            elif result.get("success") or search.truncated:
+                # 达到匹配上限而提前结束不算失败，个别文件读取失败只计数
+                search.state = SEARCH_COMPLETED
+            else:
+                search.state = SEARCH_FAILED
+                search.error = result.get("error")
+        logger.info(
+            f"内容搜索结束: {search.id} {search.state}，扫描 {search.files_scanned} 个文件，"
+            f"匹配 {len(search.matches)} 处"
+        )
+
+    def _forget_finished(self):
+        finished = [s for s in self.searches.values() if s.state != SEARCH_RUNNING]
+        finished.sort(key=lambda s: s.created)
+        for search in finished[: max(len(finished) - self.keep_finished + 1, 0)]:
+            del self.searches[search.id]
+
+    def get(self, search_id, since=0):
+        with self._lock:
+            search = self.searches.get(search_id)
+        return search.to_dict(since) if search else None
+
+    def cancel(self, search_id):
+        with self._lock:
+            search = self.searches.get(search_id)
+        if search is None or search.state != SEARCH_RUNNING:
+            return False
+        search.cancel()
+        return True
+
+    def shutdown(self):
+        with self._lock:
+            searches = list(self.searches.values())
+        for search in searches:
+            search.cancel()
+        self._executor.shutdown(wait=False)
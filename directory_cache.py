@@ -0,0 +1,413 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+目录缓存数据结构
+目录列表以列式、不可变的形式缓存，可直接共享给多个调用方而无需复制，
+只在真正需要返回给前端的行上才转换为字典
+"""
+
+import datetime
+import os
+import threading
+import time
+from array import array
+from collections import OrderedDict
+
+# Windows FILETIME（1601-01-01起的100ns间隔）与Unix时间戳之间的偏移
+FILETIME_EPOCH_OFFSET = 116444736000000000
+
+DIRECTORY_FLAG = 0x01
+
+
+def format_filetime(timestamp):
+    """将listPath返回的时间戳转换为显示用的时间字符串"""
+    try:
+        if timestamp > 100000000000000000:
+            # Windows FILETIME转换为Unix时间戳
+            unix_timestamp = (timestamp - FILETIME_EPOCH_OFFSET) / 10000000
+        else:
+            # 尝试直接转换
+            unix_timestamp = timestamp / 100000000
+        return datetime.datetime.fromtimestamp(unix_timestamp).strftime(
+            "%Y-%m-%d %H:%M:%S"
+        )
+    except Exception:
+        return "Unknown"
+
+
+# list_directory_page 支持的排序字段，按列取值，避免为排序构造字典
+SORT_KEYS = {
+    "name": lambda listing, i: listing.names[i].lower(),
+    "size": lambda listing, i: listing.sizes[i],
+    "modified_time": lambda listing, i: listing.mtimes[i],
+    "type": lambda listing, i: (
+        os.path.splitext(listing.names[i])[1].lower(),
+        listing.names[i].lower(),
+    ),
+}
+
+
+class DirectoryListing:
+    """
+    不可变的目录列表（列式存储）
+
+    Args:
+        names (tuple): 条目名称
+        sizes (array): 文件大小
+        flags (array): 标志位，DIRECTORY_FLAG 表示目录
+        mtimes (array): 原始修改时间戳（FILETIME）
+        attributes (array): 原始文件属性
+        share_types (tuple): 共享列表专用，每行的 (类型描述, 属性标签)
+        fetched_at (float): 从服务器获取该列表的时间，默认为当前时间
+        dir_mtime (int): 目录自身的修改时间戳（FILETIME），未知时为None
+    """
+
+    __slots__ = (
+        "names",
+        "sizes",
+        "flags",
+        "mtimes",
+        "attributes",
+        "share_types",
+        "fetched_at",
+        "dir_mtime",
+        "_views",
+        "_views_lock",
+    )
+
+    # 每个目录保留的排序/过滤索引组合数
+    MAX_VIEWS = 8
+
+    def __init__(
+        self,
+        names,
+        sizes,
+        flags,
+        mtimes,
+        attributes,
+        share_types=None,
+        fetched_at=None,
+        dir_mtime=None,
+    ):
+        self.names = tuple(names)
+        self.sizes = array("Q", sizes)
+        self.flags = array("B", flags)
+        self.mtimes = array("q", mtimes)
+        self.attributes = array("I", attributes)
+        self.share_types = tuple(share_types) if share_types is not None else None
+        self.fetched_at = time.time() if fetched_at is None else fetched_at
+        self.dir_mtime = dir_mtime
+        self._views = {}
+        self._views_lock = threading.Lock()
+
+    @classmethod
+    def from_shared_files(cls, file_list):
+        """由listPath返回的SharedFile列表构建，跳过 . 和 ..（. 的修改时间记为目录自身的修改时间）"""
+        names, sizes, flags, mtimes, attributes = [], [], [], [], []
+        dir_mtime = None
+        for file_item in file_list:
+            name = file_item.get_longname()
+            if name == ".":
+                dir_mtime = file_item.get_mtime()
+                continue
+            if name == "..":
+                continue
+            names.append(name)
+            sizes.append(file_item.get_filesize())
+            flags.append(DIRECTORY_FLAG if file_item.is_directory() else 0)
+            mtimes.append(file_item.get_mtime())
+            attributes.append(file_item.get_attributes())
+        return cls(names, sizes, flags, mtimes, attributes, dir_mtime=dir_mtime)
+
+    @classmethod
+    def from_shares(cls, shares):
+        """由 (共享名, 类型描述, 属性标签) 列表构建共享列表"""
+        count = len(shares)
+        return cls(
+            [name for name, _, _ in shares],
+            [0] * count,
+            [DIRECTORY_FLAG] * count,
+            [0] * count,
+            [0] * count,
+            share_types=[(share_type, label) for _, share_type, label in shares],
+        )
+
+    def __len__(self):
+        return len(self.names)
+
+    def age(self):
+        """距离从服务器获取该列表经过的秒数"""
+        return time.time() - self.fetched_at
+
+    def same_entries(self, other):
+        """与另一份列表的目录自身修改时间以及每个条目的名称、类型、大小、修改时间、属性是否完全相同"""
+        return (
+            self.dir_mtime == other.dir_mtime
+            and self.names == other.names
+            and self.flags == other.flags
+            and self.sizes == other.sizes
+            and self.mtimes == other.mtimes
+            and self.attributes == other.attributes
+        )
+
+    def revalidated(self, fetched_at=None):
+        """重新获取的列表与本列表 same_entries 时，返回共享同一份列数据、仅更新获取时间的新列表"""
+        listing = object.__new__(DirectoryListing)
+        for slot in ("names", "sizes", "flags", "mtimes", "attributes", "share_types", "dir_mtime"):
+            setattr(listing, slot, getattr(self, slot))
+        listing.fetched_at = time.time() if fetched_at is None else fetched_at
+        # 数据相同，排序索引也可继续共用
+        listing._views = self._views
+        listing._views_lock = self._views_lock
+        return listing
+
+    def subdirectories(self):
+        """按名称排序的子目录名"""
+        return [self.names[i] for i in self.sorted_view("name") if self.is_directory(i)]
+
+    def find(self, name):
+        """按名称（不区分大小写）查找行号，不存在时返回None"""
+        try:
+            return self.names.index(name)
+        except ValueError:
+            pass
+        lowered = name.lower()
+        for i, entry_name in enumerate(self.names):
+            if entry_name.lower() == lowered:
+                return i
+        return None
+
+    def is_directory(self, i):
+        return bool(self.flags[i] & DIRECTORY_FLAG)
+
+    def row(self, i):
+        """将第i行转换为前端使用的字典格式"""
+        if self.share_types is not None:
+            share_type, label = self.share_types[i]
+            return {
+                "name": self.names[i],
+                "type": share_type,
+                "is_directory": True,
+                "size": 0,
+                "modified_time": "",
+                "attributes": label,
+            }
+
+        formatted_time = format_filetime(self.mtimes[i])
+        return {
+            "name": self.names[i],
+            "size": self.sizes[i],
+            "is_directory": self.is_directory(i),
+            "modified_time": formatted_time,
+            "created_time": formatted_time,  # 使用相同的时间
+            "attributes": str(self.attributes[i]),
+        }
+
+    def rows(self, positions=None):
+        """转换指定行（默认全部）为字典列表"""
+        if positions is None:
+            positions = range(len(self.names))
+        return [self.row(i) for i in positions]
+
+    def sorted_view(self, sort_key, descending=False, name_filter=None):
+        """
+        获取排序（及过滤）后的行号索引，结果缓存在列表对象上
+
+        文件夹始终在前，排序方向只作用于各自分组内部
+        """
+        name_filter = (name_filter or "").strip().lower()
+        view_key = (sort_key, descending, name_filter)
+        with self._views_lock:
+            index = self._views.get(view_key)
+        if index is not None:
+            return index
+
+        key_func = SORT_KEYS[sort_key]
+        positions = range(len(self.names))
+        if name_filter:
+            positions = [i for i in positions if name_filter in self.names[i].lower()]
+
+        directories = [i for i in positions if self.flags[i] & DIRECTORY_FLAG]
+        regular_files = [i for i in positions if not self.flags[i] & DIRECTORY_FLAG]
+        directories.sort(key=lambda i: key_func(self, i), reverse=descending)
+        regular_files.sort(key=lambda i: key_func(self, i), reverse=descending)
+        index = array("I", directories + regular_files)
+
+        with self._views_lock:
+            if len(self._views) >= self.MAX_VIEWS:
+                self._views.pop(next(iter(self._views)))
+            self._views[view_key] = index
+        return index
+
+
+def split_cache_key(cache_key):
+    """将缓存键（"\\share\\dir\\" 或 "__root__"）拆成路径分量"""
+    if not cache_key or cache_key == "__root__":
+        return ()
+    return tuple(part for part in cache_key.split("\\") if part)
+
+
+class _CacheNode:
+    """目录缓存树的节点，对应一个路径分量；listing 为None表示该目录本身未缓存"""
+
+    __slots__ = ("name", "parent", "children", "key", "listing", "cost", "expires")
+
+    def __init__(self, name, parent):
+        self.name = name
+        self.parent = parent
+        self.children = {}
+        self.key = None
+        self.listing = None
+        self.cost = 0
+        self.expires = 0
+
+
+class DirectoryCacheTree:
+    """
+    按路径分量组织的目录缓存（前缀树）
+
+    缓存键仍为 _normalize_cache_key 生成的小写路径，但按分量存放在树中：失效一个目录的整棵子树、
+    清空一个共享、列出某目录下已缓存的目录都只访问受影响的节点，不必遍历全部键。
+    容量按缓存的目录项总数计算（每个目录计 条目数+1），超出时按最近最少使用淘汰，
+    一个几十万项的大目录与一个小目录不再占用相同的配额。本类不加锁，由调用方持有缓存锁
+
+    Args:
+        max_entries (int): 缓存的目录项总数上限
+        ttl (float): 写入后保留的秒数，超过后视为不存在
+    """
+
+    def __init__(self, max_entries=200000, ttl=3900):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.total_entries = 0
+        self._root = _CacheNode("", None)
+        self._lru = OrderedDict()  # 缓存键 -> 节点，按最近使用排序
+
+    def __len__(self):
+        return len(self._lru)
+
+    def __contains__(self, cache_key):
+        return self.get(cache_key) is not None
+
+    def __iter__(self):
+        return iter(list(self._lru))
+
+    def __getitem__(self, cache_key):
+        listing = self.get(cache_key)
+        if listing is None:
+            raise KeyError(cache_key)
+        return listing
+
+    def __setitem__(self, cache_key, listing):
+        node = self._root
+        for part in split_cache_key(cache_key):
+            child = node.children.get(part)
+            if child is None:
+                child = node.children[part] = _CacheNode(part, node)
+            node = child
+        if node.listing is not None:
+            self.total_entries -= node.cost
+        node.key = cache_key
+        node.listing = listing
+        node.cost = len(listing) + 1
+        node.expires = time.monotonic() + self.ttl
+        self.total_entries += node.cost
+        self._lru[cache_key] = node
+        self._lru.move_to_end(cache_key)
+        self._evict(keep=node)
+
+    def get(self, cache_key, default=None):
+        node = self._lru.get(cache_key)
+        if node is None:
+            return default
+        if node.expires <= time.monotonic():
+            self._drop(node)
+            self._prune(node)
+            return default
+        self._lru.move_to_end(cache_key)
+        return node.listing
+
+    def setdefault(self, cache_key, listing):
+        existing = self.get(cache_key)
+        if existing is not None:
+            return existing
+        self[cache_key] = listing
+        return listing
+
+    def pop(self, cache_key, default=None):
+        node = self._lru.get(cache_key)
+        if node is None:
+            return default
+        listing = node.listing
+        self._drop(node)
+        self._prune(node)
+        return listing
+
+    def clear(self):
+        self._root = _CacheNode("", None)
+        self._lru.clear()
+        self.total_entries = 0
+
+    def _find(self, cache_key):
+        node = self._root
+        for part in split_cache_key(cache_key):
+            node = node.children.get(part)
+            if node is None:
+                return None
+        return node
+
+    def keys_under(self, cache_key):
+        """列出该目录（含自身）及其下所有已缓存且未过期的目录键"""
+        node = self._find(cache_key)
+        if node is None:
+            return []
+        now = time.monotonic()
+        return [n.key for n in self._walk(node) if n.listing is not None and n.expires > now]
+
+    def pop_subtree(self, cache_key):
+        """移除该目录（含自身）及其下所有缓存，返回被移除的键"""
+        node = self._find(cache_key)
+        if node is None:
+            return []
+        removed = []
+        for n in self._walk(node):
+            if n.listing is not None:
+                removed.append(n.key)
+                self._drop(n)
+        # 子节点已全部清空，直接摘掉整个分支
+        node.children = {}
+        self._prune(node)
+        return removed
+
+    def _walk(self, node):
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            yield node
+            stack.extend(node.children.values())
+
+    def _drop(self, node):
+        self._lru.pop(node.key, None)
+        self.total_entries -= node.cost
+        node.listing = None
+        node.key = None
+        node.cost = 0
+
+    def _prune(self, node):
+        """自下而上移除既没有缓存也没有子节点的空节点"""
+        while node.parent is not None and node.listing is None and not node.children:
+            if node.parent.children.get(node.name) is node:
+                del node.parent.children[node.name]
+            node = node.parent
+
+    def _evict(self, keep=None):
+        while self.total_entries > self.max_entries and self._lru:
+            cache_key, node = next(iter(self._lru.items()))
+            if node is keep:
+                # 单个目录本身就超过上限时仍保留它（此时它是唯一的缓存）
+                if len(self._lru) == 1:
+                    break
+                self._lru.move_to_end(cache_key)
+                continue
+            self._drop(node)
+            self._prune(node)
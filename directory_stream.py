@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+流式目录列表
+SMB2/3 下逐个 QUERY_DIRECTORY 响应解析目录项，每收到一批就追加到列表任务中，
+前端通过游标轮询增量取回，超大目录在第一个往返后即可显示首批条目；
+离开目录时可取消，未读完的目录不会写入缓存
+"""
+
+import logging
+import ntpath
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from impacket import smb, smb3
+from impacket.nt_errors import STATUS_NO_MORE_FILES
+from impacket.smbconnection import SessionError
+from impacket.smb3structs import (
+    FILE_DIRECTORY_FILE,
+    FILE_FULL_DIRECTORY_INFORMATION,
+    FILE_OPEN,
+    FILE_READ_ATTRIBUTES,
+    FILE_READ_DATA,
+    FILE_SHARE_DELETE,
+    FILE_SHARE_READ,
+    FILE_SHARE_WRITE,
+    FILE_SYNCHRONOUS_IO_NONALERT,
+)
+
+from directory_cache import DirectoryListing
+
+logger = logging.getLogger(__name__)
+
+STREAM_RUNNING = "running"
+STREAM_COMPLETED = "completed"
+STREAM_FAILED = "failed"
+STREAM_CANCELLED = "cancelled"
+
+# 与 listPath 相同的单次 QUERY_DIRECTORY 输出缓冲区大小
+QUERY_BUFFER_SIZE = 65535
+
+
+def open_directory(smb_connection, tree_id, dir_path):
+    """在树连接上打开目录句柄（SMB2/3）"""
+    try:
+        return smb_connection.getSMBServer().create(
+            tree_id,
+            ntpath.normpath(dir_path).lstrip("\\") if dir_path else "",
+            FILE_READ_ATTRIBUTES | FILE_READ_DATA,
+            FILE_SHARE_READ | FILE_SHARE_WRITE | FILE_SHARE_DELETE,
+            FILE_DIRECTORY_FILE | FILE_SYNCHRONOUS_IO_NONALERT,
+            FILE_OPEN,
+            0,
+        )
+    except smb3.SessionError as e:
+        raise SessionError(e.get_error_code(), e.get_error_packet())
+
+
+def query_directory_batches(smb_connection, tree_id, file_id, pattern="*", buffer_size=QUERY_BUFFER_SIZE):
+    """
+    逐个 QUERY_DIRECTORY 响应生成目录项
+
+    Yields:
+        list: 一个响应中的 SharedFile 列表（与 listPath 的返回格式相同）
+    """
+    server = smb_connection.getSMBServer()
+    while True:
+        try:
+            data = server.queryDirectory(
+                tree_id,
+                file_id,
+                pattern,
+                maxBufferSize=buffer_size,
+                informationClass=FILE_FULL_DIRECTORY_INFORMATION,
+            )
+        except smb3.SessionError as e:
+            if e.get_error_code() == STATUS_NO_MORE_FILES:
+                return
+            raise SessionError(e.get_error_code(), e.get_error_packet())
+
+        files = []
+        next_offset = 1
+        while next_offset != 0:
+            info = smb.SMBFindFileFullDirectoryInfo(smb.SMB.FLAGS2_UNICODE)
+            info.fromString(data)
+            name = info["FileName"].decode("utf-16le")
+            files.append(
+                smb.SharedFile(
+                    info["CreationTime"],
+                    info["LastAccessTime"],
+                    info["LastChangeTime"],
+                    info["EndOfFile"],
+                    info["AllocationSize"],
+                    info["ExtFileAttributes"],
+                    name,
+                    name,
+                )
+            )
+            next_offset = info["NextEntryOffset"]
+            data = data[next_offset:]
+        yield files
+
+
+class DirectoryStream:
+    """一次流式列目录任务，目录项按到达顺序累积，可按序号增量读取"""
+
+    def __init__(self, path):
+        self.id = uuid.uuid4().hex
+        self.path = path
+        self.state = STREAM_RUNNING
+        self.error = None
+        self.batches = 0
+        self.files = []
+        self.created = time.time()
+        self.finished = None
+        self._cancel_event = threading.Event()
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self):
+        return self._cancel_event.is_set()
+
+    def cancel(self):
+        self._cancel_event.set()
+
+    def add_batch(self, files):
+        with self._lock:
+            self.batches += 1
+            self.files.extend(f for f in files if f.get_longname() not in (".", ".."))
+
+    def to_dict(self, since=0, limit=None):
+        """返回状态和 [since, since+limit) 范围内的目录项，limit 为None时返回全部新条目"""
+        with self._lock:
+            since = max(int(since or 0), 0)
+            end = len(self.files) if limit is None else min(since + max(int(limit), 0), len(self.files))
+            files = self.files[since:end]
+            result = {
+                "id": self.id,
+                "path": self.path,
+                "state": self.state,
+                "error": self.error,
+                "batches": self.batches,
+                "total": len(self.files),
+                "next": max(end, since),
+                "created": self.created,
+                "finished": self.finished,
+            }
+        # 只为本次返回的条目构造字典
+        result["files"] = DirectoryListing.from_shared_files(files).rows() if files else []
+        return result
+
+
+class DirectoryStreamManager:
+    """
+    流式列目录调度器
+
+    Args:
+        smb_handler (SMBHandler): 执行实际列目录的SMB处理器
+        max_streams (int): 同时进行的列目录数量上限
+        keep_finished (int): 最多保留的已结束任务数
+    """
+
+    def __init__(self, smb_handler, max_streams=2, keep_finished=4):
+        self.smb_handler = smb_handler
+        self.keep_finished = keep_finished
+        self.streams = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(
+            max_workers=max(int(max_streams), 1), thread_name_prefix="smb-list-stream"
+        )
+
+    def start(self, path):
+        """排队一次流式列目录，返回任务ID（同一时间只浏览一个目录，之前未完成的任务会被取消）"""
+        self.cancel_all()
+        stream = DirectoryStream(path)
+        with self._lock:
+            self._forget_finished()
+            self.streams[stream.id] = stream
+        logger.info(f"流式列目录入队: {stream.id} {path}")
+        self._executor.submit(self._run, stream)
+        return stream.id
+
+    def _run(self, stream):
+        try:
+            result = self.smb_handler.stream_directory(
+                stream.path,
+                batch_callback=stream.add_batch,
+                is_cancelled=lambda: stream.cancelled,
+            )
+        except Exception as e:
+            result = {"success": False, "error": str(e)}
+
+        with stream._lock:
+            stream.finished = time.time()
+            if stream.cancelled:
+                stream.state = STREAM_CANCELLED
+            elif result.get("success"):
+                stream.state = STREAM_COMPLETED
+            else:
+                stream.state = STREAM_FAILED
+                stream.error = result.get("error")
+        logger.info(
+            f"流式列目录结束: {stream.id} {stream.state}，{stream.batches} 批共 {len(stream.files)} 项"
+        )
+
+    def _forget_finished(self):
+        finished = [s for s in self.streams.values() if s.state != STREAM_RUNNING]
+        finished.sort(key=lambda s: s.created)
+        for stream in finished[: max(len(finished) - self.keep_finished + 1, 0)]:
+            del self.streams[stream.id]
+
+    def get(self, stream_id, since=0, limit=None):
+        with self._lock:
+            stream = self.streams.get(stream_id)
+        return stream.to_dict(since, limit) if stream else None
+
+    def cancel(self, stream_id):
+        with self._lock:
+            stream = self.streams.get(stream_id)
+        if stream is None or stream.state != STREAM_RUNNING:
+            return False
+        stream.cancel()
+        return True
+
+    def cancel_all(self):
+        """取消全部进行中的任务（切换目录时调用）"""
+        with self._lock:
+            streams = [s for s in self.streams.values() if s.state == STREAM_RUNNING]
+        for stream in streams:
+            stream.cancel()
+        return len(streams)
+
+    def shutdown(self):
+        self.cancel_all()
+        self._executor.shutdown(wait=False)
@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+目录同步
+比较远程目录树与本地目录（依据 listPath 已返回的大小和修改时间），生成 新增/变化/删除 计划，
+只传输差异部分；同步后的本地文件修改时间设为远程修改时间，下次比较时可直接判定为未变化
+"""
+
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from directory_cache import FILETIME_EPOCH_OFFSET
+from transfer_journal import DOWNLOAD_SUFFIX
+
+logger = logging.getLogger(__name__)
+
+SYNC_NEW = "new"
+SYNC_CHANGED = "changed"
+SYNC_DELETED = "deleted"
+SYNC_AMBIGUOUS = "ambiguous"  # 大小相同但修改时间不同，需要比较内容才能确定
+SYNC_UNCHANGED = "unchanged"
+
+# 同步过程中下载到的临时文件后缀，完成后替换目标文件
+PARTIAL_SUFFIX = ".smbpart"
+
+
+def filetime_to_unix(timestamp):
+    """将 FILETIME 转换为 Unix 时间戳（秒）"""
+    return (timestamp - FILETIME_EPOCH_OFFSET) / 10000000
+
+
+def walk_remote(list_directory, root, workers=2, is_cancelled=None):
+    """
+    并行遍历远程目录树
+
+    Args:
+        list_directory (callable): list_directory(dir_path) -> DirectoryListing
+        root (str): 起始目录（相对共享根目录）
+        workers (int): 并行列目录的线程数
+        is_cancelled (callable): 返回True时停止发起新的列目录
+
+    Returns:
+        tuple: (files, directories)，files 为 {相对路径: (大小, Unix修改时间)}，
+        directories 为相对路径集合；相对路径以反斜杠分隔，相对于 root
+    """
+    files = {}
+    directories = set()
+    state = {"pending": 0, "error": None}
+    condition = threading.Condition()
+    executor = ThreadPoolExecutor(max_workers=max(int(workers), 1), thread_name_prefix="smb-sync-walk")
+
+    def _submit(relative):
+        with condition:
+            state["pending"] += 1
+        executor.submit(_walk, relative)
+
+    def _walk(relative):
+        try:
+            if is_cancelled and is_cancelled():
+                return
+            dir_path = "\\".join(part for part in (root, relative) if part)
+            listing = list_directory(dir_path)
+            for i, name in enumerate(listing.names):
+                path = f"{relative}\\{name}" if relative else name
+                if listing.is_directory(i):
+                    with condition:
+                        directories.add(path)
+                    _submit(path)
+                else:
+                    with condition:
+                        files[path] = (listing.sizes[i], filetime_to_unix(listing.mtimes[i]))
+        except Exception as e:
+            with condition:
+                if state["error"] is None:
+                    state["error"] = f"列出目录失败 {relative or root}: {e}"
+        finally:
+            with condition:
+                state["pending"] -= 1
+                condition.notify_all()
+
+    try:
+        _submit("")
+        with condition:
+            while state["pending"]:
+                condition.wait()
+    finally:
+        executor.shutdown(wait=False)
+
+    if state["error"]:
+        # 任何目录列出失败都不能生成计划，否则其中的本地文件会被误判为需要删除
+        raise RuntimeError(state["error"])
+    return files, directories
+
+
+def scan_local(local_dir):
+    """
+    遍历本地目录
+
+    Returns:
+        tuple: (files, directories)，files 为 {相对路径: (大小, 修改时间)}，路径以反斜杠分隔
+    """
+    files = {}
+    directories = set()
+    if not os.path.isdir(local_dir):
+        return files, directories
+    for current, dir_names, file_names in os.walk(local_dir):
+        relative = os.path.relpath(current, local_dir)
+        prefix = "" if relative == "." else relative.replace(os.sep, "\\") + "\\"
+        for name in dir_names:
+            directories.add(prefix + name)
+        for name in file_names:
+            if name.endswith((PARTIAL_SUFFIX, DOWNLOAD_SUFFIX)):
+                continue
+            try:
+                stat = os.stat(os.path.join(current, name))
+            except OSError:
+                continue
+            files[prefix + name] = (stat.st_size, stat.st_mtime)
+    return files, directories
+
+
+def classify(remote, local, mtime_tolerance=2):
+    """
+    比较单个文件
+
+    Args:
+        remote (tuple): (大小, Unix修改时间)
+        local (tuple): (大小, Unix修改时间)，本地不存在时为None
+        mtime_tolerance (float): 允许的修改时间误差（秒），FAT 等文件系统精度为 2 秒
+
+    Returns:
+        str: SYNC_NEW / SYNC_CHANGED / SYNC_AMBIGUOUS / SYNC_UNCHANGED
+    """
+    if local is None:
+        return SYNC_NEW
+    if remote[0] != local[0]:
+        return SYNC_CHANGED
+    if abs(remote[1] - local[1]) <= mtime_tolerance:
+        return SYNC_UNCHANGED
+    return SYNC_AMBIGUOUS
+
+
+def build_plan(remote_files, local_files, remote_dirs=(), local_dirs=(), delete=False, mtime_tolerance=2):
+    """
+    生成同步计划（路径比较不区分大小写）
+
+    Returns:
+        dict: new/changed/ambiguous/deleted 为条目列表（path、local、size、mtime），
+        deleted_dirs 为需要删除的本地目录（从深到浅），unchanged 为未变化的文件数，
+        bytes 为需要下载的字节数（ambiguous 按需要下载计）
+    """
+    local_by_key = {path.lower(): (path, info) for path, info in local_files.items()}
+    plan = {
+        SYNC_NEW: [],
+        SYNC_CHANGED: [],
+        SYNC_AMBIGUOUS: [],
+        SYNC_DELETED: [],
+        "deleted_dirs": [],
+        SYNC_UNCHANGED: 0,
+        "bytes": 0,
+    }
+    for path in sorted(remote_files):
+        size, mtime = remote_files[path]
+        local_path, local = local_by_key.pop(path.lower(), (path, None))
+        state = classify((size, mtime), local, mtime_tolerance)
+        if state == SYNC_UNCHANGED:
+            plan[SYNC_UNCHANGED] += 1
+            continue
+        # local 为本地已有文件的实际路径（大小写可能与远程不同）
+        plan[state].append({"path": path, "local": local_path, "size": size, "mtime": mtime})
+        plan["bytes"] += size
+
+    if delete:
+        plan[SYNC_DELETED] = [
+            {"path": path, "local": path, "size": info[0], "mtime": info[1]}
+            for path, info in sorted(local_by_key.values())
+        ]
+        remote_dir_keys = {path.lower() for path in remote_dirs}
+        plan["deleted_dirs"] = sorted(
+            (path for path in local_dirs if path.lower() not in remote_dir_keys),
+            key=lambda path: path.count("\\"),
+            reverse=True,
+        )
+    return plan
+
+
+def summarize_plan(plan, limit=200):
+    """计划摘要（供前端预览），每类最多列出 limit 项"""
+    return {
+        "new": len(plan[SYNC_NEW]),
+        "changed": len(plan[SYNC_CHANGED]),
+        "ambiguous": len(plan[SYNC_AMBIGUOUS]),
+        "deleted": len(plan[SYNC_DELETED]),
+        "deleted_dirs": len(plan["deleted_dirs"]),
+        "unchanged": plan[SYNC_UNCHANGED],
+        "bytes": plan["bytes"],
+        "items": {
+            state: [item["path"] for item in plan[state][:limit]]
+            for state in (SYNC_NEW, SYNC_CHANGED, SYNC_AMBIGUOUS, SYNC_DELETED)
+        },
+    }
@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+持久化目录缓存
+将目录列表按 服务器+共享+路径 保存到本地SQLite数据库，重启或重新连接后可直接渲染已知目录
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+from array import array
+
+from directory_cache import DirectoryListing
+
+logger = logging.getLogger(__name__)
+
+SCHEMA_VERSION = 1
+
+
+class PersistentDirectoryCache:
+    """
+    基于SQLite的目录列表缓存
+
+    Args:
+        db_path (str): 数据库文件路径，所在目录不存在时自动创建
+        max_entries (int): 最多保存的目录数，超出时删除最早获取的条目
+    """
+
+    def __init__(self, db_path, max_entries=5000):
+        self.db_path = str(db_path)
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._writes = 0
+
+        directory = os.path.dirname(self.db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        # 连接在js_api的多个线程间共享，访问统一由 _lock 串行化
+        self._db = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        version = self._db.execute("PRAGMA user_version").fetchone()[0]
+        if version != SCHEMA_VERSION:
+            self._db.execute("DROP TABLE IF EXISTS directories")
+            self._db.execute(f"PRAGMA user_version={SCHEMA_VERSION}")
+        self._db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS directories (
+                scope TEXT NOT NULL,
+                cache_key TEXT NOT NULL,
+                fetched_at REAL NOT NULL,
+                dir_mtime INTEGER,
+                names TEXT NOT NULL,
+                sizes BLOB NOT NULL,
+                flags BLOB NOT NULL,
+                mtimes BLOB NOT NULL,
+                attributes BLOB NOT NULL,
+                share_types TEXT,
+                PRIMARY KEY (scope, cache_key)
+            )
+            """
+        )
+        self._db.execute(
+            "CREATE INDEX IF NOT EXISTS idx_directories_fetched ON directories (fetched_at)"
+        )
+        self._db.commit()
+
+    def get(self, scope, cache_key):
+        """读取目录列表，不存在时返回None"""
+        try:
+            with self._lock:
+                row = self._db.execute(
+                    "SELECT fetched_at, dir_mtime, names, sizes, flags, mtimes, attributes, share_types "
+                    "FROM directories WHERE scope = ? AND cache_key = ?",
+                    (scope, cache_key),
+                ).fetchone()
+        except sqlite3.Error as e:
+            logger.warning(f"读取持久缓存失败: {e}")
+            return None
+        if row is None:
+            return None
+
+        fetched_at, dir_mtime, names, sizes, flags, mtimes, attributes, share_types = row
+        try:
+            return DirectoryListing(
+                json.loads(names),
+                _array("Q", sizes),
+                _array("B", flags),
+                _array("q", mtimes),
+                _array("I", attributes),
+                share_types=(
+                    [tuple(item) for item in json.loads(share_types)]
+                    if share_types is not None
+                    else None
+                ),
+                fetched_at=fetched_at,
+                dir_mtime=dir_mtime,
+            )
+        except (ValueError, TypeError) as e:
+            logger.warning(f"持久缓存条目损坏，已丢弃 {cache_key}: {e}")
+            self.delete(scope, cache_key)
+            return None
+
+    def put(self, scope, cache_key, listing):
+        """保存（覆盖）目录列表"""
+        try:
+            with self._lock:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO directories "
+                    "(scope, cache_key, fetched_at, dir_mtime, names, sizes, flags, mtimes, attributes, share_types) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        scope,
+                        cache_key,
+                        listing.fetched_at,
+                        listing.dir_mtime,
+                        json.dumps(listing.names, ensure_ascii=False),
+                        listing.sizes.tobytes(),
+                        listing.flags.tobytes(),
+                        listing.mtimes.tobytes(),
+                        listing.attributes.tobytes(),
+                        (
+                            json.dumps(listing.share_types, ensure_ascii=False)
+                            if listing.share_types is not None
+                            else None
+                        ),
+                    ),
+                )
+                self._writes += 1
+                if self._writes % 100 == 0:
+                    self._trim_locked()
+                self._db.commit()
+        except sqlite3.Error as e:
+            logger.warning(f"写入持久缓存失败: {e}")
+
+    def touch(self, scope, cache_key, fetched_at):
+        """目录确认未变化时只更新获取时间"""
+        try:
+            with self._lock:
+                self._db.execute(
+                    "UPDATE directories SET fetched_at = ? WHERE scope = ? AND cache_key = ?",
+                    (fetched_at, scope, cache_key),
+                )
+                self._db.commit()
+        except sqlite3.Error as e:
+            logger.warning(f"更新持久缓存失败: {e}")
+
+    def delete(self, scope, cache_key):
+        try:
+            with self._lock:
+                self._db.execute(
+                    "DELETE FROM directories WHERE scope = ? AND cache_key = ?",
+                    (scope, cache_key),
+                )
+                self._db.commit()
+        except sqlite3.Error as e:
+            logger.warning(f"删除持久缓存失败: {e}")
+
+    def delete_subtree(self, scope, cache_key):
+        """删除目录及其所有子目录的缓存（缓存键以反斜杠结尾，子目录的键都以它为前缀）"""
+        # "]" 紧接在 "\\" 之后，[key, key[:-1] + "]") 恰好覆盖所有以 key 为前缀的键
+        upper = cache_key[:-1] + "]"
+        try:
+            with self._lock:
+                self._db.execute(
+                    "DELETE FROM directories WHERE scope = ? AND cache_key >= ? AND cache_key < ?",
+                    (scope, cache_key, upper),
+                )
+                self._db.commit()
+        except sqlite3.Error as e:
+            logger.warning(f"删除持久缓存失败: {e}")
+
+    def clear(self, scope=None):
+        """清空指定服务器（默认全部）的缓存"""
+        try:
+            with self._lock:
+                if scope is None:
+                    self._db.execute("DELETE FROM directories")
+                else:
+                    self._db.execute("DELETE FROM directories WHERE scope = ?", (scope,))
+                self._db.commit()
+        except sqlite3.Error as e:
+            logger.warning(f"清空持久缓存失败: {e}")
+
+    def _trim_locked(self):
+        """删除超出 max_entries 的最早条目（调用方需持有 _lock）"""
+        self._db.execute(
+            "DELETE FROM directories WHERE rowid IN ("
+            "SELECT rowid FROM directories ORDER BY fetched_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,),
+        )
+
+    def close(self):
+        with self._lock:
+            try:
+                self._db.close()
+            except sqlite3.Error as e:
+                logger.debug(f"关闭持久缓存失败: {e}")
+
+
+def _array(typecode, data):
+    values = array(typecode)
+    values.frombytes(data)
+    return values
@@ -0,0 +1,478 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+文件名搜索索引
+把共享中的文件名保存到本地SQLite（FTS5 trigram 全文索引，不可用时回退到LIKE），
+浏览目录时增量更新，也可在后台爬取整个共享；爬取队列保存在数据库中，中断后可继续
+"""
+
+import logging
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from directory_cache import format_filetime
+
+logger = logging.getLogger(__name__)
+
+SCHEMA_VERSION = 1
+
+CRAWL_RUNNING = "running"
+CRAWL_STOPPED = "stopped"
+CRAWL_COMPLETED = "completed"
+CRAWL_LIMITED = "limited"
+CRAWL_FAILED = "failed"
+
+
+def _join(dir_path, name):
+    return f"{dir_path}\\{name}" if dir_path else name
+
+
+def _normalize_dir(dir_path):
+    return (dir_path or "").replace("/", "\\").strip("\\")
+
+
+class SearchIndex:
+    """
+    基于SQLite的文件名索引
+
+    Args:
+        db_path (str): 数据库文件路径，所在目录不存在时自动创建
+    """
+
+    def __init__(self, db_path):
+        self.db_path = str(db_path)
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(self.db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        # 连接在多个线程间共享，访问统一由 _lock 串行化
+        self._db = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        version = self._db.execute("PRAGMA user_version").fetchone()[0]
+        if version != SCHEMA_VERSION:
+            for table in ("entries_fts", "entries", "crawl_queue", "crawls"):
+                self._db.execute(f"DROP TABLE IF EXISTS {table}")
+            self._db.execute(f"PRAGMA user_version={SCHEMA_VERSION}")
+        self._db.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS entries (
+                id INTEGER PRIMARY KEY,
+                scope TEXT NOT NULL,
+                share_key TEXT NOT NULL,
+                share_name TEXT NOT NULL,
+                dir_key TEXT NOT NULL,
+                dir_path TEXT NOT NULL,
+                name TEXT NOT NULL,
+                name_key TEXT NOT NULL,
+                is_dir INTEGER NOT NULL,
+                size INTEGER NOT NULL,
+                mtime INTEGER NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_entries_dir ON entries (scope, share_key, dir_key);
+            CREATE INDEX IF NOT EXISTS idx_entries_name ON entries (scope, name_key);
+            CREATE TABLE IF NOT EXISTS crawl_queue (
+                scope TEXT NOT NULL,
+                share_key TEXT NOT NULL,
+                dir_key TEXT NOT NULL,
+                dir_path TEXT NOT NULL,
+                depth INTEGER NOT NULL,
+                PRIMARY KEY (scope, share_key, dir_key)
+            );
+            CREATE TABLE IF NOT EXISTS crawls (
+                scope TEXT NOT NULL,
+                share_key TEXT NOT NULL,
+                share_name TEXT NOT NULL,
+                state TEXT NOT NULL,
+                started_at REAL,
+                finished_at REAL,
+                directories INTEGER NOT NULL DEFAULT 0,
+                errors INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (scope, share_key)
+            );
+            """
+        )
+        self.fts = self._create_fts()
+        self._db.commit()
+
+    def _create_fts(self):
+        """创建 trigram 全文索引，SQLite 不支持时返回False（回退到LIKE扫描）"""
+        try:
+            self._db.executescript(
+                """
+                CREATE VIRTUAL TABLE IF NOT EXISTS entries_fts USING fts5(
+                    name_key, content='entries', content_rowid='id', tokenize='trigram'
+                );
+                CREATE TRIGGER IF NOT EXISTS entries_ai AFTER INSERT ON entries BEGIN
+                    INSERT INTO entries_fts (rowid, name_key) VALUES (new.id, new.name_key);
+                END;
+                CREATE TRIGGER IF NOT EXISTS entries_ad AFTER DELETE ON entries BEGIN
+                    INSERT INTO entries_fts (entries_fts, rowid, name_key)
+                    VALUES ('delete', old.id, old.name_key);
+                END;
+                """
+            )
+            return True
+        except sqlite3.Error as e:
+            logger.info(f"SQLite 不支持 FTS5 trigram，搜索回退到LIKE: {e}")
+            return False
+
+    def replace_directory(self, scope, share_name, dir_path, listing):
+        """
+        用新的目录列表替换索引中该目录的直接子项，已消失的子目录连同其下所有条目一并删除
+
+        Args:
+            scope (str): 服务器/用户范围
+            share_name (str): 共享名称
+            dir_path (str): 目录在共享内的相对路径，根目录为空字符串
+            listing (DirectoryListing): 目录列表
+        """
+        dir_path = _normalize_dir(dir_path)
+        dir_key = dir_path.lower()
+        share_key = share_name.lower()
+        rows = [
+            (
+                scope,
+                share_key,
+                share_name,
+                dir_key,
+                dir_path,
+                listing.names[i],
+                listing.names[i].lower(),
+                1 if listing.is_directory(i) else 0,
+                listing.sizes[i],
+                listing.mtimes[i],
+            )
+            for i in range(len(listing))
+        ]
+        subdirectories = {row[6] for row in rows if row[7]}
+        try:
+            with self._lock:
+                previous = self._db.execute(
+                    "SELECT name_key FROM entries "
+                    "WHERE scope = ? AND share_key = ? AND dir_key = ? AND is_dir = 1",
+                    (scope, share_key, dir_key),
+                ).fetchall()
+                for (name_key,) in previous:
+                    if name_key not in subdirectories:
+                        self._delete_subtree_locked(scope, share_key, _join(dir_key, name_key))
+                self._db.execute(
+                    "DELETE FROM entries WHERE scope = ? AND share_key = ? AND dir_key = ?",
+                    (scope, share_key, dir_key),
+                )
+                self._db.executemany(
+                    "INSERT INTO entries "
+                    "(scope, share_key, share_name, dir_key, dir_path, name, name_key, is_dir, size, mtime) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    rows,
+                )
+                self._db.commit()
+        except sqlite3.Error as e:
+            logger.warning(f"更新搜索索引失败: {e}")
+
+    def _delete_subtree_locked(self, scope, share_key, dir_key):
+        # "\\" 的下一个字符是 "]"，用范围条件匹配所有后代目录，可以使用索引
+        self._db.execute(
+            "DELETE FROM entries WHERE scope = ? AND share_key = ? "
+            "AND (dir_key = ? OR (dir_key >= ? AND dir_key < ?))",
+            (scope, share_key, dir_key, dir_key + "\\", dir_key + "]"),
+        )
+
+    def search(self, scope, query, share_name=None, offset=0, limit=50):
+        """
+        按名称子串搜索（不区分大小写）
+
+        Returns:
+            tuple: (匹配总数, 当前页的结果字典列表)
+        """
+        query = (query or "").strip().lower()
+        if not query:
+            return 0, []
+
+        conditions = ["entries.scope = ?"]
+        params = [scope]
+        if share_name:
+            conditions.append("entries.share_key = ?")
+            params.append(share_name.lower())
+
+        if self.fts and len(query) >= 3:
+            source = "entries_fts JOIN entries ON entries.id = entries_fts.rowid"
+            conditions.insert(0, "entries_fts MATCH ?")
+            params.insert(0, '"' + query.replace('"', '""') + '"')
+        else:
+            # trigram 至少需要3个字符，更短的查询直接扫描
+            source = "entries"
+            escaped = query.replace("!", "!!").replace("%", "!%").replace("_", "!_")
+            conditions.append("entries.name_key LIKE ? ESCAPE '!'")
+            params.append(f"%{escaped}%")
+
+        where = " AND ".join(conditions)
+        try:
+            with self._lock:
+                total = self._db.execute(
+                    f"SELECT COUNT(*) FROM {source} WHERE {where}", params
+                ).fetchone()[0]
+                rows = self._db.execute(
+                    f"SELECT entries.share_name, entries.dir_path, entries.name, entries.is_dir, "
+                    f"entries.size, entries.mtime FROM {source} WHERE {where} "
+                    f"ORDER BY entries.is_dir DESC, entries.name_key, entries.dir_key LIMIT ? OFFSET ?",
+                    params + [int(limit), max(int(offset), 0)],
+                ).fetchall()
+        except sqlite3.Error as e:
+            logger.warning(f"搜索索引查询失败: {e}")
+            return 0, []
+
+        return total, [
+            {
+                "share_name": share,
+                "dir_path": dir_path,
+                "path": _join(dir_path, name),
+                "name": name,
+                "is_directory": bool(is_dir),
+                "size": size,
+                "modified_time": format_filetime(mtime),
+            }
+            for share, dir_path, name, is_dir, size, mtime in rows
+        ]
+
+    def count(self, scope, share_name):
+        with self._lock:
+            return self._db.execute(
+                "SELECT COUNT(*) FROM entries WHERE scope = ? AND share_key = ?",
+                (scope, share_name.lower()),
+            ).fetchone()[0]
+
+    def clear_share(self, scope, share_name):
+        """删除共享的全部索引条目和爬取进度"""
+        share_key = share_name.lower()
+        with self._lock:
+            for table in ("entries", "crawl_queue", "crawls"):
+                self._db.execute(
+                    f"DELETE FROM {table} WHERE scope = ? AND share_key = ?", (scope, share_key)
+                )
+            self._db.commit()
+
+    # 爬取队列与状态
+
+    def enqueue(self, scope, share_name, directories):
+        """把 (dir_path, depth) 加入待爬取队列（已在队列中的忽略）"""
+        share_key = share_name.lower()
+        with self._lock:
+            self._db.executemany(
+                "INSERT OR IGNORE INTO crawl_queue (scope, share_key, dir_key, dir_path, depth) "
+                "VALUES (?, ?, ?, ?, ?)",
+                [
+                    (scope, share_key, _normalize_dir(path).lower(), _normalize_dir(path), depth)
+                    for path, depth in directories
+                ],
+            )
+            self._db.commit()
+
+    def pending(self, scope, share_name, exclude, limit):
+        """取出最多 limit 个待爬取目录（浅层优先），exclude 为正在处理的目录"""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT dir_path, depth FROM crawl_queue WHERE scope = ? AND share_key = ? "
+                "ORDER BY depth LIMIT ?",
+                (scope, share_name.lower(), limit + len(exclude)),
+            ).fetchall()
+        return [row for row in rows if row[0].lower() not in exclude][:limit]
+
+    def dequeue(self, scope, share_name, dir_path):
+        with self._lock:
+            self._db.execute(
+                "DELETE FROM crawl_queue WHERE scope = ? AND share_key = ? AND dir_key = ?",
+                (scope, share_name.lower(), _normalize_dir(dir_path).lower()),
+            )
+            self._db.commit()
+
+    def queue_size(self, scope, share_name):
+        with self._lock:
+            return self._db.execute(
+                "SELECT COUNT(*) FROM crawl_queue WHERE scope = ? AND share_key = ?",
+                (scope, share_name.lower()),
+            ).fetchone()[0]
+
+    def get_crawl(self, scope, share_name):
+        with self._lock:
+            row = self._db.execute(
+                "SELECT share_name, state, started_at, finished_at, directories, errors "
+                "FROM crawls WHERE scope = ? AND share_key = ?",
+                (scope, share_name.lower()),
+            ).fetchone()
+        if row is None:
+            return None
+        keys = ("share_name", "state", "started_at", "finished_at", "directories", "errors")
+        return dict(zip(keys, row))
+
+    def save_crawl(self, scope, share_name, **fields):
+        """更新爬取状态（不存在时创建）"""
+        share_key = share_name.lower()
+        with self._lock:
+            self._db.execute(
+                "INSERT OR IGNORE INTO crawls (scope, share_key, share_name, state) VALUES (?, ?, ?, ?)",
+                (scope, share_key, share_name, CRAWL_STOPPED),
+            )
+            if fields:
+                assignments = ", ".join(f"{name} = ?" for name in fields)
+                self._db.execute(
+                    f"UPDATE crawls SET {assignments} WHERE scope = ? AND share_key = ?",
+                    list(fields.values()) + [scope, share_key],
+                )
+            self._db.commit()
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+class ShareCrawler:
+    """
+    在后台遍历一个共享并写入搜索索引
+
+    Args:
+        index (SearchIndex): 搜索索引
+        scope (str): 服务器/用户范围
+        share_name (str): 共享名称
+        list_directory (callable): list_directory(share_name, dir_path) 直接从服务器获取 DirectoryListing
+        workers (int): 同时列目录的线程数
+        max_depth (int): 最大遍历深度（共享根目录为0）
+        max_entries (int): 索引条目数达到该值时停止
+    """
+
+    def __init__(
+        self, index, scope, share_name, list_directory, workers=2, max_depth=32, max_entries=1000000
+    ):
+        self.index = index
+        self.scope = scope
+        self.share_name = share_name
+        self.list_directory = list_directory
+        self.workers = max(int(workers), 1)
+        self.max_depth = max_depth
+        self.max_entries = max_entries
+        self._stop_event = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, restart=False):
+        """开始爬取；上次未完成时从保存的队列继续，restart 为True时清空索引重新开始"""
+        if self.running:
+            return
+        crawl = self.index.get_crawl(self.scope, self.share_name)
+        queued = self.index.queue_size(self.scope, self.share_name)
+        if restart or crawl is None or not queued:
+            if restart:
+                self.index.clear_share(self.scope, self.share_name)
+            self.index.enqueue(self.scope, self.share_name, [("", 0)])
+            self.index.save_crawl(
+                self.scope,
+                self.share_name,
+                started_at=time.time(),
+                finished_at=None,
+                directories=0,
+                errors=0,
+            )
+        else:
+            logger.info(f"[索引] 继续上次未完成的爬取: {self.share_name}，剩余 {queued} 个目录")
+        self.index.save_crawl(self.scope, self.share_name, state=CRAWL_RUNNING)
+        self._stop_event.clear()
+        self._thread = threading.Thread(
+            target=self._run, name=f"smb-index-{self.share_name}", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        self._stop_event.set()
+
+    def _run(self):
+        crawl = self.index.get_crawl(self.scope, self.share_name) or {}
+        directories = crawl.get("directories") or 0
+        errors = crawl.get("errors") or 0
+        entries = self.index.count(self.scope, self.share_name)
+        saved_directories = directories
+        state = CRAWL_COMPLETED
+        in_flight = {}  # Future -> (dir_path, depth)
+        logger.info(f"[索引] 开始爬取共享: {self.share_name}")
+
+        try:
+            with ThreadPoolExecutor(
+                max_workers=self.workers, thread_name_prefix="smb-index-worker"
+            ) as executor:
+                while True:
+                    if self._stop_event.is_set():
+                        state = CRAWL_STOPPED
+                        break
+                    if entries >= self.max_entries:
+                        state = CRAWL_LIMITED
+                        break
+
+                    busy = {path.lower() for path, _ in in_flight.values()}
+                    for dir_path, depth in self.index.pending(
+                        self.scope, self.share_name, busy, self.workers - len(in_flight)
+                    ):
+                        future = executor.submit(self.list_directory, self.share_name, dir_path)
+                        in_flight[future] = (dir_path, depth)
+                    if not in_flight:
+                        break
+
+                    done, _ = wait(list(in_flight), timeout=1.0, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        dir_path, depth = in_flight.pop(future)
+                        try:
+                            listing = future.result()
+                        except Exception as e:
+                            if self._stop_event.is_set():
+                                # 断开连接导致的失败，目录留在队列中下次继续
+                                continue
+                            # 无权限等错误只跳过该目录
+                            logger.debug(f"[索引] 列出目录失败 {self.share_name}\\{dir_path}: {e}")
+                            errors += 1
+                        else:
+                            self.index.replace_directory(
+                                self.scope, self.share_name, dir_path, listing
+                            )
+                            entries += len(listing)
+                            if depth < self.max_depth:
+                                self.index.enqueue(
+                                    self.scope,
+                                    self.share_name,
+                                    [
+                                        (_join(dir_path, name), depth + 1)
+                                        for name in listing.subdirectories()
+                                    ],
+                                )
+                        directories += 1
+                        self.index.dequeue(self.scope, self.share_name, dir_path)
+
+                    if directories - saved_directories >= 50:
+                        saved_directories = directories
+                        self.index.save_crawl(
+                            self.scope, self.share_name, directories=directories, errors=errors
+                        )
+
+                # 停止时未完成的目录仍留在队列中，下次继续
+                for future in in_flight:
+                    future.cancel()
+        except Exception as e:
+            logger.warning(f"[索引] 爬取中断 {self.share_name}: {e}")
+            state = CRAWL_FAILED
+
+        self.index.save_crawl(
+            self.scope,
+            self.share_name,
+            state=state,
+            directories=directories,
+            errors=errors,
+            finished_at=time.time(),
+        )
+        logger.info(
+            f"[索引] 爬取结束 {self.share_name}: {state}，目录 {directories} 个，条目约 {entries} 个"
+        )
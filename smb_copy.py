@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+服务端复制、重命名与删除
+通过 FSCTL_SRV_REQUEST_RESUME_KEY + FSCTL_SRV_COPYCHUNK_WRITE 让服务器在本地完成文件复制，
+数据不经过客户端；仅支持SMB2/3，服务器不支持时由调用方回退到下载再上传。
+重命名和删除直接在已缓存的树连接上完成（SET_INFO / DELETE_ON_CLOSE），不必每次重新 connectTree
+"""
+
+import logging
+from functools import wraps
+from impacket import nt_errors, smb3
+from impacket.smbconnection import SessionError
+from impacket.smb3structs import (
+    DELETE,
+    FILE_DELETE_ON_CLOSE,
+    FILE_DIRECTORY_FILE,
+    FILE_NON_DIRECTORY_FILE,
+    FILE_OPEN,
+    FILE_OPEN_REPARSE_POINT,
+    FILE_READ_ATTRIBUTES,
+    FILE_RENAME_INFORMATION_TYPE_2,
+    FILE_SHARE_DELETE,
+    FILE_SHARE_READ,
+    FILE_SHARE_WRITE,
+    FILE_SYNCHRONOUS_IO_NONALERT,
+    FSCTL_SRV_COPYCHUNK_WRITE,
+    FSCTL_SRV_REQUEST_RESUME_KEY,
+    SMB2_0_INFO_FILE,
+    SMB2_0_IOCTL_IS_FSCTL,
+    SMB2_FILE_RENAME_INFO,
+    SRV_COPYCHUNK,
+    SRV_COPYCHUNK_COPY,
+    SRV_COPYCHUNK_RESPONSE,
+    SRV_REQUEST_RESUME_KEY,
+)
+
+logger = logging.getLogger(__name__)
+
+# MS-SMB2 建议的服务器默认上限：每个请求16块，每块1MB，每个请求共16MB
+DEFAULT_CHUNK_COUNT = 16
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+MIN_CHUNK_SIZE = 64 * 1024
+
+# 出现这些错误时认为服务器不支持服务端复制
+UNSUPPORTED_ERRORS = (
+    nt_errors.STATUS_NOT_SUPPORTED,
+    nt_errors.STATUS_INVALID_DEVICE_REQUEST,
+    nt_errors.STATUS_NOT_IMPLEMENTED,
+)
+
+
+class ServerCopyUnsupported(Exception):
+    """服务器不支持服务端复制（或当前文件无法使用）"""
+
+
+def _translate_errors(func):
+    """与SMBConnection一致，将底层smb3.SessionError转换为smbconnection.SessionError"""
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        try:
+            return func(*args, **kwargs)
+        except smb3.SessionError as e:
+            raise SessionError(e.get_error_code(), e.get_error_packet())
+
+    return wrapper
+
+
+@_translate_errors
+def request_resume_key(smb, tree_id, file_id):
+    """获取源文件的 resume key（服务器用来定位复制源的24字节令牌）"""
+    response = smb.getSMBServer().ioctl(
+        tree_id,
+        file_id,
+        FSCTL_SRV_REQUEST_RESUME_KEY,
+        flags=SMB2_0_IOCTL_IS_FSCTL,
+        maxOutputResponse=32,
+    )
+    return SRV_REQUEST_RESUME_KEY(response)["ResumeKey"]
+
+
+def source_resume_key(smb, tree_id, source_id):
+    """获取复制源的 resume key，服务器不支持时抛出 ServerCopyUnsupported（应在创建目标之前调用）"""
+    try:
+        return request_resume_key(smb, tree_id, source_id)
+    except SessionError as e:
+        if e.getErrorCode() in UNSUPPORTED_ERRORS:
+            raise ServerCopyUnsupported(str(e))
+        raise
+
+
+@_translate_errors
+def server_side_copy(
+    smb,
+    tree_id,
+    source_id,
+    target_id,
+    size,
+    chunk_size=DEFAULT_CHUNK_SIZE,
+    chunk_count=DEFAULT_CHUNK_COUNT,
+    progress_callback=None,
+    resume_key=None,
+):
+    """
+    在服务器上将源句柄的 [0, size) 复制到目标句柄
+
+    Args:
+        smb (SMBConnection): 已登录的SMB2/3连接
+        tree_id (int): 源和目标所在的树连接（同一共享）
+        source_id: 源文件句柄（需要读权限）
+        target_id: 目标文件句柄（需要写权限）
+        size (int): 复制的字节数
+        chunk_size (int): 每块字节数，服务器拒绝时自动减半
+        chunk_count (int): 每个请求的块数
+        progress_callback (callable): 每个请求完成后调用，参数为本次复制的字节数
+        resume_key (bytes): 已通过 source_resume_key 获取的源令牌，为None时在此获取
+
+    Returns:
+        int: 复制的字节数；服务器不支持时抛出 ServerCopyUnsupported
+    """
+    server = smb.getSMBServer()
+    if resume_key is None:
+        resume_key = source_resume_key(smb, tree_id, source_id)
+
+    offset = 0
+    while offset < size:
+        chunks = b""
+        count = 0
+        request_end = offset
+        while count < chunk_count and request_end < size:
+            chunk = SRV_COPYCHUNK()
+            chunk["SourceOffset"] = request_end
+            chunk["TargetOffset"] = request_end
+            chunk["Length"] = min(chunk_size, size - request_end)
+            chunks += chunk.getData()
+            request_end += chunk["Length"]
+            count += 1
+
+        request = SRV_COPYCHUNK_COPY()
+        request["SourceKey"] = resume_key
+        request["ChunkCount"] = count
+        request["Chunks"] = chunks
+        try:
+            response = server.ioctl(
+                tree_id,
+                target_id,
+                FSCTL_SRV_COPYCHUNK_WRITE,
+                flags=SMB2_0_IOCTL_IS_FSCTL,
+                inputBlob=request.getData(),
+                maxOutputResponse=len(SRV_COPYCHUNK_RESPONSE()),
+            )
+        except smb3.SessionError as e:
+            if e.get_error_code() == nt_errors.STATUS_INVALID_PARAMETER and chunk_size > MIN_CHUNK_SIZE:
+                # 超出服务器的块大小/总长度上限，缩小后重试
+                chunk_size //= 2
+                logger.debug(f"服务端复制块大小超出服务器限制，改为 {chunk_size}")
+                continue
+            if e.get_error_code() in UNSUPPORTED_ERRORS:
+                raise ServerCopyUnsupported(str(e))
+            raise
+
+        written = SRV_COPYCHUNK_RESPONSE(response)["TotalBytesWritten"]
+        if written <= 0:
+            raise ServerCopyUnsupported("服务器未复制任何数据")
+        offset += written
+        if progress_callback:
+            progress_callback(written)
+    return offset
+
+
+@_translate_errors
+def rename_path(smb, tree_id, old_path, new_path, replace=False):
+    """
+    在树连接上重命名/移动文件或目录（同一共享内，SMB2/3）
+
+    Args:
+        smb (SMBConnection): 已登录的SMB2/3连接
+        tree_id (int): 共享的树连接
+        old_path (str): 原路径（相对共享根目录）
+        new_path (str): 新路径（相对共享根目录）
+        replace (bool): 目标已存在时是否覆盖
+    """
+    server = smb.getSMBServer()
+    file_id = server.create(
+        tree_id,
+        old_path,
+        DELETE | FILE_READ_ATTRIBUTES,
+        FILE_SHARE_READ | FILE_SHARE_WRITE | FILE_SHARE_DELETE,
+        FILE_OPEN_REPARSE_POINT | FILE_SYNCHRONOUS_IO_NONALERT,
+        FILE_OPEN,
+        0,
+    )
+    try:
+        request = FILE_RENAME_INFORMATION_TYPE_2()
+        request["ReplaceIfExists"] = 1 if replace else 0
+        request["RootDirectory"] = b"\x00" * 8
+        request["FileNameLength"] = len(new_path) * 2
+        request["FileName"] = new_path.encode("utf-16le")
+        server.setInfo(
+            tree_id,
+            file_id,
+            request,
+            infoType=SMB2_0_INFO_FILE,
+            fileInfoClass=SMB2_FILE_RENAME_INFO,
+        )
+    finally:
+        server.close(tree_id, file_id)
+
+
+@_translate_errors
+def delete_path(smb, tree_id, path, is_directory=False):
+    """
+    在树连接上删除文件或空目录（SMB2/3，以 DELETE_ON_CLOSE 打开后关闭）
+
+    Args:
+        smb (SMBConnection): 已登录的SMB2/3连接
+        tree_id (int): 共享的树连接
+        path (str): 路径（相对共享根目录）
+        is_directory (bool): 是否为目录（目录必须已为空）
+    """
+    server = smb.getSMBServer()
+    file_id = server.create(
+        tree_id,
+        path,
+        DELETE | FILE_READ_ATTRIBUTES,
+        FILE_SHARE_READ | FILE_SHARE_WRITE | FILE_SHARE_DELETE,
+        (FILE_DIRECTORY_FILE if is_directory else FILE_NON_DIRECTORY_FILE) | FILE_DELETE_ON_CLOSE,
+        FILE_OPEN,
+        0,
+    )
+    server.close(tree_id, file_id)
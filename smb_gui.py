@@ -16,7 +16,15 @@ from pathlib import Path
 # 添加当前目录到Python路径
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
+from content_cache import ContentCache
+from content_search import ContentSearchManager
+from directory_stream import DirectoryStreamManager
+from persistent_cache import PersistentDirectoryCache
+from search_index import SearchIndex
 from smb_handler import SMBHandler
+from stream_server import StreamServer
+from thumbnails import ThumbnailService, thumbnail_key
+from transfer_manager import TransferManager
 
 # 配置日志
 logging.basicConfig(
@@ -30,6 +38,124 @@ class SMBApi:
 
     def __init__(self):
         self.smb_handler = None
+        self.transfer_manager = None
+        self.transfer_concurrency = 3  # 同时进行的后台传输数
+        self.content_search = None
+        self.directory_streams = None
+        self.persistent_cache_enabled = True  # 目录列表持久化到本地，重启后可直接显示
+        self.persistent_cache = None
+        self.content_cache_enabled = True  # 预览和下载过的小文件内容缓存在内存/磁盘，重复打开不再访问服务器
+        self.content_cache_max_bytes = 64 * 1024 * 1024
+        self.content_cache_disk_bytes = 512 * 1024 * 1024
+        self.content_cache = None
+        self.stream_server_enabled = True  # 通过本地HTTP服务为预览提供文件流
+        self.stream_server = None
+        self.thumbnails_enabled = True  # 为目录列表中的图片生成缩略图（需要Pillow）
+        self.thumbnails = None
+        self.search_index_enabled = True  # 浏览和爬取过的文件名保存到本地索引，支持搜索
+        self.search_index = None
+
+    def _get_download_dir(self):
+        """获取（并创建）默认下载目录"""
+        download_dir = Path(__file__).parent / "download"
+        download_dir.mkdir(exist_ok=True)
+        return download_dir
+
+    def _get_persistent_cache(self):
+        """获取（并按需打开）持久化目录缓存，打开失败时仅使用内存缓存"""
+        if not self.persistent_cache_enabled:
+            return None
+        if self.persistent_cache is None:
+            try:
+                self.persistent_cache = PersistentDirectoryCache(
+                    Path(__file__).parent / "cache" / "directory_cache.db"
+                )
+            except Exception as e:
+                logger.warning(f"打开持久化目录缓存失败，仅使用内存缓存: {e}")
+                self.persistent_cache_enabled = False
+        return self.persistent_cache
+
+    def _get_search_index(self):
+        """获取（并按需打开）文件名搜索索引，打开失败时不提供搜索"""
+        if not self.search_index_enabled:
+            return None
+        if self.search_index is None:
+            try:
+                self.search_index = SearchIndex(
+                    Path(__file__).parent / "cache" / "search_index.db"
+                )
+            except Exception as e:
+                logger.warning(f"打开搜索索引失败: {e}")
+                self.search_index_enabled = False
+        return self.search_index
+
+    def _get_content_cache(self):
+        """获取（并按需创建）文件内容缓存，磁盘部分位于 cache/content"""
+        if not self.content_cache_enabled:
+            return None
+        if self.content_cache is None:
+            self.content_cache = ContentCache(
+                max_bytes=self.content_cache_max_bytes,
+                disk_dir=Path(__file__).parent / "cache" / "content",
+                disk_max_bytes=self.content_cache_disk_bytes,
+            )
+        return self.content_cache
+
+    def _get_thumbnails(self):
+        """获取（并按需创建）缩略图服务，未安装Pillow时返回None"""
+        if not self.thumbnails_enabled:
+            return None
+        if self.thumbnails is None:
+            service = ThumbnailService(
+                self._read_for_thumbnail, Path(__file__).parent / "cache" / "thumbnails"
+            )
+            if not service.available:
+                logger.info("未安装Pillow，不生成图片缩略图")
+                service.shutdown()
+                self.thumbnails_enabled = False
+                return None
+            self.thumbnails = service
+        return self.thumbnails
+
+    def _read_for_thumbnail(self, share_name, file_path, offset, length):
+        handler = self.smb_handler
+        if handler is None:
+            raise RuntimeError("未连接到SMB服务器")
+        # 缩略图来源不进入内容缓存，避免挤掉预览常用的内容
+        result = handler.read_file_range(
+            share_name, file_path, offset, length, use_content_cache=False
+        )
+        if not result.get("success"):
+            raise RuntimeError(result.get("error"))
+        return result["data"]
+
+    def _start_stream_server(self):
+        """启动（或复用）本地流式服务，并为新的会话更换访问令牌"""
+        if not self.stream_server_enabled:
+            return
+        try:
+            if self.stream_server is None:
+                self.stream_server = StreamServer(
+                    lambda: self.smb_handler, thumbnails=self._get_thumbnails()
+                )
+                self.stream_server.start()
+            else:
+                self.stream_server.rotate_token()
+        except Exception as e:
+            logger.warning(f"启动本地流式服务失败，预览回退到Base64: {e}")
+            self.stream_server = None
+            self.stream_server_enabled = False
+
+    def _shutdown_transfers(self):
+        if self.transfer_manager:
+            self.transfer_manager.shutdown()
+            self.transfer_manager = None
+        if self.content_search:
+            self.content_search.shutdown()
+            self.content_search = None
+        if self.directory_streams:
+            self.directory_streams.shutdown()
+            self.directory_streams = None
 
     def connect(self, connection_string):
         """使用连接字符串连接SMB服务器"""
@@ -43,7 +169,17 @@ class SMBApi:
 
             # 创建SMB处理器
             logger.info("🎯 [后端API] 创建SMBHandler实例")
-            self.smb_handler = SMBHandler()
+            self._shutdown_transfers()
+            if self.smb_handler:
+                # 已连接时先释放旧连接的会话池、变更监听会话和预取/索引线程
+                logger.info("🎯 [后端API] 断开之前的连接")
+                self.smb_handler.disconnect()
+                self.smb_handler = None
+            self.smb_handler = SMBHandler(
+                persistent_cache=self._get_persistent_cache(),
+                content_cache=self._get_content_cache(),
+                search_index=self._get_search_index(),
+            )
 
             # 尝试连接
             logger.info("🎯 [后端API] 调用smb_handler.connect")
@@ -52,6 +188,12 @@ class SMBApi:
 
             if result["success"]:
                 logger.info("🎯 [后端API] 连接成功")
+                self.transfer_manager = TransferManager(
+                    self.smb_handler, max_workers=self.transfer_concurrency
+                )
+                self.content_search = ContentSearchManager(self.smb_handler)
+                self.directory_streams = DirectoryStreamManager(self.smb_handler)
+                self._start_stream_server()
                 return {"success": True, "message": "连接成功"}
             else:
                 logger.error(f"🎯 [后端API] 连接失败: {result['error']}")
@@ -63,27 +205,48 @@ class SMBApi:
             self.smb_handler = None
             return {"success": False, "error": str(e)}
 
-    def list_files(self, path="\\"):
-        """列出文件和目录"""
+    def list_files(
+        self,
+        path="\\",
+        offset=0,
+        limit=None,
+        sort_key=None,
+        sort_order="asc",
+        name_filter=None,
+    ):
+        """列出文件和目录，传入limit/sort_key/name_filter时返回服务端分页结果"""
         try:
             logger.info("📁 [后端API] list_files 函数被调用")
-            logger.info(f"📁 [后端API] 参数: path={path}")
+            logger.info(
+                f"📁 [后端API] 参数: path={path}, offset={offset}, limit={limit}, sort_key={sort_key}, sort_order={sort_order}, name_filter={name_filter}"
+            )
 
             if not self.smb_handler:
                 logger.error("📁 [后端API] 未连接到SMB服务器")
                 return {"success": False, "error": "未连接到SMB服务器"}
 
-            logger.info("📁 [后端API] 调用smb_handler.list_directory")
-            result = self.smb_handler.list_directory(path)
+            if limit is None and sort_key is None and not name_filter:
+                logger.info("📁 [后端API] 调用smb_handler.list_directory")
+                result = self.smb_handler.list_directory(path)
+            else:
+                logger.info("📁 [后端API] 调用smb_handler.list_directory_page")
+                result = self.smb_handler.list_directory_page(
+                    path, offset, limit, sort_key or "name", sort_order, name_filter
+                )
+
             if result.get("success"):
                 logger.info(
-                    f"📁 [后端API] list_directory 成功，返回 {len(result.get('files', []))} 条记录"
+                    f"📁 [后端API] 列出目录成功，返回 {len(result.get('files', []))} 条记录"
                 )
             else:
-                logger.error(f"📁 [后端API] list_directory 失败: {result.get('error')}")
+                logger.error(f"📁 [后端API] 列出目录失败: {result.get('error')}")
 
             if result["success"]:
-                return {"success": True, "files": result["files"]}
+                response = {"success": True, "files": result["files"]}
+                if "total" in result:
+                    response["total"] = result["total"]
+                    response["offset"] = result["offset"]
+                return response
             else:
                 return {"success": False, "error": result["error"]}
 
@@ -92,13 +255,19 @@ class SMBApi:
             return {"success": False, "error": str(e)}
 
     def download_file(
-        self, share_name, file_path, local_path=None, save_to_download=False
+        self,
+        share_name,
+        file_path,
+        local_path=None,
+        save_to_download=False,
+        offset=0,
+        length=None,
     ):
-        """下载文件"""
+        """下载文件，返回内容时支持 offset/length 范围读取"""
         try:
             logger.info("⬇️ [后端API] download_file 函数被调用")
             logger.info(
-                f"⬇️ [后端API] 参数: share_name={share_name}, file_path={file_path}, local_path={local_path}, save_to_download={save_to_download}"
+                f"⬇️ [后端API] 参数: share_name={share_name}, file_path={file_path}, local_path={local_path}, save_to_download={save_to_download}, offset={offset}, length={length}"
             )
 
             if not self.smb_handler:
@@ -107,12 +276,8 @@ class SMBApi:
 
             # 如果要求保存到download目录
             if save_to_download:
-                import os
-                from pathlib import Path
-
                 # 创建download目录
-                download_dir = Path(__file__).parent / "download"
-                download_dir.mkdir(exist_ok=True)
+                download_dir = self._get_download_dir()
 
                 # 获取文件名
                 file_name = os.path.basename(file_path)
@@ -122,7 +287,11 @@ class SMBApi:
 
             logger.info("⬇️ [后端API] 调用smb_handler.download_file")
             result = self.smb_handler.download_file(
-                share_name, file_path, str(local_path) if local_path else None
+                share_name,
+                file_path,
+                str(local_path) if local_path else None,
+                offset,
+                length,
             )
             logger.info(f"⬇️ [后端API] smb_handler.download_file 返回 (原始): {result}")
 
@@ -154,6 +323,208 @@ class SMBApi:
             logger.error(f"下载文件错误: {str(e)}")
             return {"success": False, "error": str(e)}
 
+    def get_stream_url(self, share_name, file_path, download=False):
+        """获取通过本地流式服务访问远程文件的URL（图片、文本、音视频预览使用）"""
+        try:
+            logger.info("🔗 [后端API] get_stream_url 函数被调用")
+            logger.info(
+                f"🔗 [后端API] 参数: share_name={share_name}, file_path={file_path}, download={download}"
+            )
+
+            if not self.smb_handler:
+                logger.error("🔗 [后端API] 未连接到SMB服务器")
+                return {"success": False, "error": "未连接到SMB服务器"}
+            if not self.stream_server or not self.stream_server.running:
+                return {"success": False, "error": "本地流式服务未启动"}
+
+            url = self.stream_server.url_for(share_name, file_path, download)
+            return {"success": True, "url": url}
+
+        except Exception as e:
+            logger.error(f"获取流式URL错误: {str(e)}")
+            return {"success": False, "error": str(e)}
+
+    def search_files(self, query, share_name=None, offset=0, limit=50):
+        """在本地索引中按文件名搜索，返回分页结果"""
+        try:
+            logger.info("🔍 [后端API] search_files 函数被调用")
+            logger.info(
+                f"🔍 [后端API] 参数: query={query}, share_name={share_name}, offset={offset}, limit={limit}"
+            )
+
+            if not self.smb_handler:
+                return {"success": False, "error": "未连接到SMB服务器"}
+
+            return self.smb_handler.search_files(query, share_name, offset, limit)
+
+        except Exception as e:
+            logger.error(f"搜索错误: {str(e)}")
+            return {"success": False, "error": str(e)}
+
+    def start_indexing(self, share_name, restart=False):
+        """在后台爬取共享建立文件名索引"""
+        try:
+            logger.info("🔍 [后端API] start_indexing 函数被调用")
+            logger.info(f"🔍 [后端API] 参数: share_name={share_name}, restart={restart}")
+
+            if not self.smb_handler:
+                return {"success": False, "error": "未连接到SMB服务器"}
+
+            return self.smb_handler.start_index_crawl(share_name, restart)
+
+        except Exception as e:
+            logger.error(f"启动索引错误: {str(e)}")
+            return {"success": False, "error": str(e)}
+
+    def stop_indexing(self, share_name):
+        """停止爬取（进度保留，下次继续）"""
+        if not self.smb_handler:
+            return {"success": False, "error": "未连接到SMB服务器"}
+        return self.smb_handler.stop_index_crawl(share_name)
+
+    def get_index_status(self, share_name):
+        """获取共享的索引状态"""
+        if not self.smb_handler:
+            return {"success": False, "error": "未连接到SMB服务器"}
+        return self.smb_handler.get_index_status(share_name)
+
+    def start_directory_stream(self, path="\\"):
+        """
+        开始流式列目录，立即返回任务ID，目录项通过 get_directory_stream 增量取回；
+        目录已有可用缓存时返回 cached=True，前端直接使用 list_files
+        """
+        try:
+            logger.info(f"📁 [后端API] start_directory_stream 函数被调用: path={path}")
+
+            if not self.smb_handler or not self.directory_streams:
+                return {"success": False, "error": "未连接到SMB服务器"}
+
+            if self.smb_handler.is_directory_cached(path):
+                self.directory_streams.cancel_all()
+                return {"success": True, "cached": True}
+
+            stream_id = self.directory_streams.start(path)
+            return {"success": True, "cached": False, "stream_id": stream_id}
+
+        except Exception as e:
+            logger.error(f"启动流式列目录错误: {str(e)}")
+            return {"success": False, "error": str(e)}
+
+    def get_directory_stream(self, stream_id, since=0, limit=None):
+        """轮询流式列目录的进度，返回第 since 项起最多 limit 项新到达的目录项"""
+        if not self.directory_streams:
+            return {"success": False, "error": "未连接到SMB服务器"}
+        stream = self.directory_streams.get(stream_id, since, limit)
+        if stream is None:
+            return {"success": False, "error": "列目录任务不存在"}
+        return {"success": True, "stream": stream}
+
+    def cancel_directory_stream(self, stream_id=None):
+        """取消流式列目录（离开目录时调用），不指定ID时取消全部"""
+        if not self.directory_streams:
+            return {"success": False, "error": "未连接到SMB服务器"}
+        if stream_id:
+            return {"success": self.directory_streams.cancel(stream_id)}
+        return {"success": True, "cancelled": self.directory_streams.cancel_all()}
+
+    def start_content_search(
+        self,
+        share_name,
+        dir_path,
+        pattern,
+        regex=False,
+        case_sensitive=False,
+        extensions=None,
+        max_file_size=None,
+    ):
+        """在目录树的文件内容中搜索，立即返回搜索ID，结果通过 get_content_search 增量取回"""
+        try:
+            logger.info("🔎 [后端API] start_content_search 函数被调用")
+            logger.info(
+                f"🔎 [后端API] 参数: share_name={share_name}, dir_path={dir_path}, pattern={pattern!r}, "
+                f"regex={regex}, extensions={extensions}, max_file_size={max_file_size}"
+            )
+
+            if not self.smb_handler or not self.content_search:
+                logger.error("🔎 [后端API] 未连接到SMB服务器")
+                return {"success": False, "error": "未连接到SMB服务器"}
+
+            search_id = self.content_search.start(
+                share_name,
+                dir_path,
+                pattern,
+                regex=regex,
+                case_sensitive=case_sensitive,
+                extensions=extensions,
+                max_file_size=max_file_size,
+            )
+            return {"success": True, "search_id": search_id}
+
+        except ValueError as e:
+            return {"success": False, "error": str(e)}
+        except Exception as e:
+            logger.error(f"启动内容搜索错误: {str(e)}")
+            return {"success": False, "error": str(e)}
+
+    def get_content_search(self, search_id, since=0):
+        """轮询内容搜索的进度，返回第 since 个之后新增的匹配"""
+        if not self.content_search:
+            return {"success": False, "error": "未连接到SMB服务器"}
+        search = self.content_search.get(search_id, since)
+        if search is None:
+            return {"success": False, "error": "搜索不存在"}
+        return {"success": True, "search": search}
+
+    def cancel_content_search(self, search_id):
+        """停止内容搜索，已找到的匹配保留"""
+        if not self.content_search or not self.content_search.cancel(search_id):
+            return {"success": False, "error": "搜索不存在或已结束"}
+        return {"success": True}
+
+    def request_thumbnails(self, share_name, file_paths):
+        """为当前页的图片排队生成缩略图（取消之前页面的任务），返回每个文件的缩略图URL"""
+        try:
+            logger.info("🖼️ [后端API] request_thumbnails 函数被调用")
+            logger.info(
+                f"🖼️ [后端API] 参数: share_name={share_name}, 文件数={len(file_paths or [])}"
+            )
+
+            if not self.smb_handler:
+                return {"success": False, "error": "未连接到SMB服务器"}
+            thumbnails = self._get_thumbnails()
+            if not thumbnails or not self.stream_server or not self.stream_server.running:
+                return {"success": False, "error": "缩略图不可用"}
+
+            items = []
+            urls = {}
+            for file_path in file_paths or []:
+                identity = self.smb_handler.get_file_identity(share_name, file_path)
+                if not identity.get("success"):
+                    continue
+                key = thumbnail_key(
+                    identity["scope"],
+                    share_name,
+                    file_path,
+                    identity["size"],
+                    identity["mtime"],
+                )
+                items.append((key, share_name, file_path, identity["size"]))
+                urls[file_path] = self.stream_server.thumbnail_url(key)
+
+            queued = thumbnails.request(items)
+            logger.info(f"🖼️ [后端API] 缩略图 {len(items)} 个，新排队 {queued} 个")
+            return {"success": True, "urls": urls}
+
+        except Exception as e:
+            logger.error(f"请求缩略图错误: {str(e)}")
+            return {"success": False, "error": str(e)}
+
+    def cancel_thumbnails(self):
+        """离开当前页面时取消尚未开始的缩略图任务"""
+        if self.thumbnails:
+            self.thumbnails.cancel()
+        return {"success": True}
+
     def upload_file(self, share_name, file_path, file_data):
         """上传文件"""
         try:
@@ -191,6 +562,310 @@ class SMBApi:
             logger.error(f"上传文件错误: {str(e)}")
             return {"success": False, "error": str(e)}
 
+    def begin_upload(self, share_name, file_path, total_size=None):
+        """开始分块上传"""
+        try:
+            logger.info("⬆️ [后端API] begin_upload 函数被调用")
+            logger.info(
+                f"⬆️ [后端API] 参数: share_name={share_name}, file_path={file_path}, total_size={total_size}"
+            )
+
+            if not self.smb_handler:
+                logger.error("⬆️ [后端API] 未连接到SMB服务器")
+                return {"success": False, "error": "未连接到SMB服务器"}
+
+            result = self.smb_handler.begin_upload(share_name, file_path, total_size)
+            logger.info(f"⬆️ [后端API] smb_handler.begin_upload 返回: {result}")
+            return result
+
+        except Exception as e:
+            logger.error(f"开始上传错误: {str(e)}")
+            return {"success": False, "error": str(e)}
+
+    def upload_chunk(self, upload_id, chunk_data, offset=None):
+        """写入一个Base64编码的上传数据块"""
+        try:
+            if not self.smb_handler:
+                logger.error("⬆️ [后端API] 未连接到SMB服务器")
+                return {"success": False, "error": "未连接到SMB服务器"}
+
+            if isinstance(chunk_data, str):
+                import base64
+
+                chunk_data = base64.b64decode(chunk_data)
+            elif not isinstance(chunk_data, bytes):
+                error_msg = (
+                    f"不支持的数据块类型: {type(chunk_data)}，期望bytes或Base64字符串"
+                )
+                logger.error(f"⬆️ [后端API] {error_msg}")
+                return {"success": False, "error": error_msg}
+
+            return self.smb_handler.append_upload_chunk(upload_id, chunk_data, offset)
+
+        except Exception as e:
+            logger.error(f"写入数据块错误: {str(e)}")
+            return {"success": False, "error": str(e)}
+
+    def commit_upload(self, upload_id):
+        """完成分块上传"""
+        try:
+            logger.info(f"⬆️ [后端API] commit_upload 函数被调用: {upload_id}")
+
+            if not self.smb_handler:
+                logger.error("⬆️ [后端API] 未连接到SMB服务器")
+                return {"success": False, "error": "未连接到SMB服务器"}
+
+            result = self.smb_handler.commit_upload(upload_id)
+            logger.info(f"⬆️ [后端API] smb_handler.commit_upload 返回: {result}")
+            return result
+
+        except Exception as e:
+            logger.error(f"完成上传错误: {str(e)}")
+            return {"success": False, "error": str(e)}
+
+    def abort_upload(self, upload_id):
+        """取消分块上传"""
+        try:
+            logger.info(f"⬆️ [后端API] abort_upload 函数被调用: {upload_id}")
+
+            if not self.smb_handler:
+                logger.error("⬆️ [后端API] 未连接到SMB服务器")
+                return {"success": False, "error": "未连接到SMB服务器"}
+
+            result = self.smb_handler.abort_upload(upload_id)
+            logger.info(f"⬆️ [后端API] smb_handler.abort_upload 返回: {result}")
+            return result
+
+        except Exception as e:
+            logger.error(f"取消上传错误: {str(e)}")
+            return {"success": False, "error": str(e)}
+
+    def queue_download(self, share_name, file_path, total_size=None):
+        """将下载任务加入后台队列，保存到download目录，立即返回任务ID"""
+        try:
+            logger.info("⬇️ [后端API] queue_download 函数被调用")
+            logger.info(
+                f"⬇️ [后端API] 参数: share_name={share_name}, file_path={file_path}, total_size={total_size}"
+            )
+
+            if not self.smb_handler or not self.transfer_manager:
+                logger.error("⬇️ [后端API] 未连接到SMB服务器")
+                return {"success": False, "error": "未连接到SMB服务器"}
+
+            file_name = os.path.basename(file_path.replace("\\", "/"))
+            local_path = self._get_download_dir() / file_name
+            job_id = self.transfer_manager.submit_download(
+                share_name, file_path, str(local_path), total_size
+            )
+            return {"success": True, "job_id": job_id, "local_path": str(local_path)}
+
+        except Exception as e:
+            logger.error(f"创建下载任务错误: {str(e)}")
+            return {"success": False, "error": str(e)}
+
+    def queue_download_directory(self, share_name, dir_path):
+        """将整个目录加入后台下载队列，按原目录结构保存到download目录"""
+        try:
+            logger.info("⬇️ [后端API] queue_download_directory 函数被调用")
+            logger.info(f"⬇️ [后端API] 参数: share_name={share_name}, dir_path={dir_path}")
+
+            if not self.smb_handler or not self.transfer_manager:
+                logger.error("⬇️ [后端API] 未连接到SMB服务器")
+                return {"success": False, "error": "未连接到SMB服务器"}
+
+            dir_name = os.path.basename(dir_path.replace("\\", "/").rstrip("/")) or share_name
+            local_path = self._get_download_dir() / dir_name
+            job_id = self.transfer_manager.submit_directory_download(
+                share_name, dir_path, str(local_path)
+            )
+            return {"success": True, "job_id": job_id, "local_path": str(local_path)}
+
+        except Exception as e:
+            logger.error(f"创建目录下载任务错误: {str(e)}")
+            return {"success": False, "error": str(e)}
+
+    def _sync_local_dir(self, share_name, dir_path, local_dir=None):
+        """同步的本地目录，未指定时为download目录下的同名文件夹"""
+        if local_dir:
+            return local_dir
+        dir_name = os.path.basename(dir_path.replace("\\", "/").rstrip("/")) or share_name
+        return str(self._get_download_dir() / dir_name)
+
+    def plan_sync(self, share_name, dir_path, local_dir=None, delete=False):
+        """预览同步计划（dry-run）：列出需要新增、更新和删除的文件，不做任何修改"""
+        try:
+            logger.info("🔄 [后端API] plan_sync 函数被调用")
+            logger.info(
+                f"🔄 [后端API] 参数: share_name={share_name}, dir_path={dir_path}, local_dir={local_dir}, delete={delete}"
+            )
+
+            if not self.smb_handler:
+                logger.error("🔄 [后端API] 未连接到SMB服务器")
+                return {"success": False, "error": "未连接到SMB服务器"}
+
+            local_path = self._sync_local_dir(share_name, dir_path, local_dir)
+            result = self.smb_handler.sync_directory(
+                share_name, dir_path, local_path, delete=delete, dry_run=True
+            )
+            if result.get("success"):
+                result["local_path"] = local_path
+            return result
+
+        except Exception as e:
+            logger.error(f"生成同步计划错误: {str(e)}")
+            return {"success": False, "error": str(e)}
+
+    def queue_sync(self, share_name, dir_path, local_dir=None, delete=False, verify_content=False):
+        """将远程目录同步到本地的任务加入后台队列，只下载新增和变化的文件"""
+        try:
+            logger.info("🔄 [后端API] queue_sync 函数被调用")
+            logger.info(
+                f"🔄 [后端API] 参数: share_name={share_name}, dir_path={dir_path}, local_dir={local_dir}, "
+                f"delete={delete}, verify_content={verify_content}"
+            )
+
+            if not self.smb_handler or not self.transfer_manager:
+                logger.error("🔄 [后端API] 未连接到SMB服务器")
+                return {"success": False, "error": "未连接到SMB服务器"}
+
+            local_path = self._sync_local_dir(share_name, dir_path, local_dir)
+            job_id = self.transfer_manager.submit_sync(
+                share_name, dir_path, local_path, delete=delete, verify_content=verify_content
+            )
+            return {"success": True, "job_id": job_id, "local_path": local_path}
+
+        except Exception as e:
+            logger.error(f"创建同步任务错误: {str(e)}")
+            return {"success": False, "error": str(e)}
+
+    def choose_upload_files(self):
+        """打开本地文件选择对话框，返回选中的文件路径"""
+        try:
+            window = webview.windows[0]
+            paths = window.create_file_dialog(webview.OPEN_DIALOG, allow_multiple=True)
+            files = [
+                {
+                    "path": path,
+                    "name": os.path.basename(path),
+                    "size": os.path.getsize(path),
+                }
+                for path in (paths or [])
+            ]
+            return {"success": True, "files": files}
+
+        except Exception as e:
+            logger.error(f"选择文件错误: {str(e)}")
+            return {"success": False, "error": str(e)}
+
+    def choose_upload_folder(self):
+        """打开本地文件夹选择对话框，返回选中的目录路径"""
+        try:
+            window = webview.windows[0]
+            paths = window.create_file_dialog(webview.FOLDER_DIALOG)
+            if not paths:
+                return {"success": True, "path": None}
+            path = paths[0] if isinstance(paths, (list, tuple)) else paths
+            return {"success": True, "path": path, "name": os.path.basename(path)}
+
+        except Exception as e:
+            logger.error(f"选择文件夹错误: {str(e)}")
+            return {"success": False, "error": str(e)}
+
+    def queue_upload_directory(self, share_name, remote_dir, local_dir):
+        """将本地文件夹整体上传到当前目录下的同名文件夹，加入后台队列"""
+        try:
+            logger.info("⬆️ [后端API] queue_upload_directory 函数被调用")
+            logger.info(
+                f"⬆️ [后端API] 参数: share_name={share_name}, remote_dir={remote_dir}, local_dir={local_dir}"
+            )
+
+            if not self.smb_handler or not self.transfer_manager:
+                logger.error("⬆️ [后端API] 未连接到SMB服务器")
+                return {"success": False, "error": "未连接到SMB服务器"}
+            if not local_dir or not os.path.isdir(local_dir):
+                return {"success": False, "error": f"本地目录不存在: {local_dir}"}
+
+            remote_dir = (remote_dir or "").replace("/", "\\").strip("\\")
+            dir_name = os.path.basename(os.path.normpath(local_dir))
+            remote_path = f"{remote_dir}\\{dir_name}" if remote_dir else dir_name
+            job_id = self.transfer_manager.submit_directory_upload(
+                share_name, remote_path, local_dir
+            )
+            return {"success": True, "job_id": job_id, "remote_path": remote_path}
+
+        except Exception as e:
+            logger.error(f"创建目录上传任务错误: {str(e)}")
+            return {"success": False, "error": str(e)}
+
+    def queue_upload(self, share_name, remote_dir, local_paths):
+        """将本地文件上传任务加入后台队列并发执行，返回任务ID列表"""
+        try:
+            logger.info("⬆️ [后端API] queue_upload 函数被调用")
+            logger.info(
+                f"⬆️ [后端API] 参数: share_name={share_name}, remote_dir={remote_dir}, local_paths={local_paths}"
+            )
+
+            if not self.smb_handler or not self.transfer_manager:
+                logger.error("⬆️ [后端API] 未连接到SMB服务器")
+                return {"success": False, "error": "未连接到SMB服务器"}
+
+            remote_dir = (remote_dir or "").replace("/", "\\").strip("\\")
+            job_ids = []
+            for local_path in local_paths:
+                file_name = os.path.basename(local_path)
+                remote_path = f"{remote_dir}\\{file_name}" if remote_dir else file_name
+                job_ids.append(
+                    self.transfer_manager.submit_upload(
+                        share_name, remote_path, local_path
+                    )
+                )
+            return {"success": True, "job_ids": job_ids}
+
+        except Exception as e:
+            logger.error(f"创建上传任务错误: {str(e)}")
+            return {"success": False, "error": str(e)}
+
+    def get_transfers(self, job_ids=None):
+        """轮询传输任务的进度、速率和剩余时间"""
+        try:
+            if not self.transfer_manager:
+                return {"success": True, "jobs": []}
+            return {"success": True, "jobs": self.transfer_manager.list_jobs(job_ids)}
+
+        except Exception as e:
+            logger.error(f"获取传输任务错误: {str(e)}")
+            return {"success": False, "error": str(e)}
+
+    def pause_transfer(self, job_id):
+        """暂停传输任务"""
+        if not self.transfer_manager or not self.transfer_manager.pause(job_id):
+            return {"success": False, "error": "任务不存在或已结束"}
+        return {"success": True}
+
+    def resume_transfer(self, job_id):
+        """恢复传输任务"""
+        if not self.transfer_manager or not self.transfer_manager.resume(job_id):
+            return {"success": False, "error": "任务不存在或未暂停"}
+        return {"success": True}
+
+    def retry_transfer(self, job_id):
+        """重试失败的传输任务，大文件从上次中断处续传"""
+        if not self.transfer_manager or not self.transfer_manager.retry(job_id):
+            return {"success": False, "error": "任务不存在或未失败"}
+        return {"success": True}
+
+    def cancel_transfer(self, job_id):
+        """取消传输任务"""
+        if not self.transfer_manager or not self.transfer_manager.cancel(job_id):
+            return {"success": False, "error": "任务不存在或已结束"}
+        return {"success": True}
+
+    def clear_transfers(self):
+        """清除已结束的传输任务记录"""
+        if self.transfer_manager:
+            self.transfer_manager.clear_finished()
+        return {"success": True}
+
     def delete_file(self, share_name, file_path):
         """删除文件"""
         try:
@@ -213,6 +888,85 @@ class SMBApi:
             logger.error(f"删除文件错误: {str(e)}")
             return {"success": False, "error": str(e)}
 
+    def clear_directory_cache(self, share_name=None):
+        """清空目录缓存（指定共享时只清空该共享）"""
+        try:
+            logger.info(f"🧹 [后端API] clear_directory_cache 函数被调用: share_name={share_name}")
+
+            if not self.smb_handler:
+                return {"success": False, "error": "未连接到SMB服务器"}
+
+            return self.smb_handler.clear_directory_cache(share_name)
+
+        except Exception as e:
+            logger.error(f"清空目录缓存错误: {str(e)}")
+            return {"success": False, "error": str(e)}
+
+    def delete_paths(self, share_name, items):
+        """批量删除文件和文件夹（文件夹递归删除）"""
+        try:
+            logger.info("🗑️ [后端API] delete_paths 函数被调用")
+            logger.info(
+                f"🗑️ [后端API] 参数: share_name={share_name}, items={len(items or [])} 项"
+            )
+
+            if not self.smb_handler:
+                logger.error("🗑️ [后端API] 未连接到SMB服务器")
+                return {"success": False, "error": "未连接到SMB服务器"}
+
+            result = self.smb_handler.delete_paths(share_name, items)
+            logger.info(
+                f"🗑️ [后端API] smb_handler.delete_paths 返回: success={result.get('success')}, "
+                f"files={result.get('deleted_files')}, directories={result.get('deleted_directories')}"
+            )
+            return result
+
+        except Exception as e:
+            logger.error(f"批量删除错误: {str(e)}")
+            return {"success": False, "error": str(e)}
+
+    def rename_file(self, share_name, old_path, new_path, overwrite=False):
+        """重命名或移动文件/文件夹（同一共享内，由服务器完成）"""
+        try:
+            logger.info("✏️ [后端API] rename_file 函数被调用")
+            logger.info(
+                f"✏️ [后端API] 参数: share_name={share_name}, old_path={old_path}, new_path={new_path}, overwrite={overwrite}"
+            )
+
+            if not self.smb_handler:
+                logger.error("✏️ [后端API] 未连接到SMB服务器")
+                return {"success": False, "error": "未连接到SMB服务器"}
+
+            result = self.smb_handler.rename(share_name, old_path, new_path, overwrite=overwrite)
+            logger.info(f"✏️ [后端API] smb_handler.rename 返回: {result}")
+            return result
+
+        except Exception as e:
+            logger.error(f"重命名错误: {str(e)}")
+            return {"success": False, "error": str(e)}
+
+    def copy_file(self, share_name, source_path, target_path, overwrite=False):
+        """复制文件（同一共享内，SMB2/3 由服务器完成复制）"""
+        try:
+            logger.info("📋 [后端API] copy_file 函数被调用")
+            logger.info(
+                f"📋 [后端API] 参数: share_name={share_name}, source_path={source_path}, target_path={target_path}, overwrite={overwrite}"
+            )
+
+            if not self.smb_handler:
+                logger.error("📋 [后端API] 未连接到SMB服务器")
+                return {"success": False, "error": "未连接到SMB服务器"}
+
+            result = self.smb_handler.copy_file(
+                share_name, source_path, target_path, overwrite=overwrite
+            )
+            logger.info(f"📋 [后端API] smb_handler.copy_file 返回: {result}")
+            return result
+
+        except Exception as e:
+            logger.error(f"复制文件错误: {str(e)}")
+            return {"success": False, "error": str(e)}
+
     def get_file_info(self, share_name, file_path):
         """获取文件信息"""
         try:
@@ -241,6 +995,13 @@ class SMBApi:
             logger.info("🔌 [后端API] disconnect 函数被调用")
             logger.info("🔌 [后端API] 开始断开连接")
 
+            self._shutdown_transfers()
+            if self.thumbnails:
+                self.thumbnails.cancel()
+            if self.stream_server:
+                # 断开后旧URL不再可用
+                self.stream_server.rotate_token()
+
             if self.smb_handler:
                 logger.info("🔌 [后端API] 调用smb_handler.disconnect")
                 self.smb_handler.disconnect()
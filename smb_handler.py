@@ -5,29 +5,101 @@ SMB操作处理器
 基于Impacket库实现SMB客户端功能
 """
 
+import hashlib
 import logging
 import io
 import os
-import datetime
-import copy
-from cachetools import TTLCache
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from impacket import nt_errors
 from impacket.smbconnection import (
     SMBConnection,
+    SessionError,
     SMB_DIALECT,
     SMB2_DIALECT_002,
     SMB2_DIALECT_21,
 )
+from impacket.smb3structs import (
+    FILE_READ_DATA,
+    FILE_WRITE_DATA,
+    FILE_SHARE_READ,
+    FILE_SHARE_WRITE,
+    FILE_SHARE_DELETE,
+    FILE_NON_DIRECTORY_FILE,
+    FILE_OPEN,
+    FILE_CREATE,
+    FILE_OVERWRITE_IF,
+)
 from impacket.nmb import NetBIOSError
 from impacket.examples.utils import parse_target
+from smb_pool import SMBConnectionPool
+from change_notify import DirectoryWatcher
+from smb_pipeline import supports_pipeline, pipelined_read, pipelined_write
+from content_cache import content_key
+from search_index import ShareCrawler
+from content_search import LineMatcher, SearchStopped
+from smb_copy import (
+    ServerCopyUnsupported,
+    delete_path,
+    rename_path,
+    server_side_copy,
+    source_resume_key,
+)
+from directory_sync import (
+    PARTIAL_SUFFIX,
+    SYNC_AMBIGUOUS,
+    SYNC_CHANGED,
+    SYNC_DELETED,
+    SYNC_NEW,
+    build_plan,
+    scan_local,
+    summarize_plan,
+    walk_remote,
+)
+from transfer_journal import TransferJournal, download_journal_path, upload_journal_path
+from transfer_manager import TransferCancelled, TransferPaused
+from directory_stream import open_directory, query_directory_batches
+from directory_cache import DirectoryCacheTree, DirectoryListing, SORT_KEYS, format_filetime
 
 logger = logging.getLogger(__name__)
 
+# 出现这些错误时认为缓存的树连接已失效，需要重新connectTree
+TREE_RECONNECT_ERRORS = (
+    nt_errors.STATUS_NETWORK_NAME_DELETED,
+    nt_errors.STATUS_BAD_NETWORK_NAME,
+)
+
+# 出现这些错误时认为缓存的文件句柄已失效
+HANDLE_INVALID_ERRORS = (
+    nt_errors.STATUS_FILE_CLOSED,
+    nt_errors.STATUS_INVALID_HANDLE,
+) + TREE_RECONNECT_ERRORS
+
+
+def _local_digest(local_path):
+    digest = hashlib.sha1()
+    with open(local_path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
 
 class SMBHandler:
     """SMB操作处理器"""
 
-    def __init__(self):
-        self.smb = None
+    def __init__(self, persistent_cache=None, content_cache=None, search_index=None):
+        """
+        Args:
+            persistent_cache (PersistentDirectoryCache): 可选的持久化目录缓存，可跨连接共享
+            content_cache (ContentCache): 可选的文件内容缓存，可跨连接共享
+            search_index (SearchIndex): 可选的文件名搜索索引，可跨连接共享
+        """
+        self.pool = None
         self.connected = False
         self.domain = None
         self.username = None
@@ -41,9 +113,67 @@ class SMBHandler:
         self.smb_version = None
         self.current_share = None
         self.current_path = "\\"
-        self.cache_ttl = 300  # 秒
-        self.cache_max_entries = 256
-        self.directory_cache = TTLCache(maxsize=self.cache_max_entries, ttl=self.cache_ttl)
+        self.cache_ttl = 300  # 秒，超过后列表视为过期
+        self.cache_max_entries = 200000  # 内存缓存的目录项总数上限（按条目计，而非目录数）
+        self.stale_while_revalidate = True  # 过期后仍先返回旧列表，同时后台刷新
+        self.cache_stale_ttl = 3600  # 秒，过期列表最多再保留多久用于先行返回
+        self.directory_cache = DirectoryCacheTree(
+            max_entries=self.cache_max_entries,
+            ttl=self.cache_ttl + (self.cache_stale_ttl if self.stale_while_revalidate else 0),
+        )
+        self._cache_lock = threading.RLock()
+        self._cache_epoch = 0  # 每次失效递增，防止失效前发起的后台刷新写回旧列表
+        self.persistent_cache = persistent_cache
+        self.reuse_unchanged_listings = True  # 重新列出的目录与缓存完全相同时沿用缓存列表（共用排序索引，不重写持久缓存和搜索索引）
+        self._cache_scope = None  # 持久缓存中区分服务器/用户的前缀
+        self.change_notify_enabled = True  # 通过 CHANGE_NOTIFY 监听可见目录的变化
+        self.change_notify_max_watches = 16  # 同时监听的目录数
+        self._watcher = None
+        self.prefetch_enabled = True  # 打开目录后预取其子目录列表
+        self.prefetch_depth = 1  # 预取的子目录层数
+        self.prefetch_max_dirs = 8  # 每个目录最多预取的子目录数
+        self.background_workers = 2  # 后台刷新/预取线程数
+        self._background = None
+        self._background_keys = set()  # 正在后台刷新或预取的缓存键
+        self._background_lock = threading.Lock()
+        self.search_index = search_index
+        self.index_while_browsing = True  # 浏览过的目录自动写入搜索索引
+        self.index_crawl_workers = 2  # 爬取共享时并行列目录的线程数
+        self.index_max_depth = 32  # 爬取的最大目录深度
+        self.index_max_entries = 1000000  # 每个共享最多索引的条目数
+        self._crawlers = {}
+        self.pool_max_size = 4  # 同一服务器最多并行的已认证会话数
+        self.pool_idle_timeout = 300  # 秒
+        self.pool_reserved_sessions = 1  # 为浏览/预览保留、批量传输不占用的会话数
+        self.upload_chunk_size = 1024 * 1024  # 分块上传的建议块大小
+        self.directory_walk_workers = 2  # 递归传输时并行列目录的线程数
+        self.directory_transfer_workers = 3  # 递归传输时并行传输文件的线程数
+        self.delete_workers = 4  # 批量删除时并行删除的条目数
+        self.preview_chunk_size = 256 * 1024  # 预览默认读取长度
+        self.sync_mtime_tolerance = 2  # 同步比较修改时间时允许的误差（秒）
+        self.content_search_workers = 4  # 内容搜索时并行读取的文件数
+        self.content_search_max_file_size = 32 * 1024 * 1024  # 内容搜索默认跳过更大的文件
+        self.content_search_max_matches_per_file = 100  # 每个文件最多报告的匹配行数
+        self.content_cache = content_cache
+        self.content_cache_max_file_size = 8 * 1024 * 1024  # 超过该大小的文件不进入内容缓存
+        self.pipeline_depth = 4  # 每个句柄同时在途的读/写请求数
+        self.transfer_chunk_size = 1024 * 1024  # 每个读/写请求的期望长度（受服务器最大读写长度限制）
+        self.resume_enabled = True  # 大文件传输中断后从已确认的位置续传
+        self.resume_min_size = 8 * 1024 * 1024  # 小于该大小的文件不记录续传日志
+        self.resume_verify_size = 64 * 1024  # 续传前比对本地与远程的尾部字节数
+        self.resume_journal_dir = os.path.join(
+            os.path.dirname(os.path.abspath(__file__)), "cache", "transfers"
+        )
+        self.segmented_download_threshold = 64 * 1024 * 1024  # 超过该大小的文件分段并行下载
+        self.segment_size = 16 * 1024 * 1024  # 每段字节数
+        self.segment_read_size = 1024 * 1024  # 段内每次读取的字节数
+        self.segment_workers = 4  # 同时下载的段数（不超过连接池中可用于批量传输的会话数）
+        self.segment_retries = 3  # 每段失败后的重试次数
+        self.upload_sessions = {}
+        self._upload_lock = threading.Lock()
+        self.handle_cache_max_entries = 8  # 每个会话缓存的只读句柄数
+        self.handle_cache_idle_timeout = 30  # 秒
+        self._handle_lock = threading.RLock()
 
     def connect(self, connection_string):
         """
@@ -76,10 +206,10 @@ class SMBHandler:
 
             # 创建SMB连接
             logger.info(f"连接到SMB服务器 {self.address}:{self.port}")
-            self.smb = SMBConnection(self.address, self.address, None, self.port)
+            smb = SMBConnection(self.address, self.address, None, self.port)
 
             # 检测SMB版本
-            dialect = self.smb.getDialect()
+            dialect = smb.getDialect()
             if dialect == SMB_DIALECT:
                 self.smb_version = "SMBv1"
             elif dialect == SMB2_DIALECT_002:
@@ -92,19 +222,30 @@ class SMBHandler:
             logger.info(f"SMB版本: {self.smb_version}")
 
             # 登录
-            self.smb.login(
+            smb.login(
                 self.username, self.password, self.domain, self.lmhash, self.nthash
             )
 
             # 检查会话类型
-            if self.smb.isGuestSession() > 0:
+            if smb.isGuestSession() > 0:
                 self.session = "guest session"
                 logger.info("以guest session登录")
             else:
                 self.session = "user session"
                 logger.info("以user session登录")
 
+            # 首个会话放入连接池，后续并发操作按需复用同一组凭据建立新会话
+            self.pool = SMBConnectionPool(
+                self._create_connection,
+                max_size=self.pool_max_size,
+                idle_timeout=self.pool_idle_timeout,
+                reserved=self.pool_reserved_sessions,
+            )
+            self.pool.add(smb)
+
+            self._cache_scope = f"{self.domain or ''}\\{self.username or ''}@{self.address}:{self.port}".lower()
             self.connected = True
+            self._start_watcher()
             logger.info(f"成功连接到SMB服务器: {self.address}")
 
             return {"success": True, "message": "连接成功"}
@@ -122,6 +263,20 @@ class SMBHandler:
             logger.error(error_msg)
             return {"success": False, "error": error_msg}
 
+    def _create_connection(self):
+        """使用connect()解析出的凭据建立并登录一个新的SMB会话（供连接池调用）"""
+        logger.info(f"连接池建立新会话: {self.address}:{self.port}")
+        smb = SMBConnection(self.address, self.address, None, self.port)
+        smb.login(self.username, self.password, self.domain, self.lmhash, self.nthash)
+        return smb
+
+    @contextmanager
+    def _connection(self, pooled=None, bulk=False):
+        """从连接池借出会话（或等待指定会话空闲），退出时归还；bulk 为True时不占用为浏览保留的会话"""
+        with self.pool.connection(pooled, bulk=bulk) as conn:
+            self._flush_pending_handles(conn)
+            yield conn
+
     def list_directory(self, path="\\"):
         """
         列出目录内容
@@ -132,31 +287,257 @@ class SMBHandler:
         Returns:
             dict: 列表结果
         """
+        result = self._load_directory(path)[1]
+        if not result.get("success"):
+            return result
+        listing = result["listing"]
+        return {"success": True, "files": listing.rows(listing.sorted_view("name"))}
+
+    def list_directory_page(
+        self,
+        path="\\",
+        offset=0,
+        limit=None,
+        sort_key="name",
+        sort_order="asc",
+        name_filter=None,
+    ):
+        """
+        分页列出目录内容，排序与过滤在服务端完成
+
+        Args:
+            path (str): 目录路径
+            offset (int): 起始条目
+            limit (int): 返回条目数，为None时返回offset之后的全部条目
+            sort_key (str): 排序字段，name/size/modified_time/type，文件夹始终在前
+            sort_order (str): asc 或 desc
+            name_filter (str): 名称过滤（不区分大小写的子串匹配）
+
+        Returns:
+            dict: 当前页条目及过滤后的总数
+        """
         try:
-            if not self.connected:
-                return {"success": False, "error": "未连接到服务器"}
+            if sort_key not in SORT_KEYS:
+                return {"success": False, "error": f"不支持的排序字段: {sort_key}"}
 
-            # 规范化路径
-            path = path.replace("/", "\\")
-            if not path.startswith("\\"):
-                path = "\\" + path
-            if not path.endswith("\\"):
-                path = path + "\\"
+            cache_key, result = self._load_directory(path)
+            if not result.get("success"):
+                return result
+
+            # 缓存的列表不可变，直接在其上取排序索引，只为当前页的行构造字典
+            listing = result["listing"]
+            index = listing.sorted_view(sort_key, sort_order == "desc", name_filter)
+            total = len(index)
+            offset = max(int(offset or 0), 0)
+            end = total if limit is None else offset + max(int(limit), 0)
+            page = listing.rows(index[offset:end])
+
+            logger.info(
+                f"[分页] 路径: {path}, 排序: {sort_key} {sort_order}, 过滤: {name_filter!r}, "
+                f"返回 {offset}-{offset + len(page)} / {total}"
+            )
+            return {
+                "success": True,
+                "files": page,
+                "total": total,
+                "offset": offset,
+                "limit": limit,
+            }
+
+        except Exception as e:
+            error_msg = f"列出目录失败: {str(e)}"
+            logger.error(error_msg)
+            return {"success": False, "error": error_msg}
+
+    def _load_directory(self, path="\\"):
+        """
+        获取目录列表（优先命中缓存）
 
+        缓存过期但仍在 cache_stale_ttl 内时直接返回旧列表并在后台刷新；
+        成功返回后按配置在后台预取子目录
+
+        Returns:
+            tuple: (cache_key, result)，成功时 result["listing"] 为与缓存共享的 DirectoryListing
+        """
+        cache_key = None
+        try:
+            if not self.connected:
+                return cache_key, {"success": False, "error": "未连接到服务器"}
+
+            path = self._normalize_directory_path(path)
             cache_key = self._normalize_cache_key(path)
-            cached_result = self._get_cached_directory(cache_key)
-            if cached_result:
-                logger.info(f"[缓存命中] 路径: {path}")
-                return cached_result
+
+            # 设置当前共享和路径
+            share_name, relative_path = self._parse_path(path)
+            if share_name:
+                self.current_share = share_name
+                self.current_path = relative_path if relative_path else "\\"
+
+            if share_name and self._watcher:
+                self._watcher.watch(cache_key, path, share_name, relative_path)
+
+            cached_listing = self._get_cached_directory(cache_key)
+            if cached_listing is not None:
+                if self._is_cache_fresh(cache_key, cached_listing):
+                    logger.info(f"[缓存命中] 路径: {path}")
+                    self._schedule_prefetch(path, cached_listing, self.prefetch_depth)
+                    return cache_key, {"success": True, "listing": cached_listing}
+                if self.stale_while_revalidate:
+                    age = cached_listing.age()
+                    logger.info(f"[缓存过期命中] 路径: {path}，已缓存 {int(age)} 秒，后台刷新")
+                    self._schedule_background(cache_key, self._fetch_directory, path, cache_key)
+                    return cache_key, {"success": True, "listing": cached_listing}
 
             logger.info(f"[缓存未命中] 路径: {path}，准备发起网络请求")
+            result = self._fetch_directory(path, cache_key)
+            if result.get("success"):
+                self._schedule_prefetch(path, result["listing"], self.prefetch_depth)
+            return cache_key, result
+
+        except Exception as e:
+            error_msg = f"列出目录失败: {str(e)}"
+            logger.error(error_msg)
+            return cache_key, {"success": False, "error": error_msg}
+
+    def is_directory_cached(self, path="\\"):
+        """目录是否已有可以直接返回的缓存列表（新鲜，或允许先返回过期列表）；共享列表始终视为已缓存"""
+        path = self._normalize_directory_path(path)
+        if not self._parse_path(path)[0]:
+            return True
+        cache_key = self._normalize_cache_key(path)
+        listing = self._get_cached_directory(cache_key)
+        if listing is None:
+            return False
+        return self.stale_while_revalidate or self._is_cache_fresh(cache_key, listing)
+
+    def stream_directory(self, path, batch_callback, is_cancelled=None):
+        """
+        流式列出目录：每收到一个 QUERY_DIRECTORY 响应就回调一次，全部读完后写入缓存
+
+        SMB2/3 在缓存的树连接上逐批读取；SMBv1 回退为一次 listPath，整个目录作为一批
+
+        Args:
+            path (str): 目录路径（\\共享\\目录\\）
+            batch_callback (callable): batch_callback(files)，files 为本批 SharedFile 列表
+            is_cancelled (callable): 每批之后检查，返回True时停止读取（不写入缓存）
+
+        Returns:
+            dict: 成功时 listing 为完整的 DirectoryListing
+        """
+        try:
+            if not self.connected or not self.pool:
+                return {"success": False, "error": "未连接到服务器"}
+
+            path = self._normalize_directory_path(path)
+            cache_key = self._normalize_cache_key(path)
+            share_name, relative_path = self._parse_path(path)
+            if not share_name:
+                return {"success": False, "error": "无效的路径格式"}
+            self.current_share = share_name
+            self.current_path = relative_path if relative_path else "\\"
+            if self._watcher:
+                self._watcher.watch(cache_key, path, share_name, relative_path)
+
+            with self._cache_lock:
+                epoch = self._cache_epoch
+            logger.info(f"[流式列目录] {share_name}\\{relative_path or ''}")
+            files = []
+            with self._connection() as conn:
+                if supports_pipeline(conn.smb):
+                    tree_id, file_id = self._with_tree(
+                        conn,
+                        share_name,
+                        lambda tree_id: (tree_id, open_directory(conn.smb, tree_id, relative_path)),
+                    )
+                    try:
+                        for batch in query_directory_batches(conn.smb, tree_id, file_id):
+                            files.extend(batch)
+                            batch_callback(batch)
+                            if is_cancelled and is_cancelled():
+                                logger.info(f"[流式列目录取消] {path}，已读取 {len(files)} 项")
+                                return {"success": False, "error": "已取消"}
+                    finally:
+                        try:
+                            conn.smb.getSMBServer().close(tree_id, file_id)
+                        except Exception as e:
+                            logger.debug(f"关闭目录句柄失败 {path}: {e}")
+                else:
+                    list_path = f"{relative_path}\\*" if relative_path else "*"
+                    files = self._with_tree(
+                        conn,
+                        share_name,
+                        lambda tree_id: conn.smb.listPath(share_name, list_path),
+                    )
+                    batch_callback(files)
+
+            listing = DirectoryListing.from_shared_files(files)
+            logger.info(f"[流式列目录完成] {path} -> {len(listing)} 条记录")
+            self._set_directory_cache(cache_key, listing, epoch)
+            self._schedule_index_update(share_name, relative_path, cache_key, listing)
+            self._schedule_prefetch(path, listing, self.prefetch_depth)
+            return {"success": True, "listing": listing}
+
+        except Exception as e:
+            error_msg = f"列出目录失败: {str(e)}"
+            logger.error(error_msg)
+            return {"success": False, "error": error_msg}
+
+    def _is_cache_fresh(self, cache_key, listing):
+        """
+        判断缓存列表是否可直接使用
+
+        未超过TTL，或获取该列表时目录已处于 CHANGE_NOTIFY 监听之下（之后的变化都会触发失效）
+        """
+        if listing.age() < self.cache_ttl:
+            return True
+        if self._watcher is None:
+            return False
+        armed_at = self._watcher.armed_at(cache_key)
+        # 留出1秒余量，避免监听注册与列表获取几乎同时发生时漏掉变化
+        return armed_at is not None and armed_at <= listing.fetched_at - 1
+
+    def _start_watcher(self):
+        """启动目录变更监听，SMBv1 下直接使用TTL"""
+        if not self.change_notify_enabled:
+            return
+        if self.smb_version == "SMBv1":
+            logger.info("SMBv1 不支持 CHANGE_NOTIFY，目录缓存使用TTL")
+            return
+        self._watcher = DirectoryWatcher(
+            self._create_connection,
+            self._on_directory_changed,
+            max_watches=self.change_notify_max_watches,
+        )
+        self._watcher.start()
+
+    def _on_directory_changed(self, path, names):
+        """服务器报告目录变化：失效该目录，以及变化子项对应的整棵子目录缓存（子项可能是被删除或重命名的文件夹）"""
+        self._invalidate_cache_keys(
+            (self._normalize_cache_key(path),),
+            [self._normalize_cache_key(f"{path}{name}\\") for name in names or ()],
+        )
+
+    def _normalize_directory_path(self, path):
+        """规范化目录路径，确保以反斜杠开头和结尾"""
+        path = (path or "\\").replace("/", "\\")
+        if not path.startswith("\\"):
+            path = "\\" + path
+        if not path.endswith("\\"):
+            path = path + "\\"
+        return path
+
+    def _fetch_directory(self, path, cache_key):
+        """从服务器获取目录列表并写入缓存"""
+        with self._cache_lock:
+            epoch = self._cache_epoch
+        try:
             logger.info(f"列出目录内容: {path}")
 
             # 获取共享列表
             if path == "\\" or path == "\\\\":
                 result = self._list_shares()
                 if result.get("success"):
-                    self._set_directory_cache(cache_key, result)
+                    self._set_directory_cache(cache_key, result["listing"], epoch)
                 return result
 
             # 解析路径，提取共享名称和相对路径
@@ -166,16 +547,8 @@ class SMBHandler:
             if not share_name:
                 return {"success": False, "error": "无效的路径格式"}
 
-            # 设置当前共享和路径
-            self.current_share = share_name
-            self.current_path = relative_path if relative_path else "\\"
-
             # 连接到共享并列出内容
             try:
-                # 连接到共享
-                tree_id = self.smb.connectTree(share_name)
-                logger.info(f"成功连接到共享: {share_name}")
-
                 # 如果相对路径为空，设为根目录
                 if not relative_path or relative_path == "\\" or relative_path == "/":
                     list_path = "*"
@@ -185,57 +558,31 @@ class SMBHandler:
 
                 logger.info(f"使用listPath列出: {share_name}\\{list_path}")
 
-                # 获取文件/目录列表
-                file_list = self.smb.listPath(share_name, list_path)
-
-                # 处理每个文件/目录
-                files = []
-                for file_item in file_list:
-                    if file_item.get_longname() in [".", ".."]:
-                        continue
-
-                    # Windows FILETIME转换处理
-                    try:
-                        # Windows FILETIME转换
-                        timestamp = file_item.get_mtime()
-                        if timestamp > 100000000000000000:
-                            # Windows FILETIME转换为Unix时间戳
-                            unix_timestamp = (timestamp - 116444736000000000) / 10000000
-                            formatted_time = datetime.datetime.fromtimestamp(
-                                unix_timestamp
-                            ).strftime("%Y-%m-%d %H:%M:%S")
-                        else:
-                            # 尝试直接转换
-                            formatted_time = datetime.datetime.fromtimestamp(
-                                timestamp / 100000000
-                            ).strftime("%Y-%m-%d %H:%M:%S")
-                    except:
-                        formatted_time = "Unknown"
-
-                    file_info = {
-                        "name": file_item.get_longname(),
-                        "size": file_item.get_filesize(),
-                        "is_directory": file_item.is_directory(),
-                        "modified_time": formatted_time,
-                        "created_time": formatted_time,  # 使用相同的时间
-                        "attributes": (
-                            str(file_item.get_attributes())
-                            if hasattr(file_item, "get_attributes")
-                            else "Unknown"
-                        ),
-                    }
-                    files.append(file_info)
-                    logger.debug(
-                        f"添加文件: {file_info['name']} ({'目录' if file_info['is_directory'] else '文件'})"
+                # 获取文件/目录列表（复用缓存的树连接）
+                with self._connection() as conn:
+                    file_list = self._with_tree(
+                        conn,
+                        share_name,
+                        lambda tree_id: conn.smb.listPath(share_name, list_path),
                     )
 
-                # 文件夹前置排序
-                files.sort(key=lambda x: (not x["is_directory"], x["name"]))
+                # 以列式不可变结构保存，时间格式化等转换延迟到返回具体行时
+                listing = DirectoryListing.from_shared_files(file_list)
 
-                result = {"success": True, "files": files}
-                logger.info(f"[网络请求完成] {share_name}\\{relative_path or ''} -> {len(files)} 条记录")
-                self._set_directory_cache(cache_key, result)
-                return result
+                # 每次都重新读取各文件的大小和修改时间，全部一致时才沿用缓存列表
+                # （共用排序索引，持久缓存只更新时间，不重写搜索索引），共享根目录同样适用
+                if self.reuse_unchanged_listings:
+                    cached_listing = self._get_cached_directory(cache_key)
+                    if cached_listing is not None and cached_listing.same_entries(listing):
+                        listing = cached_listing.revalidated(listing.fetched_at)
+                        logger.info(f"[目录未变化] {share_name}\\{relative_path}，沿用缓存列表")
+                        self._set_directory_cache(cache_key, listing, epoch)
+                        return {"success": True, "listing": listing}
+
+                logger.info(f"[网络请求完成] {share_name}\\{relative_path or ''} -> {len(listing)} 条记录")
+                self._set_directory_cache(cache_key, listing, epoch)
+                self._schedule_index_update(share_name, relative_path, cache_key, listing)
+                return {"success": True, "listing": listing}
 
             except Exception as e:
                 logger.error(f"连接共享或列出文件失败: {e}")
@@ -246,13 +593,88 @@ class SMBHandler:
             logger.error(error_msg)
             return {"success": False, "error": error_msg}
 
+    def _schedule_background(self, cache_key, func, *args):
+        """在后台线程执行目录刷新/预取，同一缓存键同时只执行一个"""
+        with self._background_lock:
+            if cache_key in self._background_keys or not self.connected:
+                return False
+            self._background_keys.add(cache_key)
+            if self._background is None:
+                self._background = ThreadPoolExecutor(
+                    max_workers=self.background_workers,
+                    thread_name_prefix="smb-background",
+                )
+            executor = self._background
+
+        def _run():
+            try:
+                func(*args)
+            except Exception as e:
+                logger.debug(f"后台任务失败 {cache_key}: {e}")
+            finally:
+                with self._background_lock:
+                    self._background_keys.discard(cache_key)
+
+        try:
+            executor.submit(_run)
+        except RuntimeError:
+            # 连接已断开，线程池已关闭
+            with self._background_lock:
+                self._background_keys.discard(cache_key)
+            return False
+        return True
+
+    def _schedule_prefetch(self, path, listing, depth):
+        """后台预取目录下前 prefetch_max_dirs 个尚未缓存的子目录，depth 控制递归层数"""
+        if not self.prefetch_enabled or depth <= 0 or path in ("\\", "\\\\"):
+            return
+
+        for name in listing.subdirectories()[: self.prefetch_max_dirs]:
+            child_path = f"{path}{name}\\"
+            child_key = self._normalize_cache_key(child_path)
+            cached = self._get_cached_directory(child_key)
+            if cached is not None and self._is_cache_fresh(child_key, cached):
+                continue
+            self._schedule_background(
+                child_key, self._prefetch_directory, child_path, child_key, depth
+            )
+
+    def _prefetch_directory(self, path, cache_key, depth):
+        logger.info(f"[预取] 路径: {path}")
+        result = self._fetch_directory(path, cache_key)
+        if result.get("success"):
+            self._schedule_prefetch(path, result["listing"], depth - 1)
+
+    def _schedule_index_update(self, share_name, relative_path, cache_key, listing):
+        """在后台把新获取的目录列表写入搜索索引"""
+        if not self.search_index or not self.index_while_browsing or not self._cache_scope:
+            return
+        self._schedule_background(
+            ("index", cache_key),
+            self.search_index.replace_directory,
+            self._cache_scope,
+            share_name,
+            relative_path or "",
+            listing,
+        )
+
+    def _stop_background(self):
+        """停止后台刷新/预取线程"""
+        with self._background_lock:
+            executor = self._background
+            self._background = None
+            self._background_keys.clear()
+        if executor:
+            executor.shutdown(wait=False)
+
     def _list_shares(self):
         """列出可用的共享"""
         try:
             logger.info("开始获取共享列表")
 
             # 使用listShares方法
-            shares = self.smb.listShares()
+            with self._connection() as conn:
+                shares = conn.smb.listShares()
             logger.info(f"listShares返回 {len(shares)} 个共享")
 
             share_list = []
@@ -261,15 +683,7 @@ class SMBHandler:
                 if hasattr(share, "shi1_netname"):
                     share_name = share["shi1_netname"][:-1]  # 移除结尾的null字符
                     if share_name and not share_name.endswith("$"):  # 过滤掉系统共享
-                        share_info = {
-                            "name": share_name,
-                            "type": "共享文件夹",
-                            "is_directory": True,
-                            "size": 0,
-                            "modified_time": "",
-                            "attributes": "SHARE",
-                        }
-                        share_list.append(share_info)
+                        share_list.append((share_name, "共享文件夹", "SHARE"))
                         logger.info(f"添加共享: {share_name}")
 
             # 如果没有共享，添加默认共享
@@ -277,21 +691,10 @@ class SMBHandler:
                 logger.info("没有找到共享，添加默认共享")
                 default_shares = ["C$", "D$", "ADMIN$"]
                 for share_name in default_shares:
-                    share_info = {
-                        "name": share_name,
-                        "type": "默认共享",
-                        "is_directory": True,
-                        "size": 0,
-                        "modified_time": "",
-                        "attributes": "DEFAULT",
-                    }
-                    share_list.append(share_info)
-
-            # 文件夹前置排序
-            share_list.sort(key=lambda x: x["name"])
+                    share_list.append((share_name, "默认共享", "DEFAULT"))
 
             logger.info(f"最终获取到 {len(share_list)} 个共享")
-            return {"success": True, "files": share_list}
+            return {"success": True, "listing": DirectoryListing.from_shares(share_list)}
 
         except Exception as e:
             error_msg = f"获取共享列表失败: {str(e)}"
@@ -335,7 +738,19 @@ class SMBHandler:
             logger.error(f"解析路径失败: {e}")
             return None, None
 
-    def download_file(self, share_name, file_path, local_path=None):
+    def download_file(
+        self,
+        share_name,
+        file_path,
+        local_path=None,
+        offset=0,
+        length=None,
+        progress_callback=None,
+        segmented=None,
+        file_size=None,
+        resume_callback=None,
+        use_content_cache=True,
+    ):
         """
         下载文件
 
@@ -343,217 +758,2526 @@ class SMBHandler:
             share_name (str): 共享名称
             file_path (str): 文件路径
             local_path (str): 本地保存路径，如果为None则返回文件内容
+            offset (int): 返回文件内容时的起始偏移
+            length (int): 返回文件内容时的读取长度，为None时读取到文件末尾
+            progress_callback (callable): 保存到本地时每写入一块数据调用一次，参数为字节数
+            segmented (bool): 是否分段并行下载，None 表示超过 segmented_download_threshold 时自动启用
+            file_size (int): 已知的文件大小，提供时省去一次查询
+            resume_callback (callable): 从上次中断处续传时调用一次，参数为已完成的字节数
+            use_content_cache (bool): 小文件是否经过内容缓存（命中时不再访问服务器）
 
         Returns:
             dict: 下载结果
         """
         try:
-            if not self.connected or not self.smb:
+            if not self.connected or not self.pool:
                 return {"success": False, "error": "未连接到服务器"}
 
-            logger.info(f"下载文件: {share_name}\\{file_path}")
+            if not local_path:
+                # 返回文件内容，通过已打开的句柄按范围读取
+                return self.read_file_range(share_name, file_path, offset, length)
 
-            # 连接到共享
-            try:
-                tree_id = self.smb.connectTree(share_name)
-                logger.info(f"成功连接到共享: {share_name}")
-            except Exception as e:
-                return {
-                    "success": False,
-                    "error": f"无法连接到共享 {share_name}: {str(e)}",
-                }
+            logger.info(f"下载文件: {share_name}\\{file_path}")
 
-            # 创建内存文件对象
-            if local_path:
-                # 保存到本地文件
-                with open(local_path, "wb") as f:
-                    self.smb.getFile(share_name, file_path, f.write)
-                logger.info(f"文件保存到: {local_path}")
-                return {
-                    "success": True,
-                    "file_path": local_path,
-                    "size": os.path.getsize(local_path),
-                }
-            else:
-                # 返回文件内容
-                fh = io.BytesIO()
-                self.smb.getFile(share_name, file_path, fh.write)
-                file_data = fh.getvalue()
-                fh.close()
+            normalized_path = file_path.replace("/", "\\").lstrip("\\")
+            if use_content_cache:
+                cached = self._content_cache_key(share_name, normalized_path)
+                if cached is not None:
+                    return self._download_cached(
+                        share_name, normalized_path, local_path, cached, progress_callback
+                    )
 
-                logger.info(f"成功读取文件，大小: {len(file_data)} 字节")
-                return {"success": True, "data": file_data, "size": len(file_data)}
+            use_segments = segmented is not False and self.segment_workers > 1
+            if file_size is None and (use_segments or self.resume_enabled):
+                file_size = self._with_read_handle(
+                    share_name,
+                    normalized_path,
+                    lambda conn, tree_id, file_id: conn.smb.queryInfo(tree_id, file_id)[
+                        "EndOfFile"
+                    ],
+                )
+
+            journal = None
+            if self.resume_enabled and file_size is not None and file_size >= self.resume_min_size:
+                journal = self._open_download_journal(
+                    share_name, normalized_path, local_path, file_size
+                )
 
+            try:
+                if use_segments and (segmented or file_size >= self.segmented_download_threshold):
+                    result = self._download_segmented(
+                        share_name,
+                        normalized_path,
+                        local_path,
+                        file_size,
+                        progress_callback,
+                        journal,
+                        resume_callback,
+                    )
+                else:
+                    result = self._download_sequential(
+                        share_name,
+                        normalized_path,
+                        local_path,
+                        progress_callback,
+                        journal,
+                        resume_callback,
+                    )
+            except BaseException:
+                if journal:
+                    journal.save()
+                raise
+
+            if journal:
+                journal.delete()
+            return result
+
+        except (TransferPaused, TransferCancelled) as e:
+            # 用户暂停或取消不是失败，续传日志已保存
+            logger.info(f"下载文件中断: {share_name}\\{file_path} ({e})")
+            return {"success": False, "error": str(e)}
         except Exception as e:
             error_msg = f"下载文件失败: {str(e)}"
             logger.error(error_msg)
             return {"success": False, "error": error_msg}
 
-    def upload_file(self, share_name, file_path, file_data):
+    def download_directory(
+        self,
+        share_name,
+        dir_path,
+        local_dir,
+        progress_callback=None,
+        discover_callback=None,
+        file_callback=None,
+        is_cancelled=None,
+        pause_gate=None,
+    ):
         """
-        上传文件
+        递归下载整个目录，保持目录结构
+
+        遍历与下载并行进行：列目录在 directory_walk_workers 个线程中执行，
+        发现的文件立即交给 directory_transfer_workers 个线程下载；单个文件失败不影响其余文件
 
         Args:
             share_name (str): 共享名称
-            file_path (str): 目标文件路径
-            file_data (bytes): 文件数据
+            dir_path (str): 远程目录路径（相对共享根目录，空字符串表示整个共享）
+            local_dir (str): 本地保存目录
+            progress_callback (callable): 每写入一块数据调用一次，参数为字节数
+            discover_callback (callable): 每列完一个目录调用一次，参数为新发现的文件数和字节数
+            file_callback (callable): 每个文件结束时调用一次，参数为远程路径和是否成功
+            is_cancelled (callable): 返回True时停止发起新的列目录/下载
+            pause_gate (callable): 见 _transfer_tree
 
         Returns:
-            dict: 上传结果
+            dict: 下载结果，包含 files、bytes、failed
         """
         try:
-            if not self.connected or not self.smb:
+            if not self.connected or not self.pool:
                 return {"success": False, "error": "未连接到服务器"}
 
-            logger.info(
-                f"上传文件: {share_name}\\{file_path}, 大小: {len(file_data)} 字节"
-            )
-
-            # 连接到共享
-            try:
-                tree_id = self.smb.connectTree(share_name)
-                logger.info(f"成功连接到共享: {share_name}")
-            except Exception as e:
-                return {
-                    "success": False,
-                    "error": f"无法连接到共享 {share_name}: {str(e)}",
-                }
-
-            # 创建内存文件对象
-            memory_file = io.BytesIO()
-            memory_file.write(file_data)
-            memory_file.seek(0)
-
-            # 上传文件
-            self.smb.putFile(share_name, file_path, memory_file.read)
-            memory_file.close()
-
-            logger.info(f"成功上传文件，大小: {len(file_data)} 字节")
-
-            self._invalidate_parent_directory_cache(share_name, file_path)
+            root = (dir_path or "").replace("/", "\\").strip("\\")
+            logger.info(f"递归下载目录: {share_name}\\{root} -> {local_dir}")
+            os.makedirs(local_dir, exist_ok=True)
+
+            def _local_path(remote_path):
+                relative = remote_path[len(root):].strip("\\")
+                parts = [part for part in relative.split("\\") if part]
+                return os.path.join(local_dir, *parts)
+
+            def _download(remote_path, size):
+                local_path = _local_path(remote_path)
+                result = self.download_file(
+                    share_name,
+                    remote_path,
+                    local_path,
+                    progress_callback=progress_callback,
+                    file_size=size,
+                    # 批量下载不经过内容缓存，避免挤掉预览常用的内容
+                    use_content_cache=False,
+                )
+                if not result.get("success") and is_cancelled and is_cancelled():
+                    # 取消导致的中断，删除不完整的文件
+                    if os.path.exists(local_path):
+                        os.remove(local_path)
+                    return None
+                return result
 
-            return {"success": True, "size": len(file_data)}
+            return self._transfer_tree(
+                "smb-dir-download",
+                root,
+                lambda remote_path: self._list_remote_directory(share_name, remote_path),
+                lambda remote_path: os.makedirs(_local_path(remote_path), exist_ok=True),
+                _download,
+                discover_callback,
+                file_callback,
+                is_cancelled,
+                pause_gate=pause_gate,
+            )
 
         except Exception as e:
-            error_msg = f"上传文件失败: {str(e)}"
+            error_msg = f"下载目录失败: {str(e)}"
             logger.error(error_msg)
             return {"success": False, "error": error_msg}
 
-    def delete_file(self, share_name, file_path):
+    def sync_directory(
+        self,
+        share_name,
+        dir_path,
+        local_dir,
+        delete=False,
+        verify_content=False,
+        dry_run=False,
+        progress_callback=None,
+        discover_callback=None,
+        file_callback=None,
+        is_cancelled=None,
+        pause_gate=None,
+    ):
         """
-        删除文件
+        将远程目录同步（镜像）到本地目录，只下载新增和变化的文件
+
+        远程目录经由目录缓存列出（新鲜的缓存直接使用），按大小和修改时间与本地文件比较；
+        大小相同而修改时间不同的文件在 verify_content 时比较内容摘要，否则按变化处理。
+        文件先下载到临时文件再替换，本地修改时间设为远程修改时间
 
         Args:
             share_name (str): 共享名称
-            file_path (str): 文件路径
+            dir_path (str): 远程目录路径（相对共享根目录）
+            local_dir (str): 本地目录
+            delete (bool): 是否删除远程已不存在的本地文件和目录
+            verify_content (bool): 是否对无法仅凭大小和时间判断的文件比较内容
+            dry_run (bool): 只生成计划，不做任何修改
+            progress_callback (callable): 每写入一块数据调用一次，参数为字节数
+            discover_callback (callable): 计划生成后调用一次，参数为待下载的文件数和字节数
+            file_callback (callable): 每个文件结束时调用一次，参数为远程路径和是否成功
+            is_cancelled (callable): 返回True时停止
+            pause_gate (callable): 见 _transfer_tree
 
         Returns:
-            dict: 删除结果
+            dict: dry_run 时包含 plan 摘要；否则包含 new、changed、deleted、unchanged、verified、bytes、failed
         """
         try:
-            if not self.connected or not self.smb:
+            if not self.connected or not self.pool:
                 return {"success": False, "error": "未连接到服务器"}
 
-            logger.info(f"删除文件: {share_name}\\{file_path}")
+            root = (dir_path or "").replace("/", "\\").strip("\\")
+            logger.info(f"同步目录: {share_name}\\{root} -> {local_dir}，dry_run={dry_run}")
 
-            # 连接到共享
-            self.smb.connectTree(share_name)
+            def _cancelled():
+                return bool(is_cancelled and is_cancelled())
 
-            # 统一路径格式
-            normalized_path = file_path.replace("/", "\\").lstrip("\\")
+            def _local_path(relative):
+                return os.path.join(local_dir, *relative.split("\\"))
 
-            # 删除文件
-            self.smb.deleteFile(share_name, normalized_path)
-            logger.info("文件删除成功")
+            def _remote_path(relative):
+                return f"{root}\\{relative}" if root else relative
 
-            self._invalidate_parent_directory_cache(share_name, file_path)
+            remote_files, remote_dirs = walk_remote(
+                lambda path: self._sync_listing(share_name, path),
+                root,
+                self.directory_walk_workers,
+                is_cancelled,
+            )
+            if _cancelled():
+                return {"success": False, "error": "同步已取消"}
+            local_files, local_dirs = scan_local(local_dir)
+            plan = build_plan(
+                remote_files,
+                local_files,
+                remote_dirs,
+                local_dirs,
+                delete=delete,
+                mtime_tolerance=self.sync_mtime_tolerance,
+            )
+            summary = summarize_plan(plan)
+            logger.info(
+                f"同步计划: 新增 {summary['new']}，变化 {summary['changed']}，待确认 {summary['ambiguous']}，"
+                f"删除 {summary['deleted']}，未变化 {summary['unchanged']}"
+            )
+            if dry_run:
+                return {"success": True, "plan": summary}
 
-            return {"success": True, "message": "文件已删除"}
+            state = {"verified": 0, "bytes": 0, "failed": []}
+            lock = threading.Lock()
+            workers = ThreadPoolExecutor(
+                max_workers=self.directory_transfer_workers, thread_name_prefix="smb-sync"
+            )
+
+            def _fail(relative, error):
+                logger.warning(f"同步失败 {relative}: {error}")
+                with lock:
+                    state["failed"].append({"path": relative, "error": error})
+                if file_callback:
+                    file_callback(_remote_path(relative), False)
+
+            def _verify(item):
+                # 内容相同只需修正本地修改时间，不再下载
+                relative = item["path"]
+                local_path = _local_path(item["local"])
+                try:
+                    remote_digest = self._remote_digest(share_name, _remote_path(relative))
+                    if remote_digest != _local_digest(local_path):
+                        return item
+                except Exception as e:
+                    logger.warning(f"比较内容失败 {relative}，按变化处理: {e}")
+                    return item
+                os.utime(local_path, (item["mtime"], item["mtime"]))
+                with lock:
+                    state["verified"] += 1
+                return None
+
+            def _download(item):
+                relative = item["path"]
+                local_path = _local_path(item["local"])
+                temp_path = local_path + PARTIAL_SUFFIX
+                os.makedirs(os.path.dirname(local_path), exist_ok=True)
+                result = self.download_file(
+                    share_name,
+                    _remote_path(relative),
+                    temp_path,
+                    progress_callback=progress_callback,
+                    file_size=item["size"],
+                    use_content_cache=False,
+                )
+                if not result.get("success"):
+                    if _cancelled():
+                        # 取消时放弃临时文件和续传日志；失败时保留，重试可续传
+                        self.discard_resume_journal(
+                            "download", share_name, _remote_path(relative), temp_path
+                        )
+                        if os.path.exists(temp_path):
+                            os.remove(temp_path)
+                        return None
+                    return result
+                os.replace(temp_path, local_path)
+                os.utime(local_path, (item["mtime"], item["mtime"]))
+                with lock:
+                    state["bytes"] += result.get("size") or 0
+                if file_callback:
+                    file_callback(_remote_path(relative), True)
+                return result
+
+            def _download_item(item):
+                # 因暂停而中断的文件恢复后重新下载（从续传点继续），最终仍失败才记录
+                result = self._transfer_with_pause(
+                    item, None, lambda item, _: _run(_download, item), pause_gate, _cancelled
+                )
+                if result is not None and not result.get("success"):
+                    _fail(item["path"], result.get("error"))
+
+            def _run(func, item):
+                try:
+                    if not _cancelled():
+                        return func(item)
+                except Exception as e:
+                    _fail(item["path"], str(e))
+                return None
+
+            try:
+                changed = list(plan[SYNC_CHANGED])
+                if plan[SYNC_AMBIGUOUS]:
+                    if verify_content:
+                        verified = workers.map(lambda item: _run(_verify, item), plan[SYNC_AMBIGUOUS])
+                        changed.extend(item for item in verified if item is not None)
+                    else:
+                        changed.extend(plan[SYNC_AMBIGUOUS])
+                downloads = plan[SYNC_NEW] + changed
+                if discover_callback:
+                    discover_callback(len(downloads), sum(item["size"] for item in downloads))
+
+                # 远程的空目录也在本地建立
+                for relative in remote_dirs:
+                    os.makedirs(_local_path(relative), exist_ok=True)
+                list(workers.map(_download_item, downloads))
+            finally:
+                workers.shutdown(wait=False)
+
+            deleted = 0
+            if delete and not _cancelled():
+                for item in plan[SYNC_DELETED]:
+                    try:
+                        os.remove(_local_path(item["local"]))
+                        deleted += 1
+                    except OSError as e:
+                        _fail(item["path"], str(e))
+                for relative in plan["deleted_dirs"]:
+                    try:
+                        os.rmdir(_local_path(relative))
+                    except OSError:
+                        # 目录中还有同步之外的文件（如失败留下的临时文件）时保留
+                        pass
+
+            result = {
+                "success": not state["failed"] and not _cancelled(),
+                "new": len(plan[SYNC_NEW]),
+                "changed": len(changed),
+                "deleted": deleted,
+                "unchanged": summary["unchanged"],
+                "verified": state["verified"],
+                "files": len(downloads) - len(state["failed"]),
+                "bytes": state["bytes"],
+                "failed": state["failed"][:100],
+            }
+            if _cancelled():
+                result["error"] = "同步已取消"
+            elif state["failed"]:
+                result["error"] = f"{len(state['failed'])} 个文件同步失败"
+            logger.info(
+                f"同步结束: {share_name}\\{root} -> 下载 {result['files']} 个文件（{result['bytes']} 字节），"
+                f"删除 {deleted} 个，内容相同 {state['verified']} 个，失败 {len(state['failed'])} 个"
+            )
+            return result
 
         except Exception as e:
-            error_msg = f"删除文件失败: {str(e)}"
+            error_msg = f"同步目录失败: {str(e)}"
             logger.error(error_msg)
             return {"success": False, "error": error_msg}
 
-    def _normalize_cache_key(self, path):
-        if not path or path in ("\\", "\\\\"):
-            return "__root__"
-
-        normalized = path.replace("/", "\\")
-        while "\\\\" in normalized:
-            normalized = normalized.replace("\\\\", "\\")
-
-        if not normalized.startswith("\\"):
-            normalized = "\\" + normalized
-        if not normalized.endswith("\\"):
-            normalized = normalized + "\\"
+    def _sync_listing(self, share_name, dir_path):
+        """同步时列出远程目录：与 list_directory 走同一条缓存路径，新鲜的缓存直接使用"""
+        path = f"\\{share_name}\\{dir_path}\\" if dir_path else f"\\{share_name}\\"
+        cache_key = self._normalize_cache_key(path)
+        cached_listing = self._get_cached_directory(cache_key)
+        if cached_listing is not None and self._is_cache_fresh(cache_key, cached_listing):
+            return cached_listing
+        result = self._fetch_directory(path, cache_key)
+        if not result.get("success"):
+            raise RuntimeError(result.get("error"))
+        return result["listing"]
+
+    def _remote_digest(self, share_name, file_path):
+        """流式读取远程文件并计算 SHA-1"""
+        with self._connection() as conn:
+
+            def _hash(tree_id):
+                digest = hashlib.sha1()
+                self._get_file(conn, tree_id, share_name, file_path, digest.update)
+                return digest.hexdigest()
+
+            return self._with_tree(conn, share_name, _hash)
+
+    def grep_directory(
+        self,
+        share_name,
+        dir_path,
+        pattern,
+        extensions=(),
+        max_file_size=None,
+        match_callback=None,
+        discover_callback=None,
+        file_callback=None,
+        is_cancelled=None,
+    ):
+        """
+        在远程目录树的文件内容中搜索
 
-        return normalized.lower()
+        列目录与读取文件并行进行，每个文件按流水线读取的数据块依次交给 LineMatcher，
+        内存中只保留当前块和未结束的一行；扩展名或大小不符的文件在列目录时即被跳过
 
-    def _get_cached_directory(self, cache_key):
-        if not cache_key:
-            return None
+        Args:
+            share_name (str): 共享名称
+            dir_path (str): 起始目录（相对共享根目录，空字符串表示整个共享）
+            pattern (re.Pattern): content_search.compile_pattern 生成的字节正则
+            extensions (tuple): 只搜索这些扩展名（小写、带点），为空时搜索所有文件
+            max_file_size (int): 跳过大于该大小的文件，为None时使用 content_search_max_file_size
+            match_callback (callable): match_callback(path, offset, line, text)，返回False时停止整个搜索
+            discover_callback (callable): 每列完一个目录调用一次，参数为待搜索的文件数和字节数
+            file_callback (callable): 每个文件结束时调用，参数为路径、是否成功、读取字节数、是否匹配
+            is_cancelled (callable): 返回True时停止发起新的列目录/读取
 
+        Returns:
+            dict: 搜索结果，包含 files、bytes、failed
+        """
         try:
-            data = self.directory_cache[cache_key]
-            return copy.deepcopy(data)
-        except KeyError:
-            return None
-
-    def _set_directory_cache(self, cache_key, data):
-        if not cache_key or not isinstance(data, dict):
-            return
-
-        self.directory_cache[cache_key] = copy.deepcopy(data)
-        logger.info(f"[缓存写入] key={cache_key}")
+            if not self.connected or not self.pool:
+                return {"success": False, "error": "未连接到服务器"}
 
-    def _invalidate_cache_key(self, cache_key):
-        if cache_key in self.directory_cache:
-            logger.info(f"缓存失效 key={cache_key}")
-            self.directory_cache.pop(cache_key, None)
+            root = (dir_path or "").replace("/", "\\").strip("\\")
+            if max_file_size is None:
+                max_file_size = self.content_search_max_file_size
+            logger.info(f"搜索文件内容: {share_name}\\{root} {pattern.pattern!r}")
 
-    def _invalidate_parent_directory_cache(self, share_name, file_path):
-        cache_path = self._build_directory_cache_path(share_name, file_path)
-        if cache_path:
-            cache_key = self._normalize_cache_key(cache_path)
-            self._invalidate_cache_key(cache_key)
+            def _list(remote_path):
+                return [
+                    (name, is_directory, size)
+                    for name, is_directory, size in self._list_remote_directory(
+                        share_name, remote_path
+                    )
+                    if is_directory
+                    or (
+                        (not max_file_size or size <= max_file_size)
+                        and (not extensions or name.lower().endswith(tuple(extensions)))
+                    )
+                ]
+
+            def _grep(remote_path, size):
+                result = self._grep_file(
+                    share_name, remote_path, pattern, match_callback, is_cancelled
+                )
+                if file_callback:
+                    file_callback(remote_path, True, result["size"], result["matches"] > 0)
+                return result
 
-    def _build_directory_cache_path(self, share_name, file_path):
-        if not share_name:
-            return None
+            return self._transfer_tree(
+                "smb-grep",
+                root,
+                _list,
+                lambda remote_path: None,
+                _grep,
+                discover_callback,
+                # 成功的文件已在 _grep 中带上字节数和匹配情况回调
+                (lambda path, success: success or file_callback(path, False))
+                if file_callback
+                else None,
+                is_cancelled,
+                workers=self.content_search_workers,
+            )
 
-        relative_path = file_path.replace("/", "\\").strip("\\") if file_path else ""
-        directory_part = ""
-        if relative_path:
-            parts = relative_path.split("\\")
-            if len(parts) > 1:
-                directory_part = "\\".join(parts[:-1])
+        except Exception as e:
+            error_msg = f"搜索文件内容失败: {str(e)}"
+            logger.error(error_msg)
+            return {"success": False, "error": error_msg}
 
-        if directory_part:
-            return f"\\{share_name}\\{directory_part}\\"
+    def _grep_file(self, share_name, file_path, pattern, match_callback=None, is_cancelled=None):
+        """流式读取一个文件并按行匹配，返回读取的字节数和匹配行数"""
+        stop = {"all": False}
+
+        def _on_match(offset, line_number, text):
+            if match_callback and match_callback(file_path, offset, line_number, text) is False:
+                stop["all"] = True
+                raise SearchStopped()
+
+        with self._connection(bulk=True) as conn:
+
+            def _scan(tree_id):
+                # 树连接重连后重试时从头开始，匹配器随之重建
+                matcher = LineMatcher(
+                    pattern, _on_match, max_matches=self.content_search_max_matches_per_file
+                )
+
+                def _feed(data):
+                    if is_cancelled and is_cancelled():
+                        raise SearchStopped()
+                    matcher.feed(data)
+
+                try:
+                    self._get_file(conn, tree_id, share_name, file_path, _feed)
+                    matcher.finish()
+                except SearchStopped:
+                    pass
+                return matcher
+
+            matcher = self._with_tree(conn, share_name, _scan)
+        return {
+            "success": True,
+            "size": matcher.bytes_read,
+            "matches": matcher.matches,
+            "binary": matcher.binary,
+            "stopped": stop["all"],
+        }
+
+    def discard_resume_journal(self, kind, share_name, remote_path, local_path):
+        """放弃续传（如用户取消任务）时删除对应的续传日志"""
+        if kind == "download":
+            path = download_journal_path(local_path)
         else:
-            return f"\\{share_name}\\"
+            path = upload_journal_path(
+                self.resume_journal_dir, self._cache_scope, share_name, remote_path, local_path
+            )
+        TransferJournal(path, {}).delete()
+
+    def _list_remote_listing(self, share_name, dir_path):
+        """直接从服务器列出目录（不读写目录缓存），返回 DirectoryListing"""
+        list_path = f"{dir_path}\\*" if dir_path else "*"
+        with self._connection() as conn:
+            file_list = self._with_tree(
+                conn,
+                share_name,
+                lambda tree_id: conn.smb.listPath(share_name, list_path),
+            )
+        return DirectoryListing.from_shared_files(file_list)
 
-    def get_file_info(self, share_name, file_path):
+    def _list_remote_directory(self, share_name, dir_path):
         """
-        获取文件详细信息
-
-        Args:
-            share_name (str): 共享名称
-            file_path (str): 文件路径
+        直接从服务器列出目录（不读写目录缓存，供递归遍历使用）
 
         Returns:
-            dict: 文件信息
+            list: (名称, 是否目录, 大小) 列表
         """
-        try:
-            if not self.connected or not self.smb:
-                return {"success": False, "error": "未连接到服务器"}
+        listing = self._list_remote_listing(share_name, dir_path)
+        return [
+            (listing.names[i], listing.is_directory(i), listing.sizes[i])
+            for i in range(len(listing))
+        ]
+
+    def _transfer_tree(
+        self,
+        thread_prefix,
+        root,
+        list_directory,
+        prepare_directory,
+        transfer_file,
+        discover_callback=None,
+        file_callback=None,
+        is_cancelled=None,
+        workers=None,
+        pause_gate=None,
+    ):
+        """
+        并行遍历目录树并逐个传输文件
 
-            # 连接到共享
-            tree_id = self.smb.connectTree(share_name)
+        Args:
+            thread_prefix (str): 工作线程名前缀
+            root (str): 起始目录（子路径以反斜杠拼接在其后）
+            list_directory (callable): list_directory(path) -> [(名称, 是否目录, 大小)]
+            prepare_directory (callable): 传输目录中的文件前调用一次（如创建目标目录）
+            transfer_file (callable): transfer_file(path, size) -> 结果字典，返回None表示被取消
+            workers (int): 并行传输文件的线程数，默认 directory_transfer_workers
+            pause_gate (callable): pause_gate(pauses) -> (暂停次数, 期间是否暂停过)，暂停时阻塞到恢复；
+                在文件之间调用（此时不持有会话），因暂停而中断的文件在恢复后重新传输（大文件从续传点继续）
+        """
+        state = {"pending": 0, "files": 0, "bytes": 0, "failed": []}
+        condition = threading.Condition()
+        walkers = ThreadPoolExecutor(
+            max_workers=self.directory_walk_workers,
+            thread_name_prefix=f"{thread_prefix}-walk",
+        )
+        workers = ThreadPoolExecutor(
+            max_workers=workers or self.directory_transfer_workers,
+            thread_name_prefix=thread_prefix,
+        )
+
+        def _cancelled():
+            return bool(is_cancelled and is_cancelled())
+
+        def _fail(path, error):
+            logger.warning(f"传输失败 {path}: {error}")
+            with condition:
+                state["failed"].append({"path": path, "error": error})
+            if file_callback:
+                file_callback(path, False)
+
+        def _submit(executor, func, path, *args):
+            with condition:
+                state["pending"] += 1
+            executor.submit(_task, func, path, *args)
+
+        def _task(func, path, *args):
+            try:
+                if not _cancelled():
+                    func(path, *args)
+            except Exception as e:
+                _fail(path, str(e))
+            finally:
+                with condition:
+                    state["pending"] -= 1
+                    condition.notify_all()
+
+        def _walk(dir_path):
+            entries = list_directory(dir_path)
+            prepare_directory(dir_path)
+            files, total = 0, 0
+            for name, is_directory, size in entries:
+                path = f"{dir_path}\\{name}" if dir_path else name
+                if is_directory:
+                    _submit(walkers, _walk, path)
+                else:
+                    files += 1
+                    total += size
+                    _submit(workers, _transfer, path, size)
+            if discover_callback and files:
+                discover_callback(files, total)
+
+        def _transfer(path, size):
+            result = self._transfer_with_pause(path, size, transfer_file, pause_gate, _cancelled)
+            if result is None:
+                return
+            if not result.get("success"):
+                _fail(path, result.get("error"))
+                return
+            with condition:
+                state["files"] += 1
+                state["bytes"] += result.get("size") or 0
+            if file_callback:
+                file_callback(path, True)
 
-            # 列出指定文件的信息
-            file_list = self.smb.listPath(share_name, file_path)
+        try:
+            _submit(walkers, _walk, root)
+            with condition:
+                while state["pending"]:
+                    condition.wait()
+        finally:
+            walkers.shutdown(wait=False)
+            workers.shutdown(wait=False)
+
+        result = {
+            "success": not state["failed"] and not _cancelled(),
+            "files": state["files"],
+            "bytes": state["bytes"],
+            "failed": state["failed"][:100],
+        }
+        if _cancelled():
+            result["error"] = "传输已取消"
+        elif state["failed"]:
+            result["error"] = f"{len(state['failed'])} 个文件传输失败"
+        logger.info(
+            f"目录传输结束: {root} -> 成功 {state['files']} 个文件，失败 {len(state['failed'])} 个"
+        )
+        return result
+
+    def _transfer_with_pause(self, path, size, transfer_file, pause_gate, is_cancelled):
+        """传输单个文件；暂停时在文件之间等待，因暂停而中断的文件在恢复后重新传输"""
+        pauses = pause_gate(None)[0] if pause_gate else None
+        while True:
+            if is_cancelled():
+                return None
+            result = transfer_file(path, size)
+            if result is None or result.get("success") or not pause_gate:
+                return result
+            pauses, paused = pause_gate(pauses)
+            if not paused or is_cancelled():
+                return result
+            logger.info(f"暂停后继续传输: {path}")
+
+    def _download_sequential(
+        self,
+        share_name,
+        file_path,
+        local_path,
+        progress_callback=None,
+        journal=None,
+        resume_callback=None,
+    ):
+        """在一个会话上顺序下载文件，有续传日志时从上次确认的位置继续"""
+        start = journal.get("offset", 0) if journal else 0
+        if start:
+            start = self._verify_download_tail(share_name, file_path, local_path, start)
+            if start:
+                logger.info(f"[续传] {share_name}\\{file_path} 从 {start} 字节处继续下载")
+                if resume_callback:
+                    resume_callback(start)
+
+        # 保存到本地文件（重试时从本次起点重新写入）
+        with self._connection(bulk=True) as conn:
+
+            def _download(tree_id):
+                # 无缓冲写入，日志中记录的位置之前的数据都已交给操作系统
+                with open(local_path, "r+b" if start else "wb", buffering=0) as f:
+                    f.truncate(start)
+                    f.seek(start)
+                    written = start
+
+                    def _write(data):
+                        nonlocal written
+                        f.write(data)
+                        written += len(data)
+                        if journal:
+                            journal.update("offset", written)
+                        if progress_callback:
+                            progress_callback(len(data))
+
+                    self._get_file(conn, tree_id, share_name, file_path, _write, offset=start)
+
+            self._with_tree(conn, share_name, _download)
+        logger.info(f"文件保存到: {local_path}")
+        return {
+            "success": True,
+            "file_path": local_path,
+            "size": os.path.getsize(local_path),
+            "resumed_from": start,
+        }
+
+    def _open_download_journal(self, share_name, file_path, local_path, file_size):
+        """打开下载续传日志，远程文件大小或修改时间变化、本地文件不存在时从头开始"""
+        identity = {
+            "kind": "download",
+            "scope": self._cache_scope,
+            "share": share_name.lower(),
+            "remote_path": file_path.lower(),
+            "remote_size": file_size,
+            "remote_mtime": self._remote_mtime(share_name, file_path),
+        }
+        journal = TransferJournal.open(download_journal_path(local_path), identity)
+        if journal.progress and not os.path.exists(local_path):
+            journal.progress = {}
+        return journal
+
+    def _remote_mtime(self, share_name, file_path):
+        with self._connection() as conn:
+            entries = self._with_tree(
+                conn,
+                share_name,
+                lambda tree_id: conn.smb.listPath(share_name, file_path),
+            )
+        return entries[0].get_mtime() if entries else None
+
+    def _verify_download_tail(self, share_name, file_path, local_path, offset):
+        """比对本地部分文件与远程文件在续传点之前的尾部字节，一致时返回续传点，否则返回0"""
+        try:
+            offset = min(offset, os.path.getsize(local_path))
+        except OSError:
+            return 0
+        tail = min(self.resume_verify_size, offset)
+        if tail <= 0:
+            return 0
+        with open(local_path, "rb") as f:
+            f.seek(offset - tail)
+            local_tail = f.read(tail)
+        remote_tail = self._with_read_handle(
+            share_name,
+            file_path,
+            lambda conn, tree_id, file_id: conn.smb.readFile(
+                tree_id, file_id, offset - tail, tail, singleCall=False
+            ),
+        )
+        if remote_tail != local_tail:
+            logger.warning(f"[续传] 本地部分文件与远程不一致，重新下载: {local_path}")
+            return 0
+        return offset
+
+    def _download_segmented(
+        self,
+        share_name,
+        file_path,
+        local_path,
+        file_size,
+        progress_callback=None,
+        journal=None,
+        resume_callback=None,
+    ):
+        """
+        将文件按 segment_size 切分，在多个会话上并行读取各段并写入预分配的本地文件
+
+        每段使用独立的本地文件对象按偏移写入；某段失败时从该段已写入的位置重试，
+        超过 segment_retries 次或进度回调抛出异常（如取消）时停止全部分段；
+        有续传日志时各段从记录的位置继续
+        """
+        segments = [
+            (start, min(self.segment_size, file_size - start))
+            for start in range(0, file_size, self.segment_size)
+        ]
+        # 至少留一个会话给浏览和预览，大文件下载不会占满连接池
+        workers = min(self.segment_workers, self.pool.bulk_capacity, len(segments)) or 1
+        logger.info(
+            f"分段下载: {share_name}\\{file_path}, 大小: {file_size} 字节, "
+            f"{len(segments)} 段, {workers} 路并行"
+        )
+
+        # 各段已写入的字节数，续传时沿用日志中的记录（段大小变化或本地文件不完整时作废）
+        progress = {}
+        if journal and journal.get("segment_size") == self.segment_size:
+            try:
+                if os.path.getsize(local_path) == file_size:
+                    progress = {
+                        int(start): written
+                        for start, written in (journal.get("segments") or {}).items()
+                    }
+            except OSError:
+                progress = {}
+        resumed = sum(progress.values())
+        if resumed:
+            logger.info(f"[续传] {share_name}\\{file_path} 已完成 {resumed} 字节，继续分段下载")
+            if resume_callback:
+                resume_callback(resumed)
+        else:
+            # 预分配本地文件，各段直接写到对应偏移
+            with open(local_path, "wb") as f:
+                f.truncate(file_size)
+        if journal:
+            journal.update("segment_size", self.segment_size, force=True)
+        progress_lock = threading.Lock()
+
+        stop = threading.Event()
+
+        def _report(nbytes):
+            if progress_callback:
+                try:
+                    progress_callback(nbytes)
+                except Exception:
+                    stop.set()
+                    raise
+
+        def _download_segment(start, length):
+            written = min(progress.get(start, 0), length)
+            attempt = 0
+            with open(local_path, "r+b", buffering=0) as f:
+
+                def _sink(offset, data):
+                    nonlocal written
+                    if stop.is_set():
+                        raise InterruptedError("分段下载已停止")
+                    f.seek(offset)
+                    f.write(data)
+                    written += len(data)
+                    if journal:
+                        with progress_lock:
+                            progress[start] = written
+                            snapshot = {str(key): value for key, value in progress.items()}
+                        journal.update("segments", snapshot)
+                    _report(len(data))
+
+                def _read(conn, tree_id, file_id):
+                    if supports_pipeline(conn.smb):
+                        pipelined_read(
+                            conn.smb,
+                            tree_id,
+                            file_id,
+                            start + written,
+                            length - written,
+                            _sink,
+                            depth=self.pipeline_depth,
+                            chunk_size=self.segment_read_size,
+                        )
+                    while written < length and not stop.is_set():
+                        data = conn.smb.readFile(
+                            tree_id,
+                            file_id,
+                            start + written,
+                            min(self.segment_read_size, length - written),
+                            singleCall=False,
+                        )
+                        if not data:
+                            raise EOFError(f"文件在 {start + written} 处提前结束")
+                        _sink(start + written, data)
+
+                while written < length and not stop.is_set():
+                    try:
+                        self._with_read_handle(share_name, file_path, _read, bulk=True)
+                    except Exception as e:
+                        attempt += 1
+                        if stop.is_set() or attempt > self.segment_retries:
+                            raise
+                        logger.warning(
+                            f"分段 {start}-{start + length} 读取失败，第 {attempt} 次重试 "
+                            f"(已完成 {written} 字节): {e}"
+                        )
+                        time.sleep(min(0.5 * 2**attempt, 10))
+
+        with ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="smb-segment"
+        ) as executor:
+            futures = [
+                executor.submit(_download_segment, start, length)
+                for start, length in segments
+            ]
+            errors = []
+            for future in futures:
+                try:
+                    future.result()
+                except Exception as e:
+                    stop.set()
+                    errors.append(e)
+
+        if errors:
+            # 其他段因停止信号抛出的 InterruptedError 只是结果，优先抛出真正的原因（如暂停或取消）
+            raise next((e for e in errors if not isinstance(e, InterruptedError)), errors[0])
+
+        logger.info(f"分段下载完成，文件保存到: {local_path}")
+        return {
+            "success": True,
+            "file_path": local_path,
+            "size": file_size,
+            "segments": len(segments),
+        }
+
+    def _get_file(self, conn, tree_id, share_name, file_path, write, offset=0):
+        """
+        从 offset 开始读取远程文件并依次交给 write(data)
+
+        SMB2/3 下在句柄上保持 pipeline_depth 个读请求在途，SMBv1 回退到 getFile/readFile
+        """
+        if not supports_pipeline(conn.smb) and not offset:
+            conn.smb.getFile(share_name, file_path, write)
+            return
+
+        file_id = conn.smb.openFile(
+            tree_id,
+            file_path.replace("/", "\\").lstrip("\\"),
+            desiredAccess=FILE_READ_DATA,
+            shareMode=FILE_SHARE_READ,
+        )
+        try:
+            file_size = conn.smb.queryInfo(tree_id, file_id)["EndOfFile"]
+            if supports_pipeline(conn.smb):
+                pipelined_read(
+                    conn.smb,
+                    tree_id,
+                    file_id,
+                    offset,
+                    max(file_size - offset, 0),
+                    lambda data_offset, data: write(data),
+                    depth=self.pipeline_depth,
+                    chunk_size=self.transfer_chunk_size,
+                )
+                return
+            while offset < file_size:
+                data = conn.smb.readFile(
+                    tree_id,
+                    file_id,
+                    offset,
+                    min(self.transfer_chunk_size, file_size - offset),
+                    singleCall=False,
+                )
+                if not data:
+                    break
+                write(data)
+                offset += len(data)
+        finally:
+            conn.smb.closeFile(tree_id, file_id)
+
+    def _put_file(self, conn, tree_id, share_name, file_path, read, offset=0, on_ack=None):
+        """
+        以 read(size) 提供的数据写入远程文件
+
+        offset 为0时覆盖整个文件，否则打开已有文件从 offset 处续写；
+        SMB2/3 下在句柄上保持 pipeline_depth 个写请求在途，SMBv1 回退到 putFile
+        """
+        if not supports_pipeline(conn.smb):
+            conn.smb.putFile(share_name, file_path, read)
+            return
+
+        file_id = conn.smb.createFile(
+            tree_id,
+            file_path.replace("/", "\\").lstrip("\\"),
+            desiredAccess=FILE_WRITE_DATA,
+            shareMode=FILE_SHARE_WRITE,
+            creationOption=FILE_NON_DIRECTORY_FILE,
+            creationDisposition=FILE_OPEN if offset else FILE_OVERWRITE_IF,
+        )
+        try:
+            pipelined_write(
+                conn.smb,
+                tree_id,
+                file_id,
+                read,
+                offset=offset,
+                depth=self.pipeline_depth,
+                chunk_size=self.transfer_chunk_size,
+                on_ack=on_ack,
+            )
+        finally:
+            conn.smb.closeFile(tree_id, file_id)
+
+    def _verify_upload_tail(self, conn, tree_id, file_path, local_file, offset):
+        """比对远程部分文件与本地文件在续传点之前的尾部字节，一致时返回续传点，否则返回0"""
+        tail = min(self.resume_verify_size, offset)
+        try:
+            file_id = conn.smb.openFile(
+                tree_id,
+                file_path.replace("/", "\\").lstrip("\\"),
+                desiredAccess=FILE_READ_DATA,
+                shareMode=FILE_SHARE_READ | FILE_SHARE_WRITE,
+            )
+        except SessionError as e:
+            if e.getErrorCode() in TREE_RECONNECT_ERRORS:
+                raise
+            return 0
+        try:
+            if conn.smb.queryInfo(tree_id, file_id)["EndOfFile"] < offset:
+                return 0
+            remote_tail = conn.smb.readFile(
+                tree_id, file_id, offset - tail, tail, singleCall=False
+            )
+        finally:
+            conn.smb.closeFile(tree_id, file_id)
+        local_file.seek(offset - tail)
+        if local_file.read(tail) != remote_tail:
+            logger.warning(f"[续传] 远程部分文件与本地不一致，重新上传: {file_path}")
+            return 0
+        return offset
+
+    def read_file_range(
+        self, share_name, file_path, offset=0, length=None, use_content_cache=True
+    ):
+        """
+        按偏移和长度读取远程文件的一段内容
+
+        Args:
+            share_name (str): 共享名称
+            file_path (str): 文件路径
+            offset (int): 起始偏移
+            length (int): 读取长度，为None时读取到文件末尾
+            use_content_cache (bool): 小文件是否经过内容缓存
+
+        Returns:
+            dict: 读取结果，包含 data、offset、next_offset、file_size、eof
+        """
+        try:
+            if not self.connected or not self.pool:
+                return {"success": False, "error": "未连接到服务器"}
+
+            offset = max(int(offset or 0), 0)
+            normalized_path = file_path.replace("/", "\\").lstrip("\\")
+            logger.info(
+                f"范围读取文件: {share_name}\\{normalized_path}, 偏移: {offset}, 长度: {length}"
+            )
+
+            def _read(conn, tree_id, file_id):
+                file_size = conn.smb.queryInfo(tree_id, file_id)["EndOfFile"]
+                remaining = max(file_size - offset, 0)
+                to_read = remaining if length is None else min(int(length), remaining)
+
+                if to_read > 0:
+                    data = conn.smb.readFile(
+                        tree_id, file_id, offset, to_read, singleCall=False
+                    )
+                else:
+                    data = b""
+                return file_size, data
+
+            cached = (
+                self._content_cache_key(share_name, normalized_path)
+                if use_content_cache
+                else None
+            )
+            if cached is not None:
+                key, file_size = cached
+                to_read = max(file_size - offset, 0)
+                if length is not None:
+                    to_read = min(int(length), to_read)
+                file_data = self.content_cache.read(
+                    key,
+                    offset,
+                    to_read,
+                    file_size,
+                    lambda start, size: self._read_remote_range(
+                        share_name, normalized_path, start, size
+                    ),
+                )
+            else:
+                file_size, file_data = self._with_read_handle(
+                    share_name, normalized_path, _read
+                )
+
+            next_offset = offset + len(file_data)
+            logger.info(
+                f"成功读取文件范围，大小: {len(file_data)} 字节 ({offset}-{next_offset}/{file_size})"
+            )
+            return {
+                "success": True,
+                "data": file_data,
+                "size": len(file_data),
+                "offset": offset,
+                "next_offset": next_offset,
+                "file_size": file_size,
+                "eof": next_offset >= file_size,
+            }
+
+        except Exception as e:
+            error_msg = f"读取文件失败: {str(e)}"
+            logger.error(error_msg)
+            return {"success": False, "error": error_msg}
+
+    def get_file_size(self, share_name, file_path):
+        """
+        通过缓存的只读句柄查询文件大小（比listPath少一次目录查询）
+
+        Args:
+            share_name (str): 共享名称
+            file_path (str): 文件路径
+
+        Returns:
+            dict: 查询结果，包含 size
+        """
+        try:
+            if not self.connected or not self.pool:
+                return {"success": False, "error": "未连接到服务器"}
+
+            normalized_path = file_path.replace("/", "\\").lstrip("\\")
+            file_size = self._with_read_handle(
+                share_name,
+                normalized_path,
+                lambda conn, tree_id, file_id: conn.smb.queryInfo(tree_id, file_id)[
+                    "EndOfFile"
+                ],
+            )
+            return {"success": True, "size": file_size}
+
+        except Exception as e:
+            return {"success": False, "error": f"获取文件大小失败: {str(e)}"}
+
+    def stream_file_range(self, share_name, file_path, offset, length, write):
+        """
+        将文件的 [offset, offset+length) 范围按窗口读取并依次交给 write(data)
+
+        每个窗口单独借出会话，在 write 阻塞（如浏览器暂停读取媒体）期间不占用连接池；
+        内存占用不超过一个窗口（pipeline_depth × transfer_chunk_size）
+
+        Args:
+            share_name (str): 共享名称
+            file_path (str): 文件路径
+            offset (int): 起始偏移
+            length (int): 读取长度
+            write (callable): 接收数据块的函数
+
+        Returns:
+            int: 实际交给 write 的字节数
+        """
+        normalized_path = file_path.replace("/", "\\").lstrip("\\")
+        window_size = max(self.pipeline_depth, 1) * self.transfer_chunk_size
+        cached = self._content_cache_key(share_name, normalized_path)
+        end = offset + length
+        total = 0
+
+        while offset < end:
+            to_read = min(window_size, end - offset)
+            if cached is not None:
+                key, file_size = cached
+                data = self.content_cache.read(
+                    key,
+                    offset,
+                    to_read,
+                    file_size,
+                    lambda start, size: self._read_remote_range(
+                        share_name, normalized_path, start, size
+                    ),
+                )
+            else:
+                data = self._read_remote_range(share_name, normalized_path, offset, to_read)
+            if not data:
+                break
+            write(data)
+            offset += len(data)
+            total += len(data)
+        return total
+
+    def _read_remote_range(self, share_name, file_path, offset, length):
+        """在缓存的只读句柄上读取一段内容（SMB2/3 使用流水线读取）"""
+
+        def _read(conn, tree_id, file_id):
+            if supports_pipeline(conn.smb):
+                chunks = []
+                pipelined_read(
+                    conn.smb,
+                    tree_id,
+                    file_id,
+                    offset,
+                    length,
+                    lambda _, data: chunks.append(data),
+                    depth=self.pipeline_depth,
+                    chunk_size=self.transfer_chunk_size,
+                )
+                return b"".join(chunks)
+            return conn.smb.readFile(tree_id, file_id, offset, length, singleCall=False)
+
+        return self._with_read_handle(share_name, file_path, _read)
+
+    def _content_identity(self, share_name, file_path):
+        """
+        获取文件的 (大小, 修改时间)
+
+        父目录的列表缓存仍有效时直接取用，否则查询一次服务器；文件不存在或是目录时返回None
+        """
+        cache_path = self._build_directory_cache_path(share_name, file_path)
+        cache_key = self._normalize_cache_key(cache_path) if cache_path else None
+        name = file_path.split("\\")[-1]
+        listing = self._get_cached_directory(cache_key)
+        if listing is not None and self._is_cache_fresh(cache_key, listing):
+            i = listing.find(name)
+            if i is not None and not listing.is_directory(i):
+                return listing.sizes[i], listing.mtimes[i]
+
+        with self._connection() as conn:
+            entries = self._with_tree(
+                conn,
+                share_name,
+                lambda tree_id: conn.smb.listPath(share_name, file_path),
+            )
+        if not entries or entries[0].is_directory():
+            return None
+        return entries[0].get_filesize(), entries[0].get_mtime()
+
+    def get_file_identity(self, share_name, file_path):
+        """
+        获取文件的大小和修改时间，用于判断缓存的内容、缩略图等是否仍然有效
+
+        Args:
+            share_name (str): 共享名称
+            file_path (str): 文件路径
+
+        Returns:
+            dict: 查询结果，包含 size、mtime（原始FILETIME）
+        """
+        try:
+            if not self.connected or not self.pool:
+                return {"success": False, "error": "未连接到服务器"}
+
+            normalized_path = file_path.replace("/", "\\").lstrip("\\")
+            identity = self._content_identity(share_name, normalized_path)
+            if identity is None:
+                return {"success": False, "error": f"文件不存在: {file_path}"}
+            size, mtime = identity
+            return {"success": True, "size": size, "mtime": mtime, "scope": self._cache_scope}
+
+        except Exception as e:
+            return {"success": False, "error": f"获取文件标识失败: {str(e)}"}
+
+    def _content_cache_key(self, share_name, file_path):
+        """可使用内容缓存时返回 (缓存键, 文件大小)，否则返回None"""
+        if self.content_cache is None:
+            return None
+        try:
+            identity = self._content_identity(share_name, file_path)
+        except SessionError as e:
+            logger.debug(f"获取文件标识失败，不使用内容缓存: {e}")
+            return None
+        if identity is None:
+            return None
+        size, mtime = identity
+        if size > self.content_cache_max_file_size:
+            return None
+        key = content_key(self._cache_scope, share_name, file_path, size, mtime)
+        return key, size
+
+    def _download_cached(self, share_name, file_path, local_path, cached, progress_callback=None):
+        """经过内容缓存下载小文件，已缓存的块直接从本地写出"""
+        key, file_size = cached
+        from_cache = self.content_cache.contains_range(key, 0, file_size)
+        # 按窗口读取，连续缺失的块可合并为一次流水线读取
+        window_size = max(
+            self.content_cache.block_size, max(self.pipeline_depth, 1) * self.transfer_chunk_size
+        )
+        with open(local_path, "wb") as f:
+            offset = 0
+            while offset < file_size:
+                data = self.content_cache.read(
+                    key,
+                    offset,
+                    window_size,
+                    file_size,
+                    lambda start, size: self._read_remote_range(
+                        share_name, file_path, start, size
+                    ),
+                )
+                if not data:
+                    break
+                f.write(data)
+                offset += len(data)
+                if progress_callback:
+                    progress_callback(len(data))
+        logger.info(f"文件保存到: {local_path}{'（内容缓存命中）' if from_cache else ''}")
+        return {
+            "success": True,
+            "file_path": local_path,
+            "size": os.path.getsize(local_path),
+            "from_cache": from_cache,
+        }
+
+    def upload_file(self, share_name, file_path, file_data):
+        """
+        上传文件
+
+        Args:
+            share_name (str): 共享名称
+            file_path (str): 目标文件路径
+            file_data (bytes): 文件数据
+
+        Returns:
+            dict: 上传结果
+        """
+        try:
+            if not self.connected or not self.pool:
+                return {"success": False, "error": "未连接到服务器"}
+
+            logger.info(
+                f"上传文件: {share_name}\\{file_path}, 大小: {len(file_data)} 字节"
+            )
+
+            self._close_cached_handle(share_name, file_path)
+
+            # 创建内存文件对象
+            memory_file = io.BytesIO()
+            memory_file.write(file_data)
+
+            # 上传文件（重试时从头读取）
+            with self._connection() as conn:
+
+                def _upload(tree_id):
+                    memory_file.seek(0)
+                    self._put_file(conn, tree_id, share_name, file_path, memory_file.read)
+
+                self._with_tree(conn, share_name, _upload)
+            memory_file.close()
+
+            logger.info(f"成功上传文件，大小: {len(file_data)} 字节")
+
+            self._invalidate_parent_directory_cache(share_name, file_path)
+
+            return {"success": True, "size": len(file_data)}
+
+        except Exception as e:
+            error_msg = f"上传文件失败: {str(e)}"
+            logger.error(error_msg)
+            return {"success": False, "error": error_msg}
+
+    def upload_local_file(
+        self,
+        share_name,
+        file_path,
+        local_path,
+        progress_callback=None,
+        invalidate_cache=True,
+        resume_callback=None,
+    ):
+        """
+        从本地文件流式上传，内存占用与文件大小无关，大文件中断后可从已确认的位置续传
+
+        Args:
+            share_name (str): 共享名称
+            file_path (str): 目标文件路径
+            local_path (str): 本地文件路径
+            progress_callback (callable): 每读取一块数据调用一次，参数为字节数
+            invalidate_cache (bool): 是否立即失效父目录缓存（批量上传时由调用方统一失效）
+            resume_callback (callable): 从上次中断处续传时调用一次，参数为已完成的字节数
+
+        Returns:
+            dict: 上传结果
+        """
+        try:
+            if not self.connected or not self.pool:
+                return {"success": False, "error": "未连接到服务器"}
+
+            file_size = os.path.getsize(local_path)
+            logger.info(
+                f"上传本地文件: {local_path} -> {share_name}\\{file_path}, 大小: {file_size} 字节"
+            )
+            self._close_cached_handle(share_name, file_path)
+
+            journal = None
+            if self.resume_enabled and file_size >= self.resume_min_size:
+                stat = os.stat(local_path)
+                identity = {
+                    "kind": "upload",
+                    "scope": self._cache_scope,
+                    "share": share_name.lower(),
+                    "remote_path": file_path.lower(),
+                    "local_path": os.path.abspath(local_path),
+                    "local_size": stat.st_size,
+                    "local_mtime": stat.st_mtime,
+                }
+                journal = TransferJournal.open(
+                    upload_journal_path(
+                        self.resume_journal_dir,
+                        self._cache_scope,
+                        share_name,
+                        file_path,
+                        local_path,
+                    ),
+                    identity,
+                )
+
+            with open(local_path, "rb") as f, self._connection(bulk=True) as conn:
+
+                def _read(size):
+                    data = f.read(size)
+                    if data and progress_callback:
+                        progress_callback(len(data))
+                    return data
+
+                def _upload(tree_id):
+                    start = journal.get("offset", 0) if journal else 0
+                    if start and supports_pipeline(conn.smb):
+                        start = self._verify_upload_tail(conn, tree_id, file_path, f, start)
+                        if start:
+                            logger.info(f"[续传] {share_name}\\{file_path} 从 {start} 字节处继续上传")
+                            if resume_callback:
+                                resume_callback(start)
+                    else:
+                        start = 0
+                    f.seek(start)
+                    self._put_file(
+                        conn,
+                        tree_id,
+                        share_name,
+                        file_path,
+                        _read,
+                        offset=start,
+                        on_ack=(lambda end: journal.update("offset", end)) if journal else None,
+                    )
+
+                try:
+                    self._with_tree(conn, share_name, _upload)
+                except BaseException:
+                    if journal:
+                        journal.save()
+                    raise
+
+            if journal:
+                journal.delete()
+            logger.info(f"成功上传文件，大小: {file_size} 字节")
+
+            if invalidate_cache:
+                self._invalidate_parent_directory_cache(share_name, file_path)
+
+            return {"success": True, "size": file_size}
+
+        except (TransferPaused, TransferCancelled) as e:
+            # 用户暂停或取消不是失败，续传日志已保存
+            logger.info(f"上传文件中断: {share_name}\\{file_path} ({e})")
+            return {"success": False, "error": str(e)}
+        except Exception as e:
+            error_msg = f"上传文件失败: {str(e)}"
+            logger.error(error_msg)
+            return {"success": False, "error": error_msg}
+
+    def upload_directory(
+        self,
+        share_name,
+        dir_path,
+        local_dir,
+        progress_callback=None,
+        discover_callback=None,
+        file_callback=None,
+        is_cancelled=None,
+        pause_gate=None,
+    ):
+        """
+        将本地目录整体上传到远程目录，保持目录结构
+
+        先一次性遍历本地目录并建立远程目录骨架，再并行上传文件，结束后统一失效一次目录缓存
+
+        Args:
+            share_name (str): 共享名称
+            dir_path (str): 远程目标目录（不存在时自动创建）
+            local_dir (str): 本地目录
+            progress_callback (callable): 每读取一块数据调用一次，参数为字节数
+            discover_callback (callable): 参数为新发现的文件数和字节数
+            file_callback (callable): 每个文件结束时调用一次，参数为远程路径和是否成功
+            is_cancelled (callable): 返回True时停止发起新的上传
+            pause_gate (callable): 见 _transfer_tree
+
+        Returns:
+            dict: 上传结果，包含 files、bytes、failed
+        """
+        try:
+            if not self.connected or not self.pool:
+                return {"success": False, "error": "未连接到服务器"}
+            if not os.path.isdir(local_dir):
+                return {"success": False, "error": f"本地目录不存在: {local_dir}"}
+
+            root = (dir_path or "").replace("/", "\\").strip("\\")
+            logger.info(f"上传目录: {local_dir} -> {share_name}\\{root}")
+
+            # 遍历本地目录：远程目录 -> [(名称, 是否目录, 大小)]，远程文件 -> 本地文件
+            entries = {}
+            local_files = {}
+            for current, dir_names, file_names in os.walk(local_dir):
+                relative = os.path.relpath(current, local_dir)
+                parts = [] if relative == os.curdir else relative.split(os.sep)
+                remote_current = "\\".join([part for part in [root] + parts if part])
+                listing = [(name, True, 0) for name in sorted(dir_names)]
+                for name in sorted(file_names):
+                    local_path = os.path.join(current, name)
+                    try:
+                        size = os.path.getsize(local_path)
+                    except OSError:
+                        continue
+                    listing.append((name, False, size))
+                    remote_path = f"{remote_current}\\{name}" if remote_current else name
+                    local_files[remote_path] = local_path
+                entries[remote_current] = listing
+
+            created = self._ensure_remote_directories(share_name, list(entries))
+
+            def _upload(remote_path, size):
+                result = self.upload_local_file(
+                    share_name,
+                    remote_path,
+                    local_files[remote_path],
+                    progress_callback=progress_callback,
+                    invalidate_cache=False,
+                )
+                if not result.get("success") and is_cancelled and is_cancelled():
+                    # 取消导致的中断，删除远程残留文件
+                    self.delete_file(share_name, remote_path)
+                    return None
+                return result
+
+            try:
+                return self._transfer_tree(
+                    "smb-dir-upload",
+                    root,
+                    lambda remote_path: entries.get(remote_path, []),
+                    lambda remote_path: None,
+                    _upload,
+                    discover_callback,
+                    file_callback,
+                    is_cancelled,
+                    pause_gate=pause_gate,
+                )
+            finally:
+                # 所有受影响目录统一失效一次
+                for remote_dir in set(entries) | created:
+                    self._invalidate_cache_key(
+                        self._normalize_cache_key(f"\\{share_name}\\{remote_dir}\\")
+                    )
+                self._invalidate_parent_directory_cache(share_name, root)
+
+        except Exception as e:
+            error_msg = f"上传目录失败: {str(e)}"
+            logger.error(error_msg)
+            return {"success": False, "error": error_msg}
+
+    def _ensure_remote_directories(self, share_name, dir_paths):
+        """
+        按父目录优先的顺序创建远程目录，已存在的目录直接跳过
+
+        Returns:
+            set: 本次实际创建的目录
+        """
+        known = set()  # 已确认存在（或刚创建）的目录，避免重复 createDirectory
+        created = set()
+        with self._connection() as conn:
+            for dir_path in sorted(dir_paths, key=lambda path: path.count("\\")):
+                parts = [part for part in dir_path.split("\\") if part]
+                for depth in range(1, len(parts) + 1):
+                    path = "\\".join(parts[:depth])
+                    if path.lower() in known:
+                        continue
+                    try:
+                        self._with_tree(
+                            conn,
+                            share_name,
+                            lambda tree_id: conn.smb.createDirectory(share_name, path),
+                        )
+                        created.add(path)
+                    except SessionError as e:
+                        if e.getErrorCode() != nt_errors.STATUS_OBJECT_NAME_COLLISION:
+                            raise
+                    known.add(path.lower())
+        logger.info(f"远程目录骨架就绪: 新建 {len(created)} 个目录")
+        return created
+
+    def begin_upload(self, share_name, file_path, total_size=None):
+        """
+        开始分块上传会话，打开远程文件句柄
+
+        Args:
+            share_name (str): 共享名称
+            file_path (str): 目标文件路径
+            total_size (int): 文件总大小（可选，仅用于进度统计）
+
+        Returns:
+            dict: 包含 upload_id 和建议块大小的结果
+        """
+        try:
+            if not self.connected or not self.pool:
+                return {"success": False, "error": "未连接到服务器"}
+
+            normalized_path = file_path.replace("/", "\\").lstrip("\\")
+            logger.info(
+                f"开始分块上传: {share_name}\\{normalized_path}, 总大小: {total_size}"
+            )
+
+            self._close_cached_handle(share_name, normalized_path)
+
+            # 句柄只在打开它的会话内有效，上传会话记录该会话，后续数据块都在其上写入
+            with self._connection() as conn:
+
+                def _create(tree_id):
+                    file_id = conn.smb.createFile(
+                        tree_id,
+                        normalized_path,
+                        desiredAccess=FILE_WRITE_DATA,
+                        shareMode=FILE_SHARE_READ,
+                        creationOption=FILE_NON_DIRECTORY_FILE,
+                        creationDisposition=FILE_OVERWRITE_IF,
+                    )
+                    return tree_id, file_id
+
+                tree_id, file_id = self._with_tree(conn, share_name, _create)
+
+            upload_id = uuid.uuid4().hex
+            with self._upload_lock:
+                self.upload_sessions[upload_id] = {
+                    "share_name": share_name,
+                    "file_path": normalized_path,
+                    "conn": conn,
+                    "tree_id": tree_id,
+                    "file_id": file_id,
+                    "offset": 0,
+                    "total_size": total_size,
+                    "lock": threading.Lock(),
+                }
+
+            logger.info(f"上传会话已创建: {upload_id}")
+            return {
+                "success": True,
+                "upload_id": upload_id,
+                "chunk_size": self.upload_chunk_size,
+            }
+
+        except Exception as e:
+            error_msg = f"创建上传会话失败: {str(e)}"
+            logger.error(error_msg)
+            return {"success": False, "error": error_msg}
+
+    def append_upload_chunk(self, upload_id, chunk, offset=None):
+        """
+        向上传会话写入一个数据块
+
+        Args:
+            upload_id (str): 上传会话ID
+            chunk (bytes): 数据块
+            offset (int): 写入偏移，为None时追加到已写入数据之后
+
+        Returns:
+            dict: 写入结果，包含当前已写入字节数
+        """
+        session = self.upload_sessions.get(upload_id)
+        if not session:
+            return {"success": False, "error": f"上传会话不存在: {upload_id}"}
+
+        try:
+            with session["lock"], self._connection(session["conn"]) as conn:
+                write_offset = session["offset"] if offset is None else int(offset)
+                conn.smb.writeFile(
+                    session["tree_id"], session["file_id"], chunk, write_offset
+                )
+                session["offset"] = max(session["offset"], write_offset + len(chunk))
+                written = session["offset"]
+
+            logger.debug(f"上传会话 {upload_id} 已写入 {written} 字节")
+            return {
+                "success": True,
+                "bytes_written": written,
+                "total_size": session["total_size"],
+            }
+
+        except Exception as e:
+            error_msg = f"写入数据块失败: {str(e)}"
+            logger.error(error_msg)
+            return {"success": False, "error": error_msg}
+
+    def commit_upload(self, upload_id):
+        """
+        完成上传会话，关闭远程文件句柄
+
+        Args:
+            upload_id (str): 上传会话ID
+
+        Returns:
+            dict: 上传结果
+        """
+        with self._upload_lock:
+            session = self.upload_sessions.pop(upload_id, None)
+        if not session:
+            return {"success": False, "error": f"上传会话不存在: {upload_id}"}
+
+        try:
+            with session["lock"], self._connection(session["conn"]) as conn:
+                conn.smb.closeFile(session["tree_id"], session["file_id"])
+
+            logger.info(
+                f"分块上传完成: {session['share_name']}\\{session['file_path']}, 大小: {session['offset']} 字节"
+            )
+            self._invalidate_parent_directory_cache(
+                session["share_name"], session["file_path"]
+            )
+            return {"success": True, "size": session["offset"]}
+
+        except Exception as e:
+            error_msg = f"完成上传失败: {str(e)}"
+            logger.error(error_msg)
+            return {"success": False, "error": error_msg}
+
+    def abort_upload(self, upload_id):
+        """
+        取消上传会话，关闭句柄并删除已写入的部分文件
+
+        Args:
+            upload_id (str): 上传会话ID
+
+        Returns:
+            dict: 取消结果
+        """
+        with self._upload_lock:
+            session = self.upload_sessions.pop(upload_id, None)
+        if not session:
+            return {"success": False, "error": f"上传会话不存在: {upload_id}"}
+
+        try:
+            with session["lock"], self._connection(session["conn"]) as conn:
+                try:
+                    conn.smb.closeFile(session["tree_id"], session["file_id"])
+                except Exception as e:
+                    logger.warning(f"关闭上传句柄失败: {e}")
+                conn.smb.deleteFile(session["share_name"], session["file_path"])
+
+            logger.info(f"上传会话已取消: {upload_id}")
+            self._invalidate_parent_directory_cache(
+                session["share_name"], session["file_path"]
+            )
+            return {"success": True, "message": "上传已取消"}
+
+        except Exception as e:
+            error_msg = f"取消上传失败: {str(e)}"
+            logger.error(error_msg)
+            return {"success": False, "error": error_msg}
+
+    def _abort_all_uploads(self):
+        """关闭所有未完成的上传句柄"""
+        with self._upload_lock:
+            upload_ids = list(self.upload_sessions.keys())
+        for upload_id in upload_ids:
+            self.abort_upload(upload_id)
+
+    def delete_file(self, share_name, file_path):
+        """
+        删除文件
+
+        Args:
+            share_name (str): 共享名称
+            file_path (str): 文件路径
+
+        Returns:
+            dict: 删除结果
+        """
+        try:
+            if not self.connected or not self.pool:
+                return {"success": False, "error": "未连接到服务器"}
+
+            logger.info(f"删除文件: {share_name}\\{file_path}")
+
+            # 统一路径格式
+            normalized_path = file_path.replace("/", "\\").lstrip("\\")
+            self._close_cached_handle(share_name, normalized_path)
+
+            # 删除文件
+            with self._connection() as conn:
+                self._with_tree(
+                    conn,
+                    share_name,
+                    lambda tree_id: conn.smb.deleteFile(share_name, normalized_path),
+                )
+            logger.info("文件删除成功")
+
+            self._invalidate_parent_directory_cache(share_name, file_path)
+
+            return {"success": True, "message": "文件已删除"}
+
+        except Exception as e:
+            error_msg = f"删除文件失败: {str(e)}"
+            logger.error(error_msg)
+            return {"success": False, "error": error_msg}
+
+    def rename(self, share_name, old_path, new_path, overwrite=False):
+        """
+        重命名或移动文件/目录（同一共享内，由服务器完成，不传输数据）
+
+        Args:
+            share_name (str): 共享名称
+            old_path (str): 原路径
+            new_path (str): 新路径
+            overwrite (bool): 目标已存在时是否覆盖（SMBv1 不支持覆盖）
+
+        Returns:
+            dict: 重命名结果
+        """
+        try:
+            if not self.connected or not self.pool:
+                return {"success": False, "error": "未连接到服务器"}
+
+            old_normalized = old_path.replace("/", "\\").strip("\\")
+            new_normalized = new_path.replace("/", "\\").strip("\\")
+            if not old_normalized or not new_normalized:
+                return {"success": False, "error": "路径不能为空"}
+            if new_normalized.lower().startswith(old_normalized.lower() + "\\"):
+                return {"success": False, "error": "不能移动到自身的子目录中"}
+            logger.info(f"重命名: {share_name}\\{old_normalized} -> {new_normalized}")
+
+            # 缓存的只读句柄不允许删除共享，会导致重命名失败
+            self._close_cached_handle(share_name, old_normalized, recursive=True)
+            self._close_cached_handle(share_name, new_normalized)
+
+            with self._connection() as conn:
+                if supports_pipeline(conn.smb):
+                    self._with_tree(
+                        conn,
+                        share_name,
+                        lambda tree_id: rename_path(
+                            conn.smb, tree_id, old_normalized, new_normalized, replace=overwrite
+                        ),
+                    )
+                else:
+                    self._with_tree(
+                        conn,
+                        share_name,
+                        lambda tree_id: conn.smb.rename(share_name, old_normalized, new_normalized),
+                    )
+            logger.info("重命名成功")
+
+            # 原目录若是文件夹，其下所有已缓存的列表路径都已失效
+            self._invalidate_cache_subtree(
+                self._normalize_cache_key(f"\\{share_name}\\{old_normalized}\\")
+            )
+            self._invalidate_parent_directory_cache(share_name, old_normalized)
+            self._invalidate_parent_directory_cache(share_name, new_normalized)
+            return {"success": True, "message": "重命名成功"}
+
+        except Exception as e:
+            error_msg = f"重命名失败: {str(e)}"
+            logger.error(error_msg)
+            return {"success": False, "error": error_msg}
+
+    def copy_file(self, share_name, source_path, target_path, overwrite=False, progress_callback=None):
+        """
+        复制文件（同一共享内）
+
+        SMB2/3 使用服务端复制（FSCTL_SRV_COPYCHUNK），数据不经过客户端；
+        SMBv1 或服务器不支持时回退为下载到临时文件再上传
+
+        Args:
+            share_name (str): 共享名称
+            source_path (str): 源文件路径
+            target_path (str): 目标文件路径
+            overwrite (bool): 目标已存在时是否覆盖
+            progress_callback (callable): 复制过程中调用，参数为新完成的字节数
+
+        Returns:
+            dict: 复制结果，包含 size 和 method（server_side 或 client）
+        """
+        try:
+            if not self.connected or not self.pool:
+                return {"success": False, "error": "未连接到服务器"}
+
+            source = source_path.replace("/", "\\").strip("\\")
+            target = target_path.replace("/", "\\").strip("\\")
+            if source.lower() == target.lower():
+                return {"success": False, "error": "源文件和目标文件相同"}
+            logger.info(f"复制文件: {share_name}\\{source} -> {target}")
+            self._close_cached_handle(share_name, target)
+
+            with self._connection() as conn:
+                if supports_pipeline(conn.smb):
+                    try:
+                        size = self._with_tree(
+                            conn,
+                            share_name,
+                            lambda tree_id: self._server_side_copy(
+                                conn, tree_id, share_name, source, target, overwrite, progress_callback
+                            ),
+                        )
+                        logger.info(f"服务端复制完成: {size} 字节")
+                        self._invalidate_parent_directory_cache(share_name, target)
+                        return {"success": True, "size": size, "method": "server_side"}
+                    except ServerCopyUnsupported as e:
+                        logger.info(f"服务器不支持服务端复制，回退到下载再上传: {e}")
+
+            result = self._copy_through_client(
+                share_name, source, target, overwrite, progress_callback
+            )
+            self._invalidate_parent_directory_cache(share_name, target)
+            return result
+
+        except Exception as e:
+            error_msg = f"复制文件失败: {str(e)}"
+            logger.error(error_msg)
+            return {"success": False, "error": error_msg}
+
+    def _server_side_copy(self, conn, tree_id, share_name, source, target, overwrite, progress_callback):
+        """打开源和目标并在服务器上复制，返回复制的字节数；不支持时抛出 ServerCopyUnsupported"""
+        source_id = conn.smb.openFile(
+            tree_id, source, desiredAccess=FILE_READ_DATA, shareMode=FILE_SHARE_READ
+        )
+        try:
+            size = conn.smb.queryInfo(tree_id, source_id)["EndOfFile"]
+            # 先确认服务器支持服务端复制，不支持时目标尚未创建，已存在的目标文件保持原样
+            resume_key = source_resume_key(conn.smb, tree_id, source_id)
+            target_id = conn.smb.createFile(
+                tree_id,
+                target,
+                desiredAccess=FILE_READ_DATA | FILE_WRITE_DATA,
+                shareMode=FILE_SHARE_READ,
+                creationOption=FILE_NON_DIRECTORY_FILE,
+                creationDisposition=FILE_OVERWRITE_IF if overwrite else FILE_CREATE,
+            )
+            try:
+                return server_side_copy(
+                    conn.smb,
+                    tree_id,
+                    source_id,
+                    target_id,
+                    size,
+                    progress_callback=progress_callback,
+                    resume_key=resume_key,
+                )
+            except Exception:
+                # 复制失败或服务器不支持时删除不完整的目标（回退方式会重新创建）
+                conn.smb.closeFile(tree_id, target_id)
+                target_id = None
+                try:
+                    conn.smb.deleteFile(share_name, target)
+                except Exception as e:
+                    logger.warning(f"删除不完整的复制目标失败: {e}")
+                raise
+            finally:
+                if target_id is not None:
+                    conn.smb.closeFile(tree_id, target_id)
+        finally:
+            conn.smb.closeFile(tree_id, source_id)
+
+    def _copy_through_client(self, share_name, source, target, overwrite, progress_callback):
+        """下载到本地临时文件后再上传（SMBv1 或服务器不支持服务端复制时使用）"""
+        if not overwrite and self._remote_exists(share_name, target):
+            return {"success": False, "error": "目标文件已存在"}
+        temp_dir = tempfile.mkdtemp(prefix="smb-copy-")
+        temp_path = os.path.join(temp_dir, "data")
+        try:
+            result = self.download_file(
+                share_name, source, temp_path, use_content_cache=False, segmented=False
+            )
+            if not result.get("success"):
+                return result
+            result = self.upload_local_file(
+                share_name,
+                target,
+                temp_path,
+                progress_callback=progress_callback,
+                invalidate_cache=False,
+            )
+            if not result.get("success"):
+                return result
+            return {"success": True, "size": os.path.getsize(temp_path), "method": "client"}
+        finally:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+    def _remote_exists(self, share_name, file_path):
+        parent, _, name = file_path.rpartition("\\")
+        listing = self._list_remote_listing(share_name, parent)
+        return listing.find(name) is not None
+
+    def delete_paths(self, share_name, items):
+        """
+        批量删除文件和文件夹
+
+        文件夹先完整遍历，再按后序（先文件、再由深到浅的子目录、最后文件夹本身）删除；
+        删除在 delete_workers 个线程中并行进行，全部结束后统一失效一次受影响的目录缓存
+        （父目录以及被删除文件夹下所有已缓存的子目录）
+
+        Args:
+            share_name (str): 共享名称
+            items (list): 路径字符串，或 {"path": 路径, "is_directory": 是否文件夹}；
+                未给出类型时通过列出父目录判断
+
+        Returns:
+            dict: results 为每个路径的结果（path、success、error、files、directories），
+            以及删除的文件数和文件夹数
+        """
+        try:
+            if not self.connected or not self.pool:
+                return {"success": False, "error": "未连接到服务器"}
+
+            entries = self._resolve_delete_items(share_name, items)
+            logger.info(f"批量删除: {share_name} 共 {len(entries)} 项")
+            parent_keys = set()
+            subtree_keys = set()
+            results = []
+            executor = ThreadPoolExecutor(
+                max_workers=self.delete_workers, thread_name_prefix="smb-delete"
+            )
+
+            def _delete(path, is_directory):
+                # 每个删除借出一个会话，在缓存的树连接上完成
+                with self._connection() as conn:
+                    if supports_pipeline(conn.smb):
+                        self._with_tree(
+                            conn,
+                            share_name,
+                            lambda tree_id: delete_path(conn.smb, tree_id, path, is_directory),
+                        )
+                    elif is_directory:
+                        conn.smb.deleteDirectory(share_name, path)
+                    else:
+                        conn.smb.deleteFile(share_name, path)
+
+            def _try_delete(path, is_directory):
+                try:
+                    _delete(path, is_directory)
+                    return None
+                except Exception as e:
+                    logger.warning(f"删除失败 {path}: {e}")
+                    return f"{path}: {e}"
+
+            try:
+                for path, is_directory in entries:
+                    self._close_cached_handle(share_name, path, recursive=is_directory)
+                    parent_keys.add(
+                        self._normalize_cache_key(self._build_directory_cache_path(share_name, path))
+                    )
+
+                # 单独的文件一起并行删除
+                files = [path for path, is_directory in entries if is_directory is False]
+                for path, error in zip(files, executor.map(lambda path: _try_delete(path, False), files)):
+                    results.append(
+                        {"path": path, "success": error is None, "error": error, "files": 0 if error else 1, "directories": 0}
+                    )
+
+                for path, is_directory in entries:
+                    if is_directory is None:
+                        results.append({"path": path, "success": False, "error": "文件或文件夹不存在", "files": 0, "directories": 0})
+                    elif is_directory:
+                        subtree_keys.add(self._normalize_cache_key(f"\\{share_name}\\{path}\\"))
+                        results.append(self._delete_tree(share_name, path, executor, _try_delete))
+            finally:
+                executor.shutdown(wait=False)
+                # 无论成功与否，受影响的目录都统一失效一次
+                self._invalidate_cache_keys(parent_keys, subtree_keys)
+
+            failed = [result for result in results if not result["success"]]
+            deleted_files = sum(result["files"] for result in results)
+            deleted_directories = sum(result["directories"] for result in results)
+            logger.info(
+                f"批量删除结束: 文件 {deleted_files} 个，文件夹 {deleted_directories} 个，失败 {len(failed)} 项"
+            )
+            response = {
+                "success": not failed,
+                "results": results,
+                "deleted_files": deleted_files,
+                "deleted_directories": deleted_directories,
+            }
+            if failed:
+                response["error"] = f"{len(failed)} 项删除失败"
+            return response
+
+        except Exception as e:
+            error_msg = f"批量删除失败: {str(e)}"
+            logger.error(error_msg)
+            return {"success": False, "error": error_msg}
+
+    def _resolve_delete_items(self, share_name, items):
+        """
+        规范化待删除的条目并补全类型
+
+        Returns:
+            list: (路径, 是否文件夹) 列表，不存在的条目类型为None；
+            已包含在其他待删除文件夹中的条目被去掉
+        """
+        entries = {}
+        unknown = {}
+        for item in items or ():
+            if isinstance(item, dict):
+                path, is_directory = item.get("path"), item.get("is_directory")
+            else:
+                path, is_directory = item, None
+            path = (path or "").replace("/", "\\").strip("\\")
+            if not path:
+                continue
+            entries[path.lower()] = (path, is_directory)
+            if is_directory is None:
+                parent, _, name = path.rpartition("\\")
+                unknown.setdefault(parent, []).append((path, name))
+
+        # 未给出类型的条目按父目录分组，每个父目录只列一次
+        for parent, paths in unknown.items():
+            listing = self._list_remote_listing(share_name, parent)
+            for path, name in paths:
+                index = listing.find(name)
+                entries[path.lower()] = (path, None if index is None else listing.is_directory(index))
+
+        directories = [key + "\\" for key, (_, is_directory) in entries.items() if is_directory]
+        return [
+            entry
+            for key, entry in entries.items()
+            if not any(key.startswith(prefix) for prefix in directories)
+        ]
+
+    def _delete_tree(self, share_name, dir_path, executor, try_delete):
+        """后序删除文件夹：先并行删除全部文件，再由深到浅删除子目录，最后删除文件夹本身"""
+        try:
+            files, directories = walk_remote(
+                lambda path: self._list_remote_listing(share_name, path),
+                dir_path,
+                self.directory_walk_workers,
+            )
+        except Exception as e:
+            return {"path": dir_path, "success": False, "error": str(e), "files": 0, "directories": 0}
+
+        errors = []
+        file_paths = [f"{dir_path}\\{relative}" for relative in files]
+        file_errors = list(executor.map(lambda path: try_delete(path, False), file_paths))
+        errors.extend(error for error in file_errors if error)
+
+        # 同一深度的子目录互不依赖，可以并行删除
+        by_depth = {}
+        for relative in directories:
+            by_depth.setdefault(relative.count("\\"), []).append(f"{dir_path}\\{relative}")
+        deleted_directories = 0
+        for depth in sorted(by_depth, reverse=True):
+            level_errors = list(executor.map(lambda path: try_delete(path, True), by_depth[depth]))
+            deleted_directories += sum(1 for error in level_errors if not error)
+            errors.extend(error for error in level_errors if error)
+
+        error = try_delete(dir_path, True)
+        if error:
+            errors.append(error)
+        else:
+            deleted_directories += 1
+
+        deleted_files = sum(1 for error in file_errors if not error)
+        logger.info(
+            f"删除文件夹 {share_name}\\{dir_path}: 文件 {deleted_files} 个，文件夹 {deleted_directories} 个，失败 {len(errors)} 项"
+        )
+        return {
+            "path": dir_path,
+            "success": not errors,
+            "error": f"{len(errors)} 项删除失败，如 {errors[0]}" if errors else None,
+            "files": deleted_files,
+            "directories": deleted_directories,
+        }
+
+    def _normalize_cache_key(self, path):
+        if not path or path in ("\\", "\\\\"):
+            return "__root__"
+
+        normalized = path.replace("/", "\\")
+        while "\\\\" in normalized:
+            normalized = normalized.replace("\\\\", "\\")
+
+        if not normalized.startswith("\\"):
+            normalized = "\\" + normalized
+        if not normalized.endswith("\\"):
+            normalized = normalized + "\\"
+
+        return normalized.lower()
+
+    def _get_cached_directory(self, cache_key):
+        if not cache_key:
+            return None
+
+        try:
+            with self._cache_lock:
+                return self.directory_cache[cache_key]
+        except KeyError:
+            pass
+
+        if not self.persistent_cache or not self._cache_scope:
+            return None
+        epoch = self._cache_epoch
+        listing = self.persistent_cache.get(self._cache_scope, cache_key)
+        if listing is None:
+            return None
+        logger.info(f"[持久缓存命中] key={cache_key}，已缓存 {int(listing.age())} 秒")
+        with self._cache_lock:
+            # 读取持久缓存期间发生过失效时，该行可能已被删除，不能再提升回内存
+            if epoch != self._cache_epoch:
+                logger.info(f"[缓存跳过] key={cache_key}，读取持久缓存期间缓存已失效")
+                return None
+            self.directory_cache.setdefault(cache_key, listing)
+            return self.directory_cache.get(cache_key, listing)
+
+    def _set_directory_cache(self, cache_key, listing, epoch=None):
+        if not cache_key or not isinstance(listing, DirectoryListing):
+            return
+
+        # 列表不可变，直接共享存储，无需复制
+        with self._cache_lock:
+            if epoch is not None and epoch != self._cache_epoch:
+                logger.info(f"[缓存跳过] key={cache_key}，获取期间缓存已失效")
+                return
+            previous = self.directory_cache.get(cache_key)
+            self.directory_cache[cache_key] = listing
+            # 持久缓存与内存在同一把锁内更新，失效不会夹在两者之间
+            if self.persistent_cache and self._cache_scope:
+                if previous is not None and previous.names is listing.names:
+                    self.persistent_cache.touch(self._cache_scope, cache_key, listing.fetched_at)
+                else:
+                    self.persistent_cache.put(self._cache_scope, cache_key, listing)
+        logger.info(f"[缓存写入] key={cache_key}")
+
+    def _invalidate_cache_key(self, cache_key):
+        with self._cache_lock:
+            self._cache_epoch += 1
+            if cache_key in self.directory_cache:
+                logger.info(f"缓存失效 key={cache_key}")
+                self.directory_cache.pop(cache_key, None)
+            if self.persistent_cache and self._cache_scope:
+                self.persistent_cache.delete(self._cache_scope, cache_key)
+
+    def _invalidate_cache_subtree(self, cache_key):
+        """失效目录及其所有子目录的缓存（删除或重命名目录后调用）"""
+        self._invalidate_cache_keys((), (cache_key,))
+
+    def _invalidate_cache_keys(self, cache_keys=(), subtree_keys=()):
+        """一次性失效多个目录及多个子树的缓存（批量操作结束时调用，只递增一次 epoch）"""
+        with self._cache_lock:
+            self._cache_epoch += 1
+            removed = [key for key in cache_keys if self.directory_cache.pop(key, None) is not None]
+            for cache_key in subtree_keys:
+                removed.extend(self.directory_cache.pop_subtree(cache_key))
+            # 持锁删除持久缓存行，并发查找不会在删除前把旧行提升回内存
+            if self.persistent_cache and self._cache_scope:
+                for cache_key in cache_keys:
+                    self.persistent_cache.delete(self._cache_scope, cache_key)
+                for cache_key in subtree_keys:
+                    self.persistent_cache.delete_subtree(self._cache_scope, cache_key)
+        if removed:
+            logger.info(f"缓存失效 {len(removed)} 个目录")
+
+    def clear_directory_cache(self, share_name=None):
+        """
+        清空目录缓存（内存与持久缓存）
+
+        Args:
+            share_name (str): 只清空该共享下的目录，为空时清空当前服务器的全部目录缓存
+
+        Returns:
+            dict: 清除的内存缓存目录数
+        """
+        if share_name:
+            cache_key = self._normalize_cache_key(f"\\{share_name}\\")
+            with self._cache_lock:
+                self._cache_epoch += 1
+                removed = len(self.directory_cache.pop_subtree(cache_key))
+                if self.persistent_cache and self._cache_scope:
+                    self.persistent_cache.delete_subtree(self._cache_scope, cache_key)
+        else:
+            with self._cache_lock:
+                self._cache_epoch += 1
+                removed = len(self.directory_cache)
+                self.directory_cache.clear()
+                if self.persistent_cache and self._cache_scope:
+                    self.persistent_cache.clear(self._cache_scope)
+        logger.info(f"清空目录缓存 {share_name or '全部'}: {removed} 个目录")
+        return {"success": True, "removed": removed}
+
+    def cached_directories(self, path):
+        """列出内存中该目录（含自身）及其下已缓存的目录路径"""
+        with self._cache_lock:
+            return self.directory_cache.keys_under(self._normalize_cache_key(path))
+
+    def _invalidate_parent_directory_cache(self, share_name, file_path):
+        cache_path = self._build_directory_cache_path(share_name, file_path)
+        if cache_path:
+            cache_key = self._normalize_cache_key(cache_path)
+            self._invalidate_cache_key(cache_key)
+
+    def _build_directory_cache_path(self, share_name, file_path):
+        if not share_name:
+            return None
+
+        relative_path = file_path.replace("/", "\\").strip("\\") if file_path else ""
+        directory_part = ""
+        if relative_path:
+            parts = relative_path.split("\\")
+            if len(parts) > 1:
+                directory_part = "\\".join(parts[:-1])
+
+        if directory_part:
+            return f"\\{share_name}\\{directory_part}\\"
+        else:
+            return f"\\{share_name}\\"
+
+    def _get_tree_id(self, conn, share_name):
+        """获取会话上共享的树连接ID，优先复用缓存"""
+        key = share_name.lower()
+        tree_id = conn.trees.get(key)
+        if tree_id is None:
+            tree_id = conn.smb.connectTree(share_name)
+            conn.trees[key] = tree_id
+            logger.info(f"成功连接到共享: {share_name} (tree_id={tree_id})")
+        return tree_id
+
+    def _invalidate_tree(self, conn, share_name):
+        """丢弃会话上共享的树连接缓存，并关闭该共享上缓存的句柄"""
+        key = share_name.lower()
+        with self._handle_lock:
+            entries = [
+                conn.handles.pop(handle_key)
+                for handle_key in list(conn.handles)
+                if handle_key[0] == key
+            ]
+        for entry in entries:
+            self._close_handle_entry(conn, entry)
+
+        tree_id = conn.trees.pop(key, None)
+        if tree_id is None:
+            return
+
+        try:
+            conn.smb.disconnectTree(tree_id)
+        except Exception as e:
+            logger.debug(f"断开树连接失败 {share_name}: {e}")
+            self._forget_tree(conn, share_name, tree_id)
+
+    def _forget_tree(self, conn, share_name, tree_id):
+        """服务端已删除树连接时，清理impacket内部的树连接表，避免再次拿到失效ID"""
+        try:
+            session = getattr(conn.smb.getSMBServer(), "_Session", None)
+            if not session or "TreeConnectTable" not in session:
+                return
+            table = session["TreeConnectTable"]
+            table.pop(tree_id, None)
+            table.pop(share_name, None)
+        except Exception as e:
+            logger.debug(f"清理树连接表失败 {share_name}: {e}")
+
+    def _with_tree(self, conn, share_name, operation):
+        """在会话缓存的树连接上执行操作，树连接失效时重连并重试一次"""
+        tree_id = self._get_tree_id(conn, share_name)
+        try:
+            return operation(tree_id)
+        except SessionError as e:
+            if e.getErrorCode() not in TREE_RECONNECT_ERRORS:
+                raise
+            logger.warning(f"树连接已失效，重新连接共享: {share_name}")
+            self._invalidate_tree(conn, share_name)
+            return operation(self._get_tree_id(conn, share_name))
+
+    def _with_read_handle(self, share_name, file_path, operation, bulk=False):
+        """借出会话并在其缓存的只读句柄上执行操作，句柄失效时重新打开并重试一次"""
+        with self._connection(bulk=bulk) as conn:
+            try:
+                tree_id, file_id = self._get_read_handle(conn, share_name, file_path)
+                return operation(conn, tree_id, file_id)
+            except SessionError as e:
+                if e.getErrorCode() not in HANDLE_INVALID_ERRORS:
+                    raise
+                logger.warning(f"文件句柄已失效，重新打开: {share_name}\\{file_path}")
+                self._drop_handle(conn, share_name, file_path)
+                if e.getErrorCode() in TREE_RECONNECT_ERRORS:
+                    self._invalidate_tree(conn, share_name)
+                tree_id, file_id = self._get_read_handle(conn, share_name, file_path)
+                return operation(conn, tree_id, file_id)
+
+    def _get_read_handle(self, conn, share_name, file_path):
+        """获取会话上文件的只读句柄，优先复用缓存，超出容量或空闲超时的句柄会被关闭"""
+        key = (share_name.lower(), file_path.lower())
+        now = time.monotonic()
+        self._evict_idle_handles(conn, now)
+        with self._handle_lock:
+            entry = conn.handles.get(key)
+            if entry:
+                entry["last_used"] = now
+                conn.handles.move_to_end(key)
+                return entry["tree_id"], entry["file_id"]
+
+        # 允许他人读写删除，避免缓存的句柄阻塞上传或删除
+        tree_id, file_id = self._with_tree(
+            conn,
+            share_name,
+            lambda tree_id: (
+                tree_id,
+                conn.smb.openFile(
+                    tree_id,
+                    file_path,
+                    desiredAccess=FILE_READ_DATA,
+                    shareMode=FILE_SHARE_READ | FILE_SHARE_WRITE | FILE_SHARE_DELETE,
+                ),
+            ),
+        )
+        evicted = []
+        with self._handle_lock:
+            conn.handles[key] = {
+                "tree_id": tree_id,
+                "file_id": file_id,
+                "last_used": now,
+            }
+            while len(conn.handles) > self.handle_cache_max_entries:
+                evicted.append(conn.handles.popitem(last=False)[1])
+        for entry in evicted:
+            self._close_handle_entry(conn, entry)
+        return tree_id, file_id
+
+    def _evict_idle_handles(self, conn, now):
+        with self._handle_lock:
+            expired = [
+                key
+                for key, entry in conn.handles.items()
+                if now - entry["last_used"] > self.handle_cache_idle_timeout
+            ]
+            entries = [conn.handles.pop(key) for key in expired]
+        for entry in entries:
+            self._close_handle_entry(conn, entry)
+
+    def _close_handle_entry(self, conn, entry):
+        try:
+            conn.smb.closeFile(entry["tree_id"], entry["file_id"])
+        except Exception as e:
+            logger.debug(f"关闭缓存句柄失败: {e}")
+
+    def _drop_handle(self, conn, share_name, file_path):
+        """从会话的句柄缓存中移除并关闭指定文件的句柄（调用方已持有该会话）"""
+        key = (share_name.lower(), file_path.lower())
+        with self._handle_lock:
+            entry = conn.handles.pop(key, None)
+        if entry:
+            self._close_handle_entry(conn, entry)
+
+    def _close_cached_handle(self, share_name, file_path, recursive=False):
+        """
+        关闭所有会话上指定文件的缓存句柄（写入、删除、重命名前调用）
+
+        recursive 时同时关闭该路径下所有文件的句柄（目录删除/重命名前调用）；
+        会话正忙时无法立即关闭，句柄记入pending_close，下次借出该会话时关闭
+        """
+        if not self.pool:
+            return
+
+        normalized_path = file_path.replace("/", "\\").strip("\\").lower()
+        share_key = share_name.lower()
+        prefix = normalized_path + "\\"
+        for conn in self.pool.connections():
+            with self._handle_lock:
+                keys = [
+                    key
+                    for key in conn.handles
+                    if key[0] == share_key
+                    and (key[1] == normalized_path or (recursive and key[1].startswith(prefix)))
+                ]
+                entries = [conn.handles.pop(key) for key in keys]
+            if not entries:
+                continue
+            if self.pool.try_acquire(conn):
+                try:
+                    for entry in entries:
+                        self._close_handle_entry(conn, entry)
+                finally:
+                    self.pool.checkin(conn)
+            else:
+                with self._handle_lock:
+                    conn.pending_close.extend(entries)
+
+    def _flush_pending_handles(self, conn):
+        """关闭会话上等待关闭的句柄"""
+        with self._handle_lock:
+            entries = conn.pending_close[:]
+            conn.pending_close.clear()
+        for entry in entries:
+            self._close_handle_entry(conn, entry)
+
+    def _disconnect_trees(self):
+        """关闭所有会话上缓存的句柄并断开缓存的树连接"""
+        for conn in self.pool.connections():
+            try:
+                with self._connection(conn):
+                    for share_name in list(conn.trees):
+                        self._invalidate_tree(conn, share_name)
+            except Exception as e:
+                logger.debug(f"释放会话资源失败: {e}")
+
+    def get_file_info(self, share_name, file_path):
+        """
+        获取文件详细信息
+
+        Args:
+            share_name (str): 共享名称
+            file_path (str): 文件路径
+
+        Returns:
+            dict: 文件信息
+        """
+        try:
+            if not self.connected or not self.pool:
+                return {"success": False, "error": "未连接到服务器"}
+
+            # 列出指定文件的信息
+            with self._connection() as conn:
+                file_list = self._with_tree(
+                    conn,
+                    share_name,
+                    lambda tree_id: conn.smb.listPath(share_name, file_path),
+                )
 
             if not file_list:
                 return {"success": False, "error": f"文件不存在: {file_path}"}
@@ -561,19 +3285,7 @@ class SMBHandler:
             file_obj = file_list[0]
 
             # 处理时间戳
-            try:
-                timestamp = file_obj.get_mtime()
-                if timestamp > 100000000000000000:
-                    unix_timestamp = (timestamp - 116444736000000000) / 10000000
-                    formatted_time = datetime.datetime.fromtimestamp(
-                        unix_timestamp
-                    ).strftime("%Y-%m-%d %H:%M:%S")
-                else:
-                    formatted_time = datetime.datetime.fromtimestamp(
-                        timestamp / 100000000
-                    ).strftime("%Y-%m-%d %H:%M:%S")
-            except:
-                formatted_time = "Unknown"
+            formatted_time = format_filetime(file_obj.get_mtime())
 
             file_info = {
                 "success": True,
@@ -594,17 +3306,133 @@ class SMBHandler:
         except Exception as e:
             return {"success": False, "error": f"获取文件信息失败: {str(e)}"}
 
+    def start_index_crawl(self, share_name, restart=False):
+        """
+        在后台爬取共享并建立文件名索引，上次未完成时从中断处继续
+
+        Args:
+            share_name (str): 共享名称
+            restart (bool): 清空该共享已有的索引重新爬取
+
+        Returns:
+            dict: 启动结果
+        """
+        try:
+            if not self.connected or not self.pool:
+                return {"success": False, "error": "未连接到服务器"}
+            if not self.search_index:
+                return {"success": False, "error": "搜索索引不可用"}
+
+            key = share_name.lower()
+            crawler = self._crawlers.get(key)
+            if crawler is None or not crawler.running:
+                crawler = ShareCrawler(
+                    self.search_index,
+                    self._cache_scope,
+                    share_name,
+                    self._list_remote_listing,
+                    workers=self.index_crawl_workers,
+                    max_depth=self.index_max_depth,
+                    max_entries=self.index_max_entries,
+                )
+                self._crawlers[key] = crawler
+                crawler.start(restart=restart)
+            return {"success": True}
+
+        except Exception as e:
+            return {"success": False, "error": f"启动索引失败: {str(e)}"}
+
+    def stop_index_crawl(self, share_name):
+        """停止爬取，已爬取的部分保留，下次启动时继续"""
+        crawler = self._crawlers.get(share_name.lower())
+        if crawler:
+            crawler.stop()
+        return {"success": True}
+
+    def get_index_status(self, share_name):
+        """
+        获取共享的索引状态
+
+        Returns:
+            dict: 包含 state、entries（已索引条目数）、pending（待爬取目录数）等
+        """
+        try:
+            if not self.search_index or not self._cache_scope:
+                return {"success": False, "error": "搜索索引不可用"}
+
+            crawl = self.search_index.get_crawl(self._cache_scope, share_name) or {}
+            crawler = self._crawlers.get(share_name.lower())
+            return {
+                "success": True,
+                "state": crawl.get("state") or "none",
+                "running": bool(crawler and crawler.running),
+                "entries": self.search_index.count(self._cache_scope, share_name),
+                "pending": self.search_index.queue_size(self._cache_scope, share_name),
+                "directories": crawl.get("directories", 0),
+                "errors": crawl.get("errors", 0),
+                "started_at": crawl.get("started_at"),
+                "finished_at": crawl.get("finished_at"),
+            }
+
+        except Exception as e:
+            return {"success": False, "error": f"获取索引状态失败: {str(e)}"}
+
+    def search_files(self, query, share_name=None, offset=0, limit=50):
+        """
+        在本地索引中按文件名搜索（不访问服务器）
+
+        Args:
+            query (str): 名称中包含的文本（不区分大小写）
+            share_name (str): 只搜索指定共享，None 表示当前服务器的全部已索引共享
+            offset (int): 分页起始位置
+            limit (int): 每页条数
+
+        Returns:
+            dict: 包含 total 和 results
+        """
+        try:
+            if not self.search_index or not self._cache_scope:
+                return {"success": False, "error": "搜索索引不可用"}
+
+            started = time.perf_counter()
+            total, results = self.search_index.search(
+                self._cache_scope, query, share_name, offset, limit
+            )
+            elapsed = (time.perf_counter() - started) * 1000
+            logger.info(f"[搜索] '{query}' -> {total} 条匹配，耗时 {elapsed:.1f}ms")
+            return {
+                "success": True,
+                "total": total,
+                "offset": offset,
+                "results": results,
+            }
+
+        except Exception as e:
+            return {"success": False, "error": f"搜索失败: {str(e)}"}
+
+    def _stop_crawlers(self):
+        for crawler in self._crawlers.values():
+            crawler.stop()
+        self._crawlers.clear()
+
     def disconnect(self):
         """断开连接"""
         try:
-            if self.smb and self.connected:
-                self.smb.close()
+            if self._watcher:
+                self._watcher.stop()
+                self._watcher = None
+            self._stop_crawlers()
+            if self.pool and self.connected:
+                self._stop_background()
+                self._abort_all_uploads()
+                self._disconnect_trees()
+                self.pool.close()
                 self.connected = False
                 logger.info("SMB连接已断开")
         except Exception as e:
             logger.error(f"断开连接时出错: {str(e)}")
-
-            self.smb = None
+        finally:
+            self.pool = None
             self.connected = False
             self.domain = None
             self.username = None
@@ -618,3 +3446,8 @@ class SMBHandler:
             self.smb_version = None
             self.current_share = None
             self.current_path = "\\"
+            self._cache_scope = None
+            # 内存缓存键不含服务器信息，断开后不能留给下一个连接
+            with self._cache_lock:
+                self._cache_epoch += 1
+                self.directory_cache.clear()
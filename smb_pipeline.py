@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+流水线读写
+在同一个已打开的句柄上保持多个 READ/WRITE 请求同时在途，吞吐量不再受限于 往返时延 × 块大小；
+仅支持SMB2/3，SMBv1 由调用方回退到 getFile/putFile
+"""
+
+import logging
+from collections import deque
+from functools import wraps
+from impacket import nt_errors, smb3
+from impacket.smb3 import SMB3
+from impacket.smbconnection import SessionError
+from impacket.smb3structs import (
+    SMB2_DIALECT_002,
+    SMB2_READ,
+    SMB2_WRITE,
+    SMB2Read,
+    SMB2Read_Response,
+    SMB2Write,
+    SMB2Write_Response,
+)
+
+logger = logging.getLogger(__name__)
+
+# 不支持多信用（multi-credit）的连接每个请求最多64KB
+SINGLE_CREDIT_SIZE = 65536
+
+
+def _translate_errors(func):
+    """与SMBConnection一致，将底层smb3.SessionError转换为smbconnection.SessionError"""
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        try:
+            return func(*args, **kwargs)
+        except smb3.SessionError as e:
+            raise SessionError(e.get_error_code(), e.get_error_packet())
+
+    return wrapper
+
+
+def supports_pipeline(smb):
+    """判断连接是否可以使用流水线读写（SMB2/3）"""
+    return isinstance(smb.getSMBServer(), SMB3)
+
+
+def negotiate_chunk_size(smb, requested, write=False):
+    """
+    根据服务器协商的最大读/写长度确定每个请求的块大小
+
+    Args:
+        smb (SMBConnection): 已登录的连接
+        requested (int): 期望的块大小
+        write (bool): True 表示写请求
+
+    Returns:
+        int: 实际使用的块大小
+    """
+    connection = smb.getSMBServer()._Connection
+    limit = connection["MaxWriteSize"] if write else connection["MaxReadSize"]
+    if connection["Dialect"] == SMB2_DIALECT_002 or not connection["SupportsMultiCredit"]:
+        limit = min(limit, SINGLE_CREDIT_SIZE)
+    return max(min(int(requested), limit), 1)
+
+
+def _credit_charge(connection, length):
+    if connection["Dialect"] != SMB2_DIALECT_002 and connection["SupportsMultiCredit"]:
+        return 1 + (max(length, 1) - 1) // 65536
+    return None
+
+
+def _send_request(server, packet, charge):
+    """
+    发送请求并立即按 CreditCharge 预留序列号
+
+    impacket 发送时 MessageID 只加1，收到响应后才补上 CreditCharge - 1；
+    流水线在响应到达前就发出下一个请求，不预留的话其 MessageID 会落在上一个请求占用的范围内
+    """
+    message_id = server.sendSMB(packet)
+    if charge is not None:
+        server._Connection["SequenceWindow"] += charge - 1
+    return message_id
+
+
+def _recv_response(server, message_id):
+    """接收指定请求的响应，撤销 impacket 收到响应时对序列窗口的重复推进（发送时已预留）"""
+    window = server._Connection["SequenceWindow"]
+    answer = server.recvSMB(message_id)
+    server._Connection["SequenceWindow"] = window
+    return answer
+
+
+def _drain(server, in_flight):
+    """出错后收取剩余在途请求的响应，保持连接上的请求/响应一一对应"""
+    while in_flight:
+        message_id = in_flight.popleft()[0]
+        try:
+            _recv_response(server, message_id)
+        except Exception as e:
+            logger.debug(f"丢弃在途响应失败: {e}")
+            return
+
+
+@_translate_errors
+def pipelined_read(smb, tree_id, file_id, offset, length, sink, depth=4, chunk_size=1024 * 1024):
+    """
+    从文件读取 [offset, offset+length) 范围，最多 depth 个读请求同时在途
+
+    数据按偏移顺序交给 sink(offset, data)；遇到文件结尾时提前结束
+
+    Returns:
+        int: 实际读取的字节数
+    """
+    server = smb.getSMBServer()
+    connection = server._Connection
+    chunk_size = negotiate_chunk_size(smb, chunk_size)
+    depth = max(int(depth), 1)
+    end = offset + length
+    next_offset = offset
+    total = 0
+    in_flight = deque()  # (message_id, offset, length)
+
+    def _send(read_offset, read_length):
+        packet = server.SMB_PACKET()
+        packet["Command"] = SMB2_READ
+        packet["TreeID"] = tree_id
+        charge = _credit_charge(connection, read_length)
+        if charge is not None:
+            packet["CreditCharge"] = charge
+        request = SMB2Read()
+        request["Padding"] = 0x50
+        request["FileID"] = file_id
+        request["Length"] = read_length
+        request["Offset"] = read_offset
+        packet["Data"] = request
+        in_flight.append((_send_request(server, packet, charge), read_offset, read_length))
+
+    try:
+        while in_flight or next_offset < end:
+            while len(in_flight) < depth and next_offset < end:
+                read_length = min(chunk_size, end - next_offset)
+                _send(next_offset, read_length)
+                next_offset += read_length
+
+            message_id, read_offset, read_length = in_flight.popleft()
+            answer = _recv_response(server, message_id)
+            if answer["Status"] == nt_errors.STATUS_END_OF_FILE:
+                _drain(server, in_flight)
+                break
+            answer.isValidAnswer(nt_errors.STATUS_SUCCESS)
+            data = SMB2Read_Response(answer["Data"])["Buffer"]
+            if data:
+                sink(read_offset, data)
+                total += len(data)
+            if len(data) < read_length:
+                if not data:
+                    _drain(server, in_flight)
+                    break
+                # 短读：剩余部分必须先于后续已发出的请求交给sink，同步补读
+                remaining_offset = read_offset + len(data)
+                remaining = read_length - len(data)
+                while remaining > 0:
+                    data = smb.readFile(tree_id, file_id, remaining_offset, remaining)
+                    if not data:
+                        _drain(server, in_flight)
+                        return total
+                    sink(remaining_offset, data)
+                    total += len(data)
+                    remaining_offset += len(data)
+                    remaining -= len(data)
+    except BaseException:
+        _drain(server, in_flight)
+        raise
+    return total
+
+
+@_translate_errors
+def pipelined_write(
+    smb, tree_id, file_id, source, offset=0, depth=4, chunk_size=1024 * 1024, on_ack=None
+):
+    """
+    从 source(size) 依次取数据写入文件，最多 depth 个写请求同时在途，source 返回空数据时结束
+
+    服务器按顺序确认每个写请求后调用 on_ack(end_offset)，end_offset 之前的数据均已写入
+
+    Returns:
+        int: 写入的总字节数
+    """
+    server = smb.getSMBServer()
+    connection = server._Connection
+    chunk_size = negotiate_chunk_size(smb, chunk_size, write=True)
+    depth = max(int(depth), 1)
+    next_offset = offset
+    total = 0
+    finished = False
+    in_flight = deque()  # (message_id, offset, data)
+
+    def _send(write_offset, data):
+        packet = server.SMB_PACKET()
+        packet["Command"] = SMB2_WRITE
+        packet["TreeID"] = tree_id
+        charge = _credit_charge(connection, len(data))
+        if charge is not None:
+            packet["CreditCharge"] = charge
+        request = SMB2Write()
+        request["FileID"] = file_id
+        request["Length"] = len(data)
+        request["Offset"] = write_offset
+        request["WriteChannelInfoOffset"] = 0
+        request["Buffer"] = data
+        packet["Data"] = request
+        in_flight.append((_send_request(server, packet, charge), write_offset, data))
+
+    try:
+        while in_flight or not finished:
+            while len(in_flight) < depth and not finished:
+                data = source(chunk_size)
+                if not data:
+                    finished = True
+                    break
+                _send(next_offset, data)
+                next_offset += len(data)
+
+            if not in_flight:
+                break
+            message_id, write_offset, data = in_flight.popleft()
+            answer = _recv_response(server, message_id)
+            answer.isValidAnswer(nt_errors.STATUS_SUCCESS)
+            written = SMB2Write_Response(answer["Data"])["Count"]
+            if written < len(data):
+                # 短写：同步补写剩余部分
+                written += smb.writeFile(tree_id, file_id, data[written:], write_offset + written)
+                if written < len(data):
+                    raise SessionError(nt_errors.STATUS_DISK_FULL)
+            total += len(data)
+            if on_ack:
+                on_ack(write_offset + len(data))
+    except BaseException:
+        _drain(server, in_flight)
+        raise
+    return total
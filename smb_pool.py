@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+SMB连接池
+为同一服务器维护多个已认证的SMB会话，支持借出/归还、健康检查和空闲回收
+"""
+
+import logging
+import socket
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from impacket import nt_errors
+from impacket.nmb import NetBIOSError
+from impacket.smbconnection import SessionError
+
+logger = logging.getLogger(__name__)
+
+# 出现这些错误时认为整个会话已不可用，连接需要丢弃
+SESSION_BROKEN_ERRORS = (
+    nt_errors.STATUS_USER_SESSION_DELETED,
+    nt_errors.STATUS_NETWORK_SESSION_EXPIRED,
+)
+
+
+def is_connection_error(error):
+    """判断异常是否意味着底层连接/会话已失效"""
+    if isinstance(error, SessionError):
+        return error.getErrorCode() in SESSION_BROKEN_ERRORS
+    return isinstance(error, (NetBIOSError, socket.error, ConnectionError))
+
+
+class PooledConnection:
+    """连接池中的一个SMB会话及其附属状态"""
+
+    def __init__(self, smb):
+        self.smb = smb
+        self.lock = threading.Lock()
+        self.created = time.monotonic()
+        self.last_used = self.created
+        self.broken = False
+        self.bulk = False  # 当前是否被批量传输借出
+        self.trees = {}  # 共享名(小写) -> tree_id，树连接ID只在本会话内有效
+        self.handles = OrderedDict()  # (共享名, 路径) -> 只读句柄信息
+        self.pending_close = []  # 借出期间无法立即关闭、等待下次借出时关闭的句柄
+
+    def close(self):
+        try:
+            self.smb.close()
+        except Exception as e:
+            logger.debug(f"关闭池连接失败: {e}")
+
+
+class SMBConnectionPool:
+    """
+    有上限的SMB会话池
+
+    Args:
+        factory (callable): 创建并登录新SMBConnection的函数
+        max_size (int): 最大会话数
+        min_size (int): 空闲回收时至少保留的会话数
+        idle_timeout (int): 会话空闲超过该秒数后回收
+        health_check_interval (int): 会话空闲超过该秒数后，借出前先做一次echo检查
+        checkout_timeout (int): 等待空闲会话的最长秒数
+        reserved (int): 为交互操作（浏览、预览）保留的会话数，批量传输最多同时借出 max_size - reserved 个
+    """
+
+    def __init__(
+        self,
+        factory,
+        max_size=4,
+        min_size=1,
+        idle_timeout=300,
+        health_check_interval=60,
+        checkout_timeout=60,
+        reserved=1,
+    ):
+        self.factory = factory
+        self.max_size = max(int(max_size), 1)
+        self.min_size = max(int(min_size), 0)
+        self.idle_timeout = idle_timeout
+        self.health_check_interval = health_check_interval
+        self.checkout_timeout = checkout_timeout
+        self.reserved = min(max(int(reserved), 0), self.max_size - 1)
+        self._bulk_active = 0
+        self._connections = []
+        self._creating = 0
+        self._closed = False
+        self._condition = threading.Condition()
+
+    def add(self, smb):
+        """将已建立的连接加入连接池（如connect时创建的首个会话）"""
+        pooled = PooledConnection(smb)
+        with self._condition:
+            self._connections.append(pooled)
+            self._condition.notify()
+        return pooled
+
+    def connections(self):
+        """返回当前所有会话的快照"""
+        with self._condition:
+            return list(self._connections)
+
+    def size(self):
+        with self._condition:
+            return len(self._connections)
+
+    @property
+    def bulk_capacity(self):
+        """批量传输最多同时借出的会话数"""
+        return self.max_size - self.reserved
+
+    def checkout(self, timeout=None, bulk=False):
+        """
+        借出一个空闲会话，没有空闲且未达上限时新建，否则等待归还
+
+        Args:
+            timeout (float): 等待秒数，默认 checkout_timeout
+            bulk (bool): 是否用于批量传输；批量借出达到 bulk_capacity 时等待，保留的会话只给交互操作
+
+        Returns:
+            PooledConnection: 已加锁的会话，用完必须checkin
+        """
+        timeout = self.checkout_timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        evicted = []
+        try:
+            pooled = self._checkout_locked(deadline, evicted, bulk)
+        finally:
+            for idle in evicted:
+                idle.close()
+
+        if not self._check_health(pooled):
+            self.checkin(pooled, discard=True)
+            return self.checkout(max(deadline - time.monotonic(), 0), bulk)
+        return pooled
+
+    def _checkout_locked(self, deadline, evicted, bulk=False):
+        with self._condition:
+            while True:
+                if self._closed:
+                    raise ConnectionError("连接池已关闭")
+
+                evicted.extend(self._evict_idle_locked())
+                if bulk and self._bulk_active >= self.bulk_capacity:
+                    pooled = None
+                else:
+                    for pooled in self._connections:
+                        if pooled.lock.acquire(blocking=False):
+                            break
+                    else:
+                        pooled = None
+
+                if pooled is not None:
+                    self._mark_bulk_locked(pooled, bulk)
+                    return pooled
+
+                if (not bulk or self._bulk_active < self.bulk_capacity) and (
+                    len(self._connections) + self._creating < self.max_size
+                ):
+                    self._creating += 1
+                    self._condition.release()
+                    try:
+                        smb = self.factory()
+                    finally:
+                        self._condition.acquire()
+                        self._creating -= 1
+                    pooled = PooledConnection(smb)
+                    pooled.lock.acquire()
+                    self._mark_bulk_locked(pooled, bulk)
+                    self._connections.append(pooled)
+                    logger.info(f"连接池新建会话，当前会话数: {len(self._connections)}")
+                    return pooled
+
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError("等待空闲SMB会话超时")
+                self._condition.wait(remaining)
+
+    def _mark_bulk_locked(self, pooled, bulk):
+        pooled.bulk = bulk
+        if bulk:
+            self._bulk_active += 1
+
+    def acquire(self, pooled, timeout=None):
+        """等待并锁定指定会话（用于绑定了句柄的上传会话、缓存句柄等）"""
+        timeout = self.checkout_timeout if timeout is None else timeout
+        if pooled.broken or not pooled.lock.acquire(timeout=timeout):
+            raise ConnectionError("指定的SMB会话不可用")
+        if pooled.broken:
+            pooled.lock.release()
+            raise ConnectionError("指定的SMB会话不可用")
+        return pooled
+
+    def try_acquire(self, pooled):
+        """尝试立即锁定指定会话，会话忙时返回False"""
+        if pooled.broken or not pooled.lock.acquire(blocking=False):
+            return False
+        return True
+
+    def checkin(self, pooled, discard=False):
+        """归还会话；discard为True时关闭并移出连接池"""
+        pooled.last_used = time.monotonic()
+        if discard:
+            pooled.broken = True
+        with self._condition:
+            if pooled.bulk:
+                pooled.bulk = False
+                self._bulk_active -= 1
+            if pooled.broken and pooled in self._connections:
+                self._connections.remove(pooled)
+                logger.warning(f"丢弃失效会话，当前会话数: {len(self._connections)}")
+            pooled.lock.release()
+            # 等待者中可能既有批量也有交互借出，全部唤醒各自重新判断
+            self._condition.notify_all()
+        if pooled.broken:
+            pooled.close()
+
+    @contextmanager
+    def connection(self, pooled=None, timeout=None, bulk=False):
+        """借出会话（或锁定指定会话）的上下文管理器，连接级错误时自动丢弃"""
+        if pooled is None:
+            pooled = self.checkout(timeout, bulk)
+        else:
+            self.acquire(pooled, timeout)
+        discard = False
+        try:
+            yield pooled
+        except Exception as e:
+            discard = is_connection_error(e)
+            raise
+        finally:
+            self.checkin(pooled, discard=discard)
+
+    def _check_health(self, pooled):
+        """空闲时间较长的会话在借出前做一次echo检查"""
+        if time.monotonic() - pooled.last_used < self.health_check_interval:
+            return True
+        try:
+            pooled.smb.getSMBServer().echo()
+            return True
+        except Exception as e:
+            logger.warning(f"会话健康检查失败: {e}")
+            return False
+
+    def _evict_idle_locked(self):
+        """移出空闲超时的会话，至少保留min_size个（调用方需持有条件锁，并在释放锁后关闭返回的会话）"""
+        now = time.monotonic()
+        evicted = []
+        for pooled in list(self._connections):
+            if len(self._connections) <= self.min_size:
+                break
+            if now - pooled.last_used <= self.idle_timeout:
+                continue
+            if not pooled.lock.acquire(blocking=False):
+                continue
+            self._connections.remove(pooled)
+            pooled.broken = True
+            pooled.lock.release()
+            logger.info(f"回收空闲会话，当前会话数: {len(self._connections)}")
+            evicted.append(pooled)
+        return evicted
+
+    def close(self):
+        """关闭连接池中的全部会话"""
+        with self._condition:
+            self._closed = True
+            connections = list(self._connections)
+            self._connections.clear()
+            self._condition.notify_all()
+        for pooled in connections:
+            pooled.broken = True
+            pooled.close()
@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+本地流式HTTP服务
+仅监听 127.0.0.1，凭会话令牌把远程文件直接以HTTP流的形式提供给前端，
+图片、文本、音视频可通过URL加载（支持Range/拖动进度），无需Base64且内存占用恒定；
+同时提供目录列表中的图片缩略图
+"""
+
+import hmac
+import logging
+import mimetypes
+import secrets
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from urllib.parse import parse_qs, quote, urlencode, urlsplit
+
+logger = logging.getLogger(__name__)
+
+# 浏览器不认识的常见文本扩展名按纯文本返回，便于直接预览
+TEXT_EXTENSIONS = (
+    ".log", ".ini", ".cfg", ".conf", ".md", ".yml", ".yaml", ".csv", ".bat", ".ps1", ".sh",
+)
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+def parse_range(header, file_size):
+    """
+    解析单个 Range 请求头
+
+    Args:
+        header (str): Range 请求头，如 "bytes=0-1023"、"bytes=1024-"、"bytes=-500"
+        file_size (int): 文件大小
+
+    Returns:
+        tuple: (start, end) 闭区间；无 Range、格式不支持或语法无效（如结束位置小于开始位置）时返回None，
+            按RFC 7233忽略该请求头；范围无法满足（包括空文件）时抛出 ValueError
+    """
+    if not header or not header.startswith("bytes="):
+        return None
+    spec = header[len("bytes="):].strip()
+    if "," in spec:
+        # 多段范围较少使用，按整个文件返回
+        return None
+    start_text, _, end_text = spec.partition("-")
+    try:
+        if not start_text:
+            suffix = int(end_text)
+            start, end = file_size - suffix, file_size - 1
+        else:
+            start = int(start_text)
+            end = int(end_text) if end_text else file_size - 1
+            if end_text and end < start:
+                return None
+    except ValueError:
+        return None
+    if not start_text:
+        # 后缀范围：长度为0或文件为空时无法满足
+        if suffix <= 0 or file_size == 0:
+            raise ValueError("无效的范围")
+        return max(start, 0), end
+    if start >= file_size:
+        raise ValueError("无效的范围")
+    return start, min(end, file_size - 1)
+
+
+def guess_content_type(file_path):
+    name = file_path.replace("\\", "/").rsplit("/", 1)[-1]
+    content_type, _ = mimetypes.guess_type(name)
+    if content_type is None and name.lower().endswith(TEXT_EXTENSIONS):
+        content_type = "text/plain"
+    # 文本不声明字符集，交给前端按内容检测编码
+    return content_type or "application/octet-stream"
+
+
+class StreamServer:
+    """
+    本地流式HTTP服务
+
+    Args:
+        handler_getter (callable): 返回当前 SMBHandler 的函数，未连接时返回None
+        thumbnails (ThumbnailService): 可选的缩略图服务
+        host (str): 监听地址，只应为回环地址
+        port (int): 监听端口，0 表示由系统分配
+    """
+
+    def __init__(self, handler_getter, thumbnails=None, host="127.0.0.1", port=0):
+        self.handler_getter = handler_getter
+        self.thumbnails = thumbnails
+        self.host = host
+        self.port = port
+        self.token = secrets.token_urlsafe(24)
+        self._server = None
+        self._thread = None
+
+    @property
+    def running(self):
+        return self._server is not None
+
+    def start(self):
+        if self._server is not None:
+            return
+        self._server = _ThreadingHTTPServer((self.host, self.port), self._make_request_handler())
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, name="smb-stream-server", daemon=True
+        )
+        self._thread.start()
+        logger.info(f"本地流式服务已启动: http://{self.host}:{self.port}/")
+
+    def stop(self):
+        if self._server is None:
+            return
+        self._server.shutdown()
+        self._server.server_close()
+        self._server = None
+        self._thread = None
+        logger.info("本地流式服务已停止")
+
+    def rotate_token(self):
+        """更换令牌（重新连接时调用），之前发出的URL随之失效"""
+        self.token = secrets.token_urlsafe(24)
+
+    def url_for(self, share_name, file_path, download=False):
+        """生成访问远程文件的URL"""
+        query = {"share": share_name, "path": file_path, "token": self.token}
+        if download:
+            query["download"] = "1"
+        return f"http://{self.host}:{self.port}/file?{urlencode(query)}"
+
+    def thumbnail_url(self, key):
+        """生成访问缩略图的URL，key 由 thumbnail_key 生成"""
+        query = {"key": key, "token": self.token}
+        return f"http://{self.host}:{self.port}/thumbnail?{urlencode(query)}"
+
+    def check_token(self, token):
+        return bool(token) and hmac.compare_digest(token.encode(), self.token.encode())
+
+    def _make_request_handler(self):
+        stream_server = self
+
+        class StreamRequestHandler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                self._serve(send_body=True)
+
+            def do_HEAD(self):
+                self._serve(send_body=False)
+
+            def do_OPTIONS(self):
+                # 前端页面不是同源，带 Range 头的 fetch 会先发预检请求
+                self.send_response(204)
+                self._send_cors_headers()
+                self.send_header("Access-Control-Allow-Methods", "GET, HEAD, OPTIONS")
+                self.send_header("Access-Control-Allow-Headers", "Range")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def _send_cors_headers(self):
+                # 访问控制依靠URL中的令牌，因此允许任意来源读取响应
+                self.send_header("Access-Control-Allow-Origin", "*")
+                self.send_header(
+                    "Access-Control-Expose-Headers", "Content-Range, Content-Length, Accept-Ranges"
+                )
+
+            def log_message(self, format, *args):
+                logger.debug(f"[流式服务] {self.address_string()} {format % args}")
+
+            def _serve(self, send_body):
+                url = urlsplit(self.path)
+                if url.path not in ("/file", "/thumbnail"):
+                    return self._error(404, "Not Found")
+
+                # 只接受直接访问回环地址，防止DNS重绑定的网页借用令牌
+                allowed_hosts = (
+                    f"{stream_server.host}:{stream_server.port}",
+                    f"localhost:{stream_server.port}",
+                )
+                if self.headers.get("Host") not in allowed_hosts:
+                    return self._error(403, "Forbidden")
+
+                query = parse_qs(url.query)
+                token = query.get("token", [""])[0]
+                if not stream_server.check_token(token):
+                    return self._error(403, "Forbidden")
+
+                if url.path == "/thumbnail":
+                    return self._serve_thumbnail(query.get("key", [""])[0], send_body)
+
+                share_name = query.get("share", [""])[0]
+                file_path = query.get("path", [""])[0]
+                download = query.get("download", [""])[0] == "1"
+                handler = stream_server.handler_getter()
+                if not share_name or not file_path:
+                    return self._error(400, "Bad Request")
+                if handler is None:
+                    return self._error(503, "Not Connected")
+
+                info = handler.get_file_size(share_name, file_path)
+                if not info.get("success"):
+                    logger.warning(f"[流式服务] {info.get('error')}")
+                    return self._error(404, "Not Found")
+                file_size = info["size"]
+
+                try:
+                    byte_range = parse_range(self.headers.get("Range"), file_size)
+                except ValueError:
+                    self.send_response(416)
+                    self._send_cors_headers()
+                    self.send_header("Content-Range", f"bytes */{file_size}")
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+
+                if byte_range is None:
+                    start, end = 0, file_size - 1
+                    self.send_response(200)
+                else:
+                    start, end = byte_range
+                    self.send_response(206)
+                    self.send_header("Content-Range", f"bytes {start}-{end}/{file_size}")
+                length = max(end - start + 1, 0)
+
+                self._send_cors_headers()
+                self.send_header("Content-Type", guess_content_type(file_path))
+                self.send_header("Content-Length", str(length))
+                self.send_header("Accept-Ranges", "bytes")
+                self.send_header("Cache-Control", "no-store")
+                if download:
+                    file_name = file_path.replace("\\", "/").rsplit("/", 1)[-1]
+                    self.send_header(
+                        "Content-Disposition", f"attachment; filename*=UTF-8''{quote(file_name)}"
+                    )
+                self.end_headers()
+                if not send_body or length == 0:
+                    return
+
+                try:
+                    sent = handler.stream_file_range(
+                        share_name, file_path, start, length, self.wfile.write
+                    )
+                    if sent < length:
+                        # 文件在传输期间被截短，断开连接让浏览器知道内容不完整
+                        self.close_connection = True
+                except (BrokenPipeError, ConnectionResetError, ConnectionAbortedError):
+                    # 浏览器拖动进度或关闭预览时会主动断开
+                    logger.debug(f"[流式服务] 客户端已断开: {file_path}")
+                except Exception as e:
+                    # 响应头已发出，只能断开连接让浏览器感知错误
+                    logger.error(f"[流式服务] 读取文件失败: {file_path}: {e}")
+                    self.close_connection = True
+
+            def _serve_thumbnail(self, key, send_body):
+                service = stream_server.thumbnails
+                if service is None or not key:
+                    return self._error(404, "Not Found")
+                # 缩略图尚在生成时阻塞等待，<img> 加载完成即显示
+                data = service.wait(key)
+                if data is None:
+                    return self._error(404, "Not Found")
+                self.send_response(200)
+                self._send_cors_headers()
+                self.send_header("Content-Type", "image/jpeg")
+                self.send_header("Content-Length", str(len(data)))
+                # 键包含文件大小和修改时间，内容不会变化
+                self.send_header("Cache-Control", "private, max-age=86400")
+                self.end_headers()
+                if send_body:
+                    self.wfile.write(data)
+
+            def _error(self, status, message):
+                body = message.encode("utf-8")
+                self.send_response(status)
+                self._send_cors_headers()
+                self.send_header("Content-Type", "text/plain; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                if self.command != "HEAD":
+                    self.wfile.write(body)
+
+        return StreamRequestHandler
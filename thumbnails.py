@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+图片缩略图
+为当前页的图片在有界线程池中生成缩略图并缓存到磁盘（以 路径+大小+修改时间 为键）；
+JPEG 优先使用文件开头EXIF中内嵌的缩略图，只读取开头一小段；切换目录时取消尚未开始的任务
+"""
+
+import hashlib
+import io
+import logging
+import os
+import struct
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow 为可选依赖，缺失时不生成缩略图
+    Image = None
+    ImageOps = None
+
+logger = logging.getLogger(__name__)
+
+THUMBNAIL_SUFFIX = ".jpg"
+
+
+def thumbnail_key(scope, share_name, file_path, size, mtime):
+    identity = "|".join(
+        [scope or "", share_name.lower(), file_path.lower(), str(size), str(mtime)]
+    )
+    return hashlib.sha1(identity.encode("utf-8")).hexdigest()
+
+
+def extract_exif_thumbnail(head):
+    """
+    从JPEG开头的数据中取出EXIF内嵌缩略图（IFD1 中的 JPEGInterchangeFormat）
+
+    Args:
+        head (bytes): 文件开头的数据
+
+    Returns:
+        bytes: 内嵌缩略图，不存在或不完整时返回None
+    """
+    if not head.startswith(b"\xff\xd8"):
+        return None
+    position = 2
+    while position + 4 <= len(head):
+        if head[position] != 0xFF:
+            return None
+        marker = head[position + 1]
+        segment_length = struct.unpack(">H", head[position + 2:position + 4])[0]
+        if marker == 0xE1 and head[position + 4:position + 10] == b"Exif\x00\x00":
+            return _thumbnail_from_tiff(head[position + 10:position + 2 + segment_length])
+        if marker == 0xDA:
+            # 已到图像数据，前面没有EXIF
+            return None
+        position += 2 + segment_length
+    return None
+
+
+def _thumbnail_from_tiff(tiff):
+    if len(tiff) < 8:
+        return None
+    byte_order = {b"II": "<", b"MM": ">"}.get(tiff[:2])
+    if byte_order is None:
+        return None
+    try:
+        ifd0 = struct.unpack(byte_order + "I", tiff[4:8])[0]
+        count = struct.unpack(byte_order + "H", tiff[ifd0:ifd0 + 2])[0]
+        next_offset = ifd0 + 2 + count * 12
+        ifd1 = struct.unpack(byte_order + "I", tiff[next_offset:next_offset + 4])[0]
+        if not ifd1:
+            return None
+        count = struct.unpack(byte_order + "H", tiff[ifd1:ifd1 + 2])[0]
+        offset = length = None
+        for i in range(count):
+            entry = ifd1 + 2 + i * 12
+            tag = struct.unpack(byte_order + "H", tiff[entry:entry + 2])[0]
+            value = struct.unpack(byte_order + "I", tiff[entry + 8:entry + 12])[0]
+            if tag == 0x0201:
+                offset = value
+            elif tag == 0x0202:
+                length = value
+    except struct.error:
+        return None
+    if not offset or not length or offset + length > len(tiff):
+        return None
+    return tiff[offset:offset + length]
+
+
+class ThumbnailService:
+    """
+    缩略图生成与缓存
+
+    Args:
+        reader (callable): reader(share_name, file_path, offset, length) 读取远程文件的一段，返回bytes
+        cache_dir (str): 缩略图缓存目录
+        size (int): 缩略图最长边像素
+        workers (int): 同时生成的缩略图数
+        max_source_size (int): 没有内嵌缩略图时允许完整读取的最大图片大小
+        head_size (int): 查找EXIF内嵌缩略图时读取的开头字节数
+        max_cache_bytes (int): 磁盘缓存的总字节数上限，启动时按最近访问时间清理
+    """
+
+    def __init__(
+        self,
+        reader,
+        cache_dir,
+        size=96,
+        workers=2,
+        max_source_size=16 * 1024 * 1024,
+        head_size=128 * 1024,
+        max_cache_bytes=100 * 1024 * 1024,
+    ):
+        self.reader = reader
+        self.cache_dir = str(cache_dir)
+        self.size = size
+        self.max_source_size = max_source_size
+        self.head_size = head_size
+        self.max_cache_bytes = max_cache_bytes
+        self._generation = 0
+        self._pending = {}  # key -> (generation, Event)
+        self._failed = set()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(
+            max_workers=max(int(workers), 1), thread_name_prefix="smb-thumbnail"
+        )
+        if self.available:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            self._trim_cache()
+
+    @property
+    def available(self):
+        return Image is not None
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key + THUMBNAIL_SUFFIX)
+
+    def _trim_cache(self):
+        try:
+            entries = []
+            with os.scandir(self.cache_dir) as it:
+                for entry in it:
+                    if entry.is_file() and entry.name.endswith(THUMBNAIL_SUFFIX):
+                        stat = entry.stat()
+                        entries.append((stat.st_atime, entry.path, stat.st_size))
+        except OSError as e:
+            logger.debug(f"扫描缩略图缓存失败: {e}")
+            return
+        total = sum(size for _, _, size in entries)
+        for _, path, size in sorted(entries):
+            if total <= self.max_cache_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+
+    def request(self, items):
+        """
+        取消之前的请求并为新的一批图片排队生成缩略图
+
+        Args:
+            items (list): [(key, share_name, file_path, size)]，key 由 thumbnail_key 生成
+
+        Returns:
+            int: 新排队的任务数（已缓存的不计入）
+        """
+        with self._lock:
+            self._generation += 1
+            generation = self._generation
+            self._failed.clear()
+
+        queued = 0
+        for key, share_name, file_path, size in items:
+            if os.path.exists(self._path(key)):
+                continue
+            with self._lock:
+                entry = self._pending.get(key)
+                if entry is not None and entry[0] == generation:
+                    continue
+                event = threading.Event()
+                self._pending[key] = (generation, event)
+            self._executor.submit(
+                self._generate, generation, key, share_name, file_path, size, event
+            )
+            queued += 1
+        return queued
+
+    def cancel(self):
+        """取消尚未开始的任务（正在生成的会完成并写入缓存）"""
+        with self._lock:
+            self._generation += 1
+
+    def wait(self, key, timeout=30):
+        """等待缩略图生成，返回JPEG数据；失败、被取消或超时返回None"""
+        path = self._path(key)
+        if not os.path.exists(path):
+            with self._lock:
+                entry = self._pending.get(key)
+                if key in self._failed:
+                    return None
+            if entry is None or not entry[1].wait(timeout):
+                return None
+        try:
+            with open(path, "rb") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def _generate(self, generation, key, share_name, file_path, size, event):
+        try:
+            if generation != self._generation:
+                return
+            data = self._make_thumbnail(share_name, file_path, size)
+            if data is None:
+                with self._lock:
+                    self._failed.add(key)
+                return
+            path = self._path(key)
+            temp_path = f"{path}.tmp"
+            with open(temp_path, "wb") as f:
+                f.write(data)
+            os.replace(temp_path, path)
+        except Exception as e:
+            logger.debug(f"生成缩略图失败 {share_name}\\{file_path}: {e}")
+            with self._lock:
+                self._failed.add(key)
+        finally:
+            with self._lock:
+                if self._pending.get(key, (None, None))[1] is event:
+                    del self._pending[key]
+            event.set()
+
+    def _make_thumbnail(self, share_name, file_path, size):
+        head = self.reader(share_name, file_path, 0, min(size, self.head_size))
+        source = None
+        if len(head) < size:
+            source = extract_exif_thumbnail(head)
+            if source is None:
+                if size > self.max_source_size:
+                    return None
+                source = head + self.reader(share_name, file_path, len(head), size - len(head))
+        else:
+            source = head
+
+        with Image.open(io.BytesIO(source)) as image:
+            # JPEG 解码时直接按缩小比例解码，减少CPU和内存
+            image.draft("RGB", (self.size, self.size))
+            image = ImageOps.exif_transpose(image)
+            image.thumbnail((self.size, self.size))
+            if image.mode not in ("RGB", "L"):
+                image = image.convert("RGB")
+            output = io.BytesIO()
+            image.save(output, "JPEG", quality=80)
+        return output.getvalue()
+
+    def shutdown(self):
+        self.cancel()
+        self._executor.shutdown(wait=False)
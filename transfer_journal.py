@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+断点续传日志
+记录未完成传输的文件标识（大小、修改时间）和已确认的进度，以JSON文件保存，应用重启后仍可续传
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+DOWNLOAD_SUFFIX = ".smbresume"
+
+
+def download_journal_path(local_path):
+    """下载日志与本地部分文件放在一起（sidecar）"""
+    return f"{local_path}{DOWNLOAD_SUFFIX}"
+
+
+def upload_journal_path(journal_dir, scope, share_name, remote_path, local_path):
+    """上传日志放在应用目录下，避免在用户的源目录中留下文件"""
+    key = "|".join(
+        [scope or "", share_name.lower(), remote_path.lower(), os.path.abspath(local_path)]
+    )
+    digest = hashlib.sha1(key.encode("utf-8")).hexdigest()
+    return os.path.join(journal_dir, f"upload-{digest}.json")
+
+
+class TransferJournal:
+    """
+    一个传输任务的续传日志
+
+    Args:
+        path (str): 日志文件路径
+        identity (dict): 文件标识，续传前必须与记录的完全一致
+        save_interval (float): 进度更新时两次落盘之间的最短秒数
+    """
+
+    def __init__(self, path, identity, save_interval=1.0):
+        self.path = path
+        self.identity = dict(identity)
+        self.save_interval = save_interval
+        self.progress = {}
+        self._lock = threading.Lock()
+        self._last_save = 0
+
+    @classmethod
+    def open(cls, path, identity, save_interval=1.0):
+        """读取已有日志；不存在、损坏或文件标识不一致时返回空进度的新日志"""
+        journal = cls(path, identity, save_interval)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return journal
+        except (OSError, ValueError) as e:
+            logger.warning(f"续传日志损坏，重新开始: {path}: {e}")
+            return journal
+
+        if data.get("identity") == journal.identity:
+            journal.progress = data.get("progress") or {}
+        else:
+            logger.info(f"文件已变化，忽略旧的续传日志: {path}")
+        return journal
+
+    def get(self, key, default=None):
+        with self._lock:
+            return self.progress.get(key, default)
+
+    def update(self, key, value, force=False):
+        """更新进度，距上次落盘超过 save_interval 或 force 时写入磁盘"""
+        with self._lock:
+            self.progress[key] = value
+            if not force and time.monotonic() - self._last_save < self.save_interval:
+                return
+            self._save_locked()
+
+    def save(self):
+        with self._lock:
+            self._save_locked()
+
+    def _save_locked(self):
+        directory = os.path.dirname(self.path)
+        try:
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            temp_path = f"{self.path}.tmp"
+            with open(temp_path, "w", encoding="utf-8") as f:
+                json.dump(
+                    {"identity": self.identity, "progress": self.progress, "updated": time.time()},
+                    f,
+                    ensure_ascii=False,
+                )
+            os.replace(temp_path, self.path)
+            self._last_save = time.monotonic()
+        except OSError as e:
+            logger.warning(f"写入续传日志失败: {e}")
+
+    def delete(self):
+        with self._lock:
+            self.progress = {}
+            try:
+                os.remove(self.path)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.warning(f"删除续传日志失败: {e}")
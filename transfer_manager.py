@@ -0,0 +1,458 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+后台传输调度器
+在工作线程池中排队执行上传/下载任务，提供字节级进度、速率、剩余时间以及暂停/取消
+"""
+
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_PAUSED = "paused"
+JOB_COMPLETED = "completed"
+JOB_FAILED = "failed"
+JOB_CANCELLED = "cancelled"
+
+FINISHED_STATES = (JOB_COMPLETED, JOB_FAILED, JOB_CANCELLED)
+
+
+class TransferCancelled(Exception):
+    """传输被用户取消"""
+
+
+class TransferPaused(Exception):
+    """传输因暂停在块边界中断（会话已归还，大文件的续传日志已保存）"""
+
+
+class TransferJob:
+    """一个上传或下载任务"""
+
+    # 计算速率时使用的时间窗口（秒）
+    RATE_WINDOW = 5
+
+    def __init__(self, kind, share_name, remote_path, local_path, total_bytes=None):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.share_name = share_name
+        self.remote_path = remote_path
+        self.local_path = local_path
+        self.total_bytes = total_bytes
+        self.options = {}  # 任务类型相关的参数（如同步是否删除本地多余文件）
+        self.transferred = 0
+        self.files_total = None  # 目录任务：已发现的文件数
+        self.files_done = 0
+        self.files_failed = 0
+        self.resumed_bytes = 0
+        self.attempts = 0
+        self.pauses = 0  # 暂停次数，目录任务据此判断文件是否因暂停而中断
+        self.interrupted = False  # 因暂停而结束运行，恢复时需要重新排队
+        self.state = JOB_QUEUED
+        self.error = None
+        self.result = None
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self._cancel_event = threading.Event()
+        self._resume_event = threading.Event()
+        self._resume_event.set()
+        self._samples = deque()
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self):
+        return self._cancel_event.is_set()
+
+    @property
+    def pause_requested(self):
+        return not self._resume_event.is_set()
+
+    def report(self, nbytes):
+        """
+        传输过程中的进度回调，每写入/读取一块数据调用一次
+
+        调用时通常持有借出的会话，因此不在这里等待：暂停时抛出 TransferPaused，
+        在块边界中断传输并归还会话，恢复后从续传点重新开始；取消时抛出 TransferCancelled
+        """
+        if self._cancel_event.is_set():
+            raise TransferCancelled("传输已取消")
+        if not self._resume_event.is_set():
+            raise TransferPaused("传输已暂停")
+
+        now = time.monotonic()
+        with self._lock:
+            self.transferred += nbytes
+            self._samples.append((now, self.transferred))
+            while self._samples and now - self._samples[0][0] > self.RATE_WINDOW:
+                self._samples.popleft()
+
+    def wait_if_paused(self, pauses=None):
+        """
+        暂停时阻塞直到恢复或取消，只在未持有会话的位置调用（如目录任务的两个文件之间）
+
+        Args:
+            pauses (int): 上一次调用返回的暂停次数
+
+        Returns:
+            tuple: (当前暂停次数, 自 pauses 以来是否暂停过)
+        """
+        with self._lock:
+            paused = self.pause_requested or (pauses is not None and pauses != self.pauses)
+        self._resume_event.wait()
+        with self._lock:
+            return self.pauses, paused
+
+    def resumed(self, nbytes):
+        """续传时直接计入已完成的字节数（不参与速率计算）"""
+        with self._lock:
+            self.transferred += nbytes
+            self.resumed_bytes += nbytes
+            self._samples.clear()
+
+    def discover(self, files, nbytes):
+        """目录任务遍历时累加新发现的文件数和字节数"""
+        with self._lock:
+            self.files_total = (self.files_total or 0) + files
+            self.total_bytes = (self.total_bytes or 0) + nbytes
+
+    def file_finished(self, path, success):
+        """目录任务中单个文件结束"""
+        with self._lock:
+            if success:
+                self.files_done += 1
+            else:
+                self.files_failed += 1
+
+    def throughput(self):
+        """最近时间窗口内的平均速率（字节/秒）"""
+        with self._lock:
+            if self.state != JOB_RUNNING or len(self._samples) < 2:
+                return 0
+            (t0, b0), (t1, b1) = self._samples[0], self._samples[-1]
+        if t1 <= t0:
+            return 0
+        return (b1 - b0) / (t1 - t0)
+
+    def to_dict(self):
+        rate = self.throughput()
+        eta = None
+        if rate > 0 and self.total_bytes:
+            eta = max(self.total_bytes - self.transferred, 0) / rate
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "share_name": self.share_name,
+            "remote_path": self.remote_path,
+            "local_path": self.local_path,
+            "name": os.path.basename(self.remote_path.replace("\\", "/").rstrip("/"))
+            or os.path.basename(self.local_path or ""),
+            "state": self.state,
+            "total_bytes": self.total_bytes,
+            "transferred": self.transferred,
+            "progress": (
+                min(self.transferred / self.total_bytes, 1.0)
+                if self.total_bytes
+                else (1.0 if self.state == JOB_COMPLETED else 0.0)
+            ),
+            "throughput": rate,
+            "eta": eta,
+            "files_total": self.files_total,
+            "files_done": self.files_done,
+            "files_failed": self.files_failed,
+            "resumed_bytes": self.resumed_bytes,
+            "attempts": self.attempts,
+            "error": self.error,
+            "created": self.created,
+            "started": self.started,
+            "finished": self.finished,
+        }
+
+
+class TransferManager:
+    """
+    传输任务调度器
+
+    Args:
+        smb_handler (SMBHandler): 执行实际传输的SMB处理器
+        max_workers (int): 同时进行的传输数量上限
+    """
+
+    def __init__(self, smb_handler, max_workers=3):
+        self.smb_handler = smb_handler
+        self.max_workers = max(int(max_workers), 1)
+        self.jobs = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.max_workers, thread_name_prefix="smb-transfer"
+        )
+
+    def submit_download(self, share_name, remote_path, local_path, total_bytes=None):
+        """排队一个下载任务，返回任务ID"""
+        job = TransferJob("download", share_name, remote_path, local_path, total_bytes)
+        return self._submit(job)
+
+    def submit_directory_download(self, share_name, remote_path, local_path):
+        """排队一个递归下载目录的任务，返回任务ID"""
+        job = TransferJob("download_dir", share_name, remote_path, local_path)
+        return self._submit(job)
+
+    def submit_directory_upload(self, share_name, remote_path, local_path):
+        """排队一个上传整个本地目录的任务，返回任务ID"""
+        job = TransferJob("upload_dir", share_name, remote_path, local_path)
+        return self._submit(job)
+
+    def submit_sync(self, share_name, remote_path, local_path, delete=False, verify_content=False):
+        """排队一个将远程目录同步到本地目录的任务，返回任务ID"""
+        job = TransferJob("sync_dir", share_name, remote_path, local_path)
+        job.options = {"delete": delete, "verify_content": verify_content}
+        return self._submit(job)
+
+    def submit_upload(self, share_name, remote_path, local_path):
+        """排队一个从本地文件上传的任务，返回任务ID"""
+        total_bytes = os.path.getsize(local_path)
+        job = TransferJob("upload", share_name, remote_path, local_path, total_bytes)
+        return self._submit(job)
+
+    def _submit(self, job):
+        with self._lock:
+            self.jobs[job.id] = job
+        logger.info(
+            f"传输任务入队: {job.id} {job.kind} {job.share_name}\\{job.remote_path}"
+        )
+        self._executor.submit(self._run, job)
+        return job.id
+
+    def _run(self, job):
+        if job.cancelled:
+            return
+        with job._lock:
+            if job.pause_requested and job.kind in ("download", "upload"):
+                # 排队期间被暂停：不占用工作线程和会话，恢复时重新排队
+                job.interrupted = True
+                return
+            pauses = job.pauses
+
+        job.state = JOB_RUNNING if job._resume_event.is_set() else JOB_PAUSED
+        job.started = time.time()
+        job.attempts += 1
+        logger.info(f"传输任务开始: {job.id}")
+        try:
+            if job.kind == "sync_dir":
+                result = self.smb_handler.sync_directory(
+                    job.share_name,
+                    job.remote_path,
+                    job.local_path,
+                    progress_callback=job.report,
+                    discover_callback=job.discover,
+                    file_callback=job.file_finished,
+                    is_cancelled=lambda: job.cancelled,
+                    pause_gate=job.wait_if_paused,
+                    **job.options,
+                )
+            elif job.kind in ("download_dir", "upload_dir"):
+                transfer_directory = (
+                    self.smb_handler.download_directory
+                    if job.kind == "download_dir"
+                    else self.smb_handler.upload_directory
+                )
+                result = transfer_directory(
+                    job.share_name,
+                    job.remote_path,
+                    job.local_path,
+                    progress_callback=job.report,
+                    discover_callback=job.discover,
+                    file_callback=job.file_finished,
+                    is_cancelled=lambda: job.cancelled,
+                    pause_gate=job.wait_if_paused,
+                )
+            elif job.kind == "download":
+                if job.total_bytes is None:
+                    info = self.smb_handler.get_file_info(
+                        job.share_name, job.remote_path
+                    )
+                    if info.get("success"):
+                        job.total_bytes = info.get("size")
+                result = self.smb_handler.download_file(
+                    job.share_name,
+                    job.remote_path,
+                    job.local_path,
+                    progress_callback=job.report,
+                    file_size=job.total_bytes,
+                    resume_callback=job.resumed,
+                )
+            else:
+                result = self.smb_handler.upload_local_file(
+                    job.share_name,
+                    job.remote_path,
+                    job.local_path,
+                    progress_callback=job.report,
+                    resume_callback=job.resumed,
+                )
+        except Exception as e:
+            result = {"success": False, "error": str(e)}
+
+        job.finished = time.time()
+        job.result = result
+        if job.cancelled:
+            job.state = JOB_CANCELLED
+            self._cleanup_cancelled(job)
+        elif result.get("success"):
+            job.state = JOB_COMPLETED
+            if job.total_bytes is None:
+                job.total_bytes = job.transferred
+        elif job.kind in ("download", "upload") and self._interrupted_by_pause(job, pauses):
+            return
+        else:
+            job.state = JOB_FAILED
+            job.error = result.get("error")
+        logger.info(f"传输任务结束: {job.id} -> {job.state}")
+
+    def _interrupted_by_pause(self, job, pauses):
+        """
+        单文件任务运行期间被暂停时，传输已在块边界中断并归还会话：
+        仍处于暂停则等待恢复时重新排队，已恢复则立即重新排队（从续传日志记录的位置继续）
+        """
+        with job._lock:
+            if job.pauses == pauses:
+                return False
+            still_paused = job.pause_requested
+            job.interrupted = still_paused
+        job.finished = None
+        if still_paused:
+            job.state = JOB_PAUSED
+            logger.info(f"传输任务已暂停: {job.id}")
+        else:
+            self._requeue(job)
+        return True
+
+    def _requeue(self, job):
+        """暂停后重新排队，进度从续传点重新累计"""
+        with job._lock:
+            job.transferred = 0
+            job.resumed_bytes = 0
+            job._samples.clear()
+        job.state = JOB_QUEUED
+        logger.info(f"恢复传输任务: {job.id}")
+        self._executor.submit(self._run, job)
+
+    def _cleanup_cancelled(self, job):
+        """取消的下载删除本地残留文件，取消的上传删除远程残留文件，并放弃续传"""
+        if not job.started:
+            return
+        if job.kind == "download" and job.local_path:
+            try:
+                if os.path.exists(job.local_path):
+                    os.remove(job.local_path)
+            except OSError as e:
+                logger.warning(f"删除未完成的下载文件失败: {e}")
+        elif job.kind == "upload":
+            self.smb_handler.delete_file(job.share_name, job.remote_path)
+        if job.kind in ("download", "upload"):
+            self.smb_handler.discard_resume_journal(
+                job.kind, job.share_name, job.remote_path, job.local_path
+            )
+
+    def get_job(self, job_id):
+        with self._lock:
+            return self.jobs.get(job_id)
+
+    def list_jobs(self, job_ids=None):
+        """返回任务状态列表，job_ids为None时返回全部"""
+        with self._lock:
+            if job_ids is None:
+                jobs = list(self.jobs.values())
+            else:
+                jobs = [self.jobs[job_id] for job_id in job_ids if job_id in self.jobs]
+        jobs.sort(key=lambda job: job.created)
+        return [job.to_dict() for job in jobs]
+
+    def pause(self, job_id):
+        """暂停任务：正在传输的文件在下一个块边界中断并归还会话"""
+        job = self.get_job(job_id)
+        if not job or job.state in FINISHED_STATES:
+            return False
+        with job._lock:
+            job.pauses += 1
+            job._resume_event.clear()
+        job.state = JOB_PAUSED
+        return True
+
+    def resume(self, job_id):
+        job = self.get_job(job_id)
+        if not job or job.state != JOB_PAUSED:
+            return False
+        with job._lock:
+            requeue = job.interrupted
+            job.interrupted = False
+            job._resume_event.set()
+        if requeue:
+            # 单文件任务已在暂停时结束运行，重新排队后从续传点继续
+            self._requeue(job)
+        else:
+            job.state = JOB_RUNNING if job.started else JOB_QUEUED
+        return True
+
+    def retry(self, job_id):
+        """重新排队失败的任务，大文件会从上次中断处续传"""
+        job = self.get_job(job_id)
+        if not job or job.state != JOB_FAILED:
+            return False
+        with job._lock:
+            job.transferred = 0
+            job.resumed_bytes = 0
+            job._samples.clear()
+        if job.kind.endswith("_dir"):
+            job.total_bytes = None
+            job.files_total = None
+            job.files_done = 0
+            job.files_failed = 0
+        job.error = None
+        job.result = None
+        job.finished = None
+        job.state = JOB_QUEUED
+        logger.info(f"重试传输任务: {job.id}")
+        self._executor.submit(self._run, job)
+        return True
+
+    def cancel(self, job_id):
+        job = self.get_job(job_id)
+        if not job or job.state in FINISHED_STATES:
+            return False
+        with job._lock:
+            job._cancel_event.set()
+            job._resume_event.set()
+            interrupted = job.interrupted
+            job.interrupted = False
+        if not job.started or interrupted:
+            # 未开始或已因暂停结束运行的任务没有工作线程处理取消，直接清理
+            job.state = JOB_CANCELLED
+            job.finished = time.time()
+            if interrupted:
+                self._cleanup_cancelled(job)
+        return True
+
+    def clear_finished(self):
+        """移除已结束的任务记录"""
+        with self._lock:
+            for job_id in [
+                job_id
+                for job_id, job in self.jobs.items()
+                if job.state in FINISHED_STATES
+            ]:
+                del self.jobs[job_id]
+
+    def shutdown(self):
+        """取消所有未完成任务并停止工作线程"""
+        with self._lock:
+            job_ids = list(self.jobs.keys())
+        for job_id in job_ids:
+            self.cancel(job_id)
+        self._executor.shutdown(wait=False)